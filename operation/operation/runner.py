@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+# Second shard of the sharding tests.
+SHARD_TEST_DATABASE = 'shard_test'
+
+
+class ShardTestRunner(DiscoverRunner):
+    """ Test runner adding a second database for the sharding tests, a copy
+    of default under its own test name. Deployments never see the alias."""
+    def setup_test_environment(self, **kwargs):
+        default = settings.DATABASES['default']
+        settings.DATABASES[SHARD_TEST_DATABASE] = dict(default, TEST={'NAME': 'test_{}_shard'.format(default['NAME'])})
+        super().setup_test_environment(**kwargs)
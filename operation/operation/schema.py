@@ -0,0 +1,10 @@
+import graphene
+
+import transaction.schema
+
+
+class Query(transaction.schema.Query, graphene.ObjectType):
+    pass
+
+
+schema = graphene.Schema(query=Query)
@@ -1,5 +1,4 @@
 import environ
-import logging
 
 BASE_DIR = environ.Path(__file__) - 2
 
@@ -7,9 +6,25 @@ env = environ.Env()
 env_file = str(BASE_DIR('.env'))
 env.read_env(env_file)
 
-logging.basicConfig(handlers=[logging.FileHandler(env('LOG_FILE'), 'w', 'utf-8')],
-                    level=env('LOG_LEVEL'),
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# The log file is opened on the first record instead of at import.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s'},
+    },
+    'handlers': {
+        'file': {
+            'class': 'logging.FileHandler',
+            'filename': env('LOG_FILE'),
+            'mode': 'w',
+            'encoding': 'utf-8',
+            'delay': True,
+            'formatter': 'default',
+        },
+    },
+    'root': {'handlers': ['file'], 'level': env('LOG_LEVEL')},
+}
 
 SECRET_KEY = env('SECRET_KEY')
 
@@ -17,8 +32,14 @@ DEBUG = env.bool('DEBUG')
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS')
 
-DJANGO_APPS = [
-    'django.contrib.admin',
+# Lean boot leaves out the admin and the API docs for faster worker starts,
+# either can still be turned on on its own.
+LEAN_BOOT = env.bool('LEAN_BOOT', default=False)
+ADMIN_ENABLED = env.bool('ADMIN_ENABLED', default=not LEAN_BOOT)
+API_DOCS = env.bool('API_DOCS', default=not LEAN_BOOT)
+
+DJANGO_APPS = ['django.contrib.admin'] if ADMIN_ENABLED else []
+DJANGO_APPS += [
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -34,12 +55,38 @@ THIRD_PARTY_APPS = [
     'rest_framework',
     'storages',
     'corsheaders',
+    'graphene_django',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS + THIRD_PARTY_APPS
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'operation.util.renderers.FastJSONRenderer',
+        'operation.util.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'operation.util.parsers.FastJSONParser',
+        'operation.util.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'EXCEPTION_HANDLER': 'operation.util.remote.exception_handler',
+    'DEFAULT_THROTTLE_CLASSES': (
+        'operation.util.throttling.TokenBucketThrottle',
+    ),
+}
+
+GRAPHENE = {
+    'SCHEMA': 'operation.schema.schema',
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'operation.util.throttling.LoadSheddingMiddleware',
+    'operation.util.compression.CompressionMiddleware',
+    'operation.util.instrumentation.SlowQueryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,6 +97,91 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
 ]
 
+COMPRESSION = {
+    'GZIP_LEVEL': env.int('COMPRESSION_GZIP_LEVEL', default=6),
+    'ZSTD_LEVEL': env.int('COMPRESSION_ZSTD_LEVEL', default=3),
+    'MIN_SIZE': env.int('COMPRESSION_MIN_SIZE', default=1024),
+    'ENDPOINTS': [
+        {'PATH': r'^/transactions/dataset/$', 'MIN_SIZE': 0,
+         'GZIP_LEVEL': env.int('COMPRESSION_EXPORT_GZIP_LEVEL', default=6),
+         'ZSTD_LEVEL': env.int('COMPRESSION_EXPORT_ZSTD_LEVEL', default=3)},
+        {'PATH': r'^/transactions/info/$'},
+        {'PATH': r'^/transactions/$'},
+    ],
+}
+
+TRANSACTION_FEED = {
+    'MAX_BATCH': env.int('FEED_MAX_BATCH', default=1000),
+    'MAX_WAIT': env.int('FEED_MAX_WAIT', default=30),
+    'POLL_INTERVAL': env.float('FEED_POLL_INTERVAL', default=0.25),
+    'GAP_GRACE': env.int('FEED_GAP_GRACE', default=5),
+}
+
+TRANSACTION_ARCHIVE = {
+    'STORAGE': env('ARCHIVE_STORAGE', default='django.core.files.storage.FileSystemStorage'),
+    'OPTIONS': {'location': env('ARCHIVE_LOCATION', default=str(BASE_DIR('archive')))},
+    'PREFIX': 'transactions',
+    'COMPRESSION': env('ARCHIVE_COMPRESSION', default='snappy'),
+    'RETENTION_MONTHS': env.int('ARCHIVE_RETENTION_MONTHS', default=12),
+}
+
+TRANSACTION_HOT_CACHE = {
+    'ENABLED': env.bool('HOT_CACHE', default=False),
+    'DEPTH': env.int('HOT_CACHE_DEPTH', default=50),
+    'MAX_BYTES': env.int('HOT_CACHE_MAX_BYTES', default=16 * 1024 * 1024),
+    'SINGLE_PROCESS': env.bool('HOT_CACHE_SINGLE_PROCESS', default=False),
+}
+
+TRANSACTION_PARTITIONING = {
+    'ENABLED': env.bool('PARTITIONING', default=False),
+    'MONTHS_AHEAD': env.int('PARTITION_MONTHS_AHEAD', default=3),
+}
+
+TRANSACTION_POSTING = {
+    'ASYNC': env.bool('ASYNC_POSTING', default=False),
+    'RETRY_DELAY': env.int('POSTING_RETRY_DELAY', default=5),
+}
+
+REMOTE_SERVICES = {
+    'customer': {
+        'TIMEOUT': (env.float('REMOTE_CONNECT_TIMEOUT', default=1.0),
+                    env.float('REMOTE_READ_TIMEOUT', default=5.0)),
+        'FAILURE_THRESHOLD': env.int('REMOTE_FAILURE_THRESHOLD', default=5),
+        'RECOVERY_TIME': env.int('REMOTE_RECOVERY_TIME', default=30),
+        'MAX_CONCURRENCY': env.int('REMOTE_MAX_CONCURRENCY', default=20),
+    },
+}
+
+THROTTLING = {
+    'RATE': env.float('THROTTLE_RATE', default=10.0),
+    'BURST': env.int('THROTTLE_BURST', default=60),
+    'COSTS': {
+        'dataset': env.int('THROTTLE_EXPORT_COST', default=20),
+        'info': 5,
+        'graphql': 5,
+    },
+}
+
+LOAD_SHEDDING = {
+    'MAX_IN_FLIGHT': env.int('SHED_MAX_IN_FLIGHT', default=50),
+    'MAX_LATENCY_MS': env.int('SHED_MAX_LATENCY_MS', default=500),
+    'RETRY_AFTER': env.int('SHED_RETRY_AFTER', default=5),
+    'PATHS': [
+        r'^/transactions/dataset/$',
+        r'^/transactions/info/$',
+        r'^/graphql/$',
+    ],
+}
+
+SLOW_QUERIES = {
+    'ENABLED': env.bool('SLOW_QUERIES', default=False),
+    'THRESHOLD_MS': env.int('SLOW_QUERY_THRESHOLD_MS', default=200),
+    'EXPLAIN_SAMPLE': env.float('SLOW_QUERY_EXPLAIN_SAMPLE', default=0.1),
+}
+
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=24)
+IDEMPOTENCY_KEY_LEASE = env.int('IDEMPOTENCY_KEY_LEASE', default=60)
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
 
@@ -73,6 +205,21 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'operation.wsgi.application'
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Celery
+# Workers post queued transactions, the in-memory broker only serves a single process.
+
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='memory://')
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
@@ -84,6 +231,20 @@ DATABASES = {
     }
 }
 
+# Extra databases transactions are sharded over along with default, as database URLs.
+for index, url in enumerate(env.list('SHARD_DATABASE_URLS', default=[])):
+    DATABASES['shard_{}'.format(index + 1)] = env.db_url_config(url)
+
+DATABASE_ROUTERS = ['transaction.management.sharding.ShardRouter']
+
+# Adds the second database of the sharding tests.
+TEST_RUNNER = 'operation.runner.ShardTestRunner'
+
+TRANSACTION_SHARDING = {
+    'DATABASES': list(DATABASES),
+    'VIRTUAL_NODES': env.int('SHARD_VIRTUAL_NODES', default=100),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
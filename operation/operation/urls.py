@@ -13,12 +13,29 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
-from rest_framework.documentation import include_docs_urls
+from django.views.decorators.csrf import csrf_exempt
+
+from operation.util.boot import LazyView
+from transaction.views import TransactionGraphQLView
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('transactions/', include('transaction.urls')),
-    path('', include_docs_urls('Transaction Endpoints')),
+    path('graphql/', csrf_exempt(TransactionGraphQLView.as_view())),
 ]
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
+if settings.API_DOCS:
+    # Same routes as include_docs_urls, coreapi is only imported once the docs are requested.
+    docs_patterns = [
+        path('', LazyView('rest_framework.documentation.get_docs_view', title='Transaction Endpoints'),
+             name='docs-index'),
+        path('schema.js', LazyView('rest_framework.documentation.get_schemajs_view', title='Transaction Endpoints'),
+             name='schema-js'),
+    ]
+    urlpatterns.append(path('', include((docs_patterns, 'api-docs'), namespace='api-docs')))
@@ -2,16 +2,28 @@ import random
 import time
 
 START_TIME = 757512000
+RANDOM_BITS = 23
+RANDOM_MASK = (1 << RANDOM_BITS) - 1
 
 
 def make_id():
     t = int(time.time()) - START_TIME
-    u = random.SystemRandom().getrandbits(23)
-    id_ = (t << 23) | u
+    u = random.SystemRandom().getrandbits(RANDOM_BITS)
+    id_ = (t << RANDOM_BITS) | u
 
     return id_
 
 
 def reverse_id(id_):
-    t = id_ >> 23
+    t = id_ >> RANDOM_BITS
     return t + START_TIME
+
+
+def sample_threshold(fraction):
+    """ Upper bound of the random bits of ids that fall in a sample,
+    the random bits are uniform so the sample holds about fraction of all ids."""
+    return int(round(fraction * (1 << RANDOM_BITS)))
+
+
+def in_sample(id_, threshold):
+    return (int(id_) & RANDOM_MASK) < threshold
@@ -0,0 +1,12 @@
+from django.conf import settings
+
+# Backends keeping their entries in the memory of a single process.
+PROCESS_LOCAL = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_shared(alias='default'):
+    """ Whether every worker sees the entries of a cache."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL
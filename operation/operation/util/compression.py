@@ -0,0 +1,151 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULTS = {
+    'GZIP_LEVEL': 6,
+    'ZSTD_LEVEL': 3,
+    'MIN_SIZE': 1024,
+    'ENDPOINTS': [],
+}
+
+
+class GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class ZstdStream:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def get_options(path):
+    """ Get compression options for a request path.
+
+    Args:
+        path: str, Request path.
+
+    Returns:
+        dict, Compression options, None if the path is not configured for compression.
+    """
+    config = dict(DEFAULTS, **getattr(settings, 'COMPRESSION', {}))
+
+    for endpoint in config['ENDPOINTS']:
+        if re.match(endpoint['PATH'], path):
+            options = {key: config[key] for key in ('GZIP_LEVEL', 'ZSTD_LEVEL', 'MIN_SIZE')}
+            options.update({key: value for key, value in endpoint.items() if key != 'PATH'})
+            return options
+
+    return None
+
+
+def negotiate(accept_encoding):
+    """ Pick the best content coding the client accepts.
+
+    Args:
+        accept_encoding: str, Value of the Accept-Encoding header.
+
+    Returns:
+        str, 'zstd' or 'gzip', None if neither is acceptable.
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+
+    available = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+
+    return best
+
+
+def compress_sequence(sequence, compressor):
+    """ Compress an iterable of byte chunks as they are produced."""
+    for chunk in sequence:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """ Negotiated gzip/zstd compression for the endpoints listed in
+    settings.COMPRESSION, streaming responses are compressed chunk by chunk.
+    """
+    def process_response(self, request, response):
+        options = get_options(request.path_info)
+        if options is None:
+            return response
+
+        if response.has_header('Content-Encoding') or \
+                not 200 <= response.status_code < 300:
+            return response
+
+        if not response.streaming and len(response.content) < options['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        coding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        if coding == 'zstd':
+            compressor = ZstdStream(options['ZSTD_LEVEL'])
+        else:
+            compressor = GzipStream(options['GZIP_LEVEL'])
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content, compressor)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.flush()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        response['Content-Encoding'] = coding
+        return response
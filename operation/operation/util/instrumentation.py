@@ -0,0 +1,245 @@
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.db.transaction import atomic
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Queries taking longer are recorded.
+    'THRESHOLD_MS': 200,
+    # Share of recorded SELECT queries that are explained, under ANALYZE when they call no function.
+    'EXPLAIN_SAMPLE': 0.1,
+    # Seconds before the plan of a fingerprint is taken again.
+    'EXPLAIN_INTERVAL': 300,
+    # Fingerprints kept per process, the cheapest in total time go first.
+    'MAX_FINGERPRINTS': 500,
+}
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+CALL = re.compile(r'([A-Za-z_][\w$]*)\s*\(')
+
+# Words followed by a parenthesis that are not function calls, and functions
+# without side effects. Any other call, such as nextval or pg_advisory_lock,
+# would run again under EXPLAIN ANALYZE.
+SAFE_CALLS = {
+    'SELECT', 'FROM', 'JOIN', 'WHERE', 'AND', 'OR', 'NOT', 'IN', 'EXISTS', 'ANY', 'ALL',
+    'AS', 'ON', 'USING', 'OVER', 'BY', 'FILTER', 'VALUES', 'CAST',
+    'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'COALESCE', 'NULLIF', 'GREATEST', 'LEAST',
+    'LOWER', 'UPPER', 'ROW_NUMBER',
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'SLOW_QUERIES', {}))
+
+
+def normalize(sql):
+    """ Strip the values out of a statement, queries differing only in their
+    parameters or in the length of an IN list normalize the same way.
+
+    Args:
+        sql: str, SQL statement.
+
+    Returns:
+        str, Normalized statement.
+    """
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql.replace('%s', '?')).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode('utf-8')).hexdigest()[:16]
+
+
+def explainable(sql):
+    """ Whether a statement is a plain read, only those are explained."""
+    statement = sql.lstrip().upper()
+    return statement.startswith('SELECT') and ' FOR UPDATE' not in statement \
+        and ' FOR SHARE' not in statement
+
+
+def analyzable(sql):
+    """ Whether running a read again is harmless, it calls no function that may change state."""
+    return all(name.upper() in SAFE_CALLS for name in CALL.findall(STRING_LITERAL.sub('?', sql)))
+
+
+class SlowQueryLog:
+    """ Slow queries of this process aggregated by fingerprint."""
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration, label, alias):
+        key = fingerprint(sql)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= get_config()['MAX_FINGERPRINTS']:
+                    cheapest = min(self.entries, key=lambda item: self.entries[item]['total_ms'])
+                    del self.entries[cheapest]
+                entry = self.entries[key] = {
+                    'fingerprint': key, 'query': normalize(sql), 'database': alias, 'count': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'actions': {}, 'plan': None, 'explained_at': None,
+                }
+
+            entry['count'] += 1
+            entry['total_ms'] += duration
+            entry['max_ms'] = max(entry['max_ms'], duration)
+            entry['last_seen'] = time.time()
+            entry['actions'][label] = entry['actions'].get(label, 0) + 1
+
+        return entry
+
+    def needs_plan(self, entry, config):
+        explained_at = entry['explained_at']
+        if explained_at is not None and time.time() - explained_at < config['EXPLAIN_INTERVAL']:
+            return False
+        return random.random() < config['EXPLAIN_SAMPLE']
+
+    def set_plan(self, entry, plan):
+        with self._lock:
+            entry['plan'] = plan
+            entry['explained_at'] = time.time()
+
+    def top(self, count=20, order='total_ms'):
+        """ Worst fingerprints first.
+
+        Args:
+            count: int, Number of fingerprints returned.
+            order: str, 'total_ms', 'max_ms' or 'count'.
+
+        Returns:
+            list, Copies of the entries, mean_ms added.
+        """
+        with self._lock:
+            entries = [dict(entry, actions=dict(entry['actions'])) for entry in self.entries.values()]
+
+        for entry in entries:
+            entry['mean_ms'] = round(entry['total_ms'] / entry['count'], 3)
+
+        return sorted(entries, key=lambda entry: entry[order], reverse=True)[:count]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+slow_queries = SlowQueryLog()
+
+_local = threading.local()
+
+
+class QueryRecorder:
+    """ Execute wrapper timing the queries of a connection, labelled with
+    the viewset action that issued them."""
+    def __init__(self, label=None):
+        self.label = label
+        self.config = get_config()
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'explaining', False):
+            return execute(sql, params, many, context)
+
+        started = time.monotonic()
+        result = execute(sql, params, many, context)
+        duration = (time.monotonic() - started) * 1000
+
+        if duration >= self.config['THRESHOLD_MS']:
+            connection = context['connection']
+            entry = slow_queries.record(sql, duration, self.label or 'unknown', connection.alias)
+            if not many and connection.vendor == 'postgresql' and explainable(sql) \
+                    and slow_queries.needs_plan(entry, self.config):
+                slow_queries.set_plan(entry, self.explain(connection, sql, params))
+
+        return result
+
+    @staticmethod
+    def explain(connection, sql, params):
+        """ Plan of a query, run again under EXPLAIN (ANALYZE, BUFFERS) unless
+        it calls functions. Runs in a savepoint so a failure does not break
+        the transaction it was issued in."""
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyzable(sql) else 'EXPLAIN '
+        _local.explaining = True
+        try:
+            with atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+        except DatabaseError as exc:
+            logger.warning('Could not explain slow query: {}'.format(exc))
+            return None
+        finally:
+            _local.explaining = False
+
+
+@contextmanager
+def capture(recorder):
+    """ Time the queries made on every database connection of this thread."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def view_label(view_func, method):
+    """ Viewset action or view a request is routed to, e.g. TransactionView.info."""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return '{}.{}'.format(view_func.__module__, view_func.__name__)
+
+    actions = getattr(view_func, 'actions', None) or {}
+    return '{}.{}'.format(view_class.__name__, actions.get(method.lower(), method.lower()))
+
+
+def stream_captured(content, recorder):
+    """ Keep timing queries while a streaming response is consumed."""
+    iterator = iter(content)
+    while True:
+        with capture(recorder):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+class SlowQueryMiddleware:
+    """ Record queries slower than settings.SLOW_QUERIES['THRESHOLD_MS'] by
+    fingerprint, with the action that issued them and a sampled plan.
+    Not loaded unless SLOW_QUERIES['ENABLED'] is set.
+    """
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(request.path_info)
+        request.query_recorder = recorder
+
+        with capture(recorder):
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = stream_captured(response.streaming_content, recorder)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            recorder.label = view_label(view_func, request.method)
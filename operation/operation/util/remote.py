@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.exceptions import RequestException
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as default_exception_handler
+
+from .renderers import MSGPACK_MEDIA_TYPE
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Connect and read timeouts in seconds.
+    'TIMEOUT': (1.0, 5.0),
+    # Consecutive failures that open the circuit.
+    'FAILURE_THRESHOLD': 5,
+    # Seconds an open circuit waits before letting a probe through.
+    'RECOVERY_TIME': 30,
+    # Concurrent calls allowed to the dependency from one process.
+    'MAX_CONCURRENCY': 20,
+    # Seconds a call waits for a free slot before failing fast.
+    'QUEUE_TIMEOUT': 0.05,
+}
+
+session = requests.Session()
+
+
+class DependencyUnavailable(RequestException):
+    """ Raised without calling the dependency when its circuit is open or
+    its bulkhead is full."""
+    def __init__(self, service, reason, retry_after):
+        super().__init__('{} is unavailable: {}'.format(service, reason))
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold, recovery_time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        return max(0, int(self.opened_at + self.recovery_time - time.monotonic())) + 1
+
+    def allow(self):
+        """ Whether a call may go through. Once the recovery time has passed
+        an open circuit lets a single probe through."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_time:
+                self.state = self.HALF_OPEN
+                logger.info('Circuit of {} half open, probing.'.format(self.name))
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info('Circuit of {} closed.'.format(self.name))
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Circuit of {} opened after {} failures.'.format(self.name, self.failures))
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Dependency:
+    """ Remote service guarded by a timeout, a circuit breaker and a bulkhead."""
+    def __init__(self, name, config):
+        self.name = name
+        self.timeout = tuple(config['TIMEOUT'])
+        self.queue_timeout = config['QUEUE_TIMEOUT']
+        self.breaker = CircuitBreaker(name, config['FAILURE_THRESHOLD'], config['RECOVERY_TIME'])
+        self.bulkhead = threading.BoundedSemaphore(config['MAX_CONCURRENCY'])
+        self.metrics = {'calls': 0, 'failures': 0, 'short_circuited': 0,
+                        'rejected': 0, 'total_latency': 0.0}
+        self._lock = threading.Lock()
+
+    def count(self, **increments):
+        """ Add to the call counters, concurrent requests share them."""
+        with self._lock:
+            for name, value in increments.items():
+                self.metrics[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['mean_latency'] = metrics['total_latency'] / metrics['calls'] if metrics['calls'] else 0.0
+        metrics['state'] = self.breaker.state
+        return metrics
+
+    def request(self, method, url, **kwargs):
+        if not self.bulkhead.acquire(timeout=self.queue_timeout):
+            self.count(rejected=1)
+            raise DependencyUnavailable(self.name, 'too many concurrent calls', 1)
+
+        if not self.breaker.allow():
+            self.bulkhead.release()
+            self.count(short_circuited=1)
+            raise DependencyUnavailable(self.name, 'circuit open', self.breaker.retry_after())
+
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except RequestException:
+            self.count(failures=1)
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.bulkhead.release()
+            self.count(calls=1, total_latency=time.monotonic() - started)
+
+        if response.status_code >= 500:
+            self.count(failures=1)
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        return response
+
+
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+
+def get_dependency(service):
+    with _dependencies_lock:
+        if service not in _dependencies:
+            config = dict(DEFAULTS, **getattr(settings, 'REMOTE_SERVICES', {}).get(service, {}))
+            _dependencies[service] = Dependency(service, config)
+        return _dependencies[service]
+
+
+def metrics():
+    """ Call counters and circuit state of every dependency used by this process."""
+    with _dependencies_lock:
+        dependencies = dict(_dependencies)
+    return {name: dependency.snapshot() for name, dependency in dependencies.items()}
+
+
+def get_headers(token=None):
+    """ Headers for a call to another service, asks for MessagePack when
+    it can be decoded locally."""
+    if msgpack is not None:
+        headers = {'Accept': '{}, application/json;q=0.9'.format(MSGPACK_MEDIA_TYPE)}
+    else:
+        headers = {'Accept': 'application/json'}
+
+    if token:
+        headers['Authorization'] = token
+
+    return headers
+
+
+def get(url, service, token=None, **kwargs):
+    return get_dependency(service).request('GET', url, headers=get_headers(token), **kwargs)
+
+
+def post(url, service, token=None, **kwargs):
+    return get_dependency(service).request('POST', url, headers=get_headers(token), **kwargs)
+
+
+def payload(response):
+    """ Decode the body of a response from another service.
+
+    Args:
+        response: requests.Response, Response returned by get or post.
+
+    Returns:
+        Decoded body.
+    """
+    content_type = response.headers.get('Content-Type', '')
+    if msgpack is not None and content_type.startswith(MSGPACK_MEDIA_TYPE):
+        return msgpack.unpackb(response.content, raw=False)
+
+    return response.json()
+
+
+def exception_handler(exc, context):
+    """ DRF exception handler that fails fast with 503 when a dependency
+    is unavailable or does not answer in time."""
+    if isinstance(exc, DependencyUnavailable):
+        logger.warning(exc)
+        return Response({'error': str(exc)}, status=503,
+                        headers={'Retry-After': str(exc.retry_after)})
+
+    if isinstance(exc, RequestException):
+        logger.warning(exc)
+        return Response({'error': 'Upstream service did not respond.'}, status=504)
+
+    return default_exception_handler(exc, context)
@@ -0,0 +1,113 @@
+import json
+import re
+from contextlib import ExitStack, contextmanager
+from enum import Enum
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError
+from requests.models import Response
+
+from . import remote
+
+
+class FakeTransport(BaseAdapter):
+    """ Transport adapter for the remote session that answers outbound calls
+    with canned responses and records every call."""
+    def __init__(self):
+        super().__init__()
+        self.routes = []
+        self.calls = []
+
+    def add(self, method, pattern, body=None, status=200):
+        """ Answer calls whose URL matches a pattern.
+
+        Args:
+            method: str, HTTP method.
+            pattern: str, Regular expression searched in the URL.
+            body: JSON serializable body of the response.
+            status: int, Status code of the response.
+        """
+        self.routes.append((method, re.compile(pattern), body, status))
+
+    def send(self, request, **kwargs):
+        self.calls.append((request.method, request.url))
+
+        for method, pattern, body, status in self.routes:
+            if method == request.method and pattern.search(request.url):
+                response = Response()
+                response.status_code = status
+                response.headers['Content-Type'] = 'application/json'
+                response._content = json.dumps(body).encode('utf-8')
+                response.url = request.url
+                response.request = request
+                return response
+
+        raise ConnectionError('No fake route for {} {}'.format(request.method, request.url))
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def fake_transport():
+    """ Route calls made through remote.session to a FakeTransport."""
+    transport = FakeTransport()
+    adapters = dict(remote.session.adapters)
+    remote.session.mount('http://', transport)
+    remote.session.mount('https://', transport)
+    try:
+        yield transport
+    finally:
+        for prefix, adapter in adapters.items():
+            remote.session.mount(prefix, adapter)
+
+
+@contextmanager
+def live_constants(constants, modules, **values):
+    """ Turn off TESTING for code that imported an APIConsts enum, so calls
+    to other services are made.
+
+    Args:
+        constants: Enum, The APIConsts enum.
+        modules: list, Modules that imported it.
+        **values: Members to override, such as API roots.
+    """
+    members = {member.name: member.value for member in constants}
+    members.update(values, TESTING=False)
+    live = Enum(constants.__name__, members)
+
+    with ExitStack() as stack:
+        for module in modules:
+            stack.enter_context(mock.patch.object(module, constants.__name__, live))
+        yield live
+
+
+@contextmanager
+def budget(test, queries, calls, transport):
+    """ Fail a test when the block runs more SQL queries or outbound calls
+    than allowed.
+
+    Args:
+        test: TestCase, Running test.
+        queries: int, Most SQL queries allowed.
+        calls: int, Most outbound calls allowed.
+        transport: FakeTransport, Transport the calls go through.
+
+    Returns:
+        dict, Filled with the queries and calls made once the block exits.
+    """
+    usage = {}
+    made = len(transport.calls)
+    with CaptureQueriesContext(connection) as captured:
+        yield usage
+
+    usage['queries'] = len(captured)
+    usage['calls'] = len(transport.calls) - made
+
+    test.assertLessEqual(usage['queries'], queries, 'Too many queries:\n{}'.format(
+        '\n'.join(query['sql'] for query in captured.captured_queries)))
+    test.assertLessEqual(usage['calls'], calls, 'Too many outbound calls:\n{}'.format(
+        '\n'.join('{} {}'.format(*call) for call in transport.calls[made:])))
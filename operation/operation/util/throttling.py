@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Tokens added to a client's bucket per second.
+    'RATE': 10.0,
+    # Bucket capacity, the largest burst a client can make.
+    'BURST': 60,
+    # Tokens taken by one request to an action, actions not listed cost 1.
+    'COSTS': {},
+    # Per action overrides of RATE and BURST.
+    'ACTIONS': {},
+}
+
+SHEDDING_DEFAULTS = {
+    # Requests in progress in one process above which load is shed.
+    'MAX_IN_FLIGHT': 50,
+    # Smoothed latency of protected requests above which load is shed.
+    'MAX_LATENCY_MS': 500,
+    # Weight of the latest request in the smoothed latency.
+    'SMOOTHING': 0.1,
+    # Seconds clients are asked to wait before retrying.
+    'RETRY_AFTER': 5,
+    # Path patterns of the expensive endpoints that may be shed.
+    'PATHS': [],
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'THROTTLING', {}))
+
+
+def get_shedding_config():
+    return dict(SHEDDING_DEFAULTS, **getattr(settings, 'LOAD_SHEDDING', {}))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """ Token bucket per client and action kept in the shared cache.
+
+    Buckets refill at RATE tokens per second up to BURST, and each request
+    takes the cost of its action so expensive endpoints drain a client's
+    bucket faster than cheap reads. A bucket is updated under a lock taken
+    with cache.add, concurrent requests of one client queue for it briefly
+    and count as throttled when they can not get it. Buckets are only
+    shared by the workers when the default cache is.
+    """
+    # Tries at the bucket lock, LOCK_WAIT seconds apart.
+    LOCK_ATTEMPTS = 20
+    LOCK_WAIT = 0.002
+    # Seconds a lock outlives a worker that died holding it.
+    LOCK_TIMEOUT = 1
+
+    warned = False
+
+    def __init__(self):
+        self.wait_time = None
+        if not TokenBucketThrottle.warned and not caching.is_shared():
+            TokenBucketThrottle.warned = True
+            logger.warning('Throttle buckets are kept per process, configure a shared CACHE_URL.')
+
+    def _lock(self, key):
+        for _ in range(self.LOCK_ATTEMPTS):
+            if cache.add(key, True, self.LOCK_TIMEOUT):
+                return True
+            time.sleep(self.LOCK_WAIT)
+        return False
+
+    @staticmethod
+    def get_action(view):
+        return getattr(view, 'throttle_scope', None) or getattr(view, 'action', None) \
+            or view.__class__.__name__
+
+    def get_client(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return 'user:{}'.format(user.pk)
+
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if authorization:
+            return 'token:{}'.format(hashlib.sha256(authorization.encode('utf-8')).hexdigest())
+
+        return 'ip:{}'.format(self.get_ident(request))
+
+    def allow_request(self, request, view):
+        config = get_config()
+        action = self.get_action(view)
+        overrides = config['ACTIONS'].get(action, {})
+        rate = overrides.get('RATE', config['RATE'])
+        burst = overrides.get('BURST', config['BURST'])
+        cost = min(config['COSTS'].get(action, 1), burst)
+
+        key = 'throttle:{}:{}'.format(action, self.get_client(request))
+        if not self._lock(key + ':lock'):
+            self.wait_time = self.LOCK_ATTEMPTS * self.LOCK_WAIT
+            return False
+
+        try:
+            now = time.time()
+            tokens, updated = cache.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens < cost:
+                self.wait_time = (cost - tokens) / rate
+                return False
+
+            cache.set(key, (tokens - cost, now), int(burst / rate) + 1)
+            return True
+        finally:
+            cache.delete(key + ':lock')
+
+    def wait(self):
+        return self.wait_time
+
+
+class CountedStream:
+    """ Streaming content that calls done once, when the response closes it."""
+    def __init__(self, content, done):
+        self.content = content
+        self.done = done
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        done, self.done = self.done, None
+        if done is not None:
+            done()
+
+
+class LoadSheddingMiddleware:
+    """ Reject requests to the expensive endpoints in settings.LOAD_SHEDDING
+    with 429 while the process is saturated, keeping latency in check for
+    the remaining, transactional endpoints.
+
+    The process counts as saturated while too many requests are in progress
+    or the smoothed latency of the protected requests is over the limit.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.in_flight = 0
+        self.latency = 0.0
+        self.sampled_at = 0.0
+        self._lock = threading.Lock()
+
+    def overloaded(self, config):
+        # Without recent protected requests the latency sample is stale.
+        recent = time.monotonic() - self.sampled_at < config['RETRY_AFTER']
+        return self.in_flight >= config['MAX_IN_FLIGHT'] or \
+            recent and self.latency * 1000 >= config['MAX_LATENCY_MS']
+
+    def __call__(self, request):
+        config = get_shedding_config()
+        sheddable = any(re.match(path, request.path_info) for path in config['PATHS'])
+
+        if sheddable and self.overloaded(config):
+            response = JsonResponse({'error': 'Service overloaded, retry later.'}, status=429)
+            response['Retry-After'] = str(config['RETRY_AFTER'])
+            return response
+
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+
+        def finish():
+            with self._lock:
+                self.in_flight -= 1
+                if not sheddable:
+                    self.sampled_at = time.monotonic()
+                    self.latency += config['SMOOTHING'] * (self.sampled_at - started - self.latency)
+
+        try:
+            response = self.get_response(request)
+        except Exception:
+            finish()
+            raise
+
+        # A streamed body is produced after the view returns, count it until the response is closed.
+        if response.streaming:
+            response.streaming_content = CountedStream(response.streaming_content, finish)
+        else:
+            finish()
+        return response
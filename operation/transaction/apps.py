@@ -1,5 +1,32 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_partitions(sender, using, **kwargs):
+    """ Keep partitions ahead of time every time migrations run."""
+    from django.db import connections
+    from .management import partitions
+
+    connection = connections[using]
+    if partitions.get_config()['ENABLED'] and partitions.is_partitioned(connection):
+        partitions.ensure_partitions(connection)
+
+
+def create_sample_indexes(sender, using, **kwargs):
+    """ Index the random bits dataset samples filter on."""
+    from django.db import connections
+    from .management import sampling
+
+    sampling.ensure_indexes(connections[using])
 
 
 class TransactionConfig(AppConfig):
     name = 'transaction'
+
+    def ready(self):
+        from .management import hotcache
+
+        # Refuse a misconfigured hot cache at startup rather than on the first request.
+        hotcache.get_config()
+        post_migrate.connect(create_partitions, sender=self)
+        post_migrate.connect(create_sample_indexes, sender=self)
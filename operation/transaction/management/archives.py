@@ -0,0 +1,173 @@
+import datetime
+import io
+import os
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import get_storage_class
+from django.utils import timezone
+
+DEFAULTS = {
+    'STORAGE': 'django.core.files.storage.FileSystemStorage',
+    'OPTIONS': {},
+    'PREFIX': 'transactions',
+    'COMPRESSION': 'snappy',
+    'ROW_GROUP_SIZE': 100000,
+    'RETENTION_MONTHS': 12,
+}
+
+COLUMNS = ('identifier', 'customer_id', 'amount', 'balance_after',
+           'category', 'transfer_method', 'transfer_time')
+
+# Amounts are stored as cents to keep them exact.
+CENTS = Decimal('100')
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'TRANSACTION_ARCHIVE', {}))
+
+
+def get_storage():
+    config = get_config()
+    return get_storage_class(config['STORAGE'])(**config['OPTIONS'])
+
+
+def _pyarrow():
+    """ pyarrow is heavy, only import it when archives are touched."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured('pyarrow is required for transaction archives.')
+    return pyarrow, pyarrow.parquet
+
+
+def month_path(month):
+    return os.path.join(get_config()['PREFIX'], '{:%Y-%m}.parquet'.format(month))
+
+
+def months(start, end):
+    """ First days of every month between two dates, inclusive."""
+    month = datetime.date(start.year, start.month, 1)
+    while month <= end:
+        yield month
+        month += relativedelta(months=1)
+
+
+def _to_datetime(date):
+    if isinstance(date, datetime.datetime):
+        return date
+    return timezone.make_aware(datetime.datetime(date.year, date.month, date.day), timezone.utc)
+
+
+def write_month(month, rows):
+    """ Write one month of transactions as a compressed parquet file.
+
+    Args:
+        month: datetime.date, First day of the month.
+        rows: iterable, Tuples of COLUMNS ordered by transfer_time.
+
+    Returns:
+        tuple, Storage path and number of rows written.
+    """
+    pa, pq = _pyarrow()
+    config = get_config()
+
+    schema = pa.schema([
+        pa.field('identifier', pa.string()),
+        pa.field('customer_id', pa.string()),
+        pa.field('amount', pa.int64()),
+        pa.field('balance_after', pa.int64()),
+        pa.field('category', pa.string()),
+        pa.field('transfer_method', pa.string()),
+        pa.field('transfer_time', pa.timestamp('us')),
+    ])
+
+    def table(batch):
+        columns = list(zip(*batch))
+        arrays = [
+            pa.array(columns[0], type=pa.string()),
+            pa.array(columns[1], type=pa.string()),
+            pa.array([int(value * CENTS) for value in columns[2]], type=pa.int64()),
+            pa.array([int(value * CENTS) for value in columns[3]], type=pa.int64()),
+            pa.array(columns[4], type=pa.string()),
+            pa.array(columns[5], type=pa.string()),
+            pa.array([timezone.make_naive(value, timezone.utc) for value in columns[6]],
+                     type=pa.timestamp('us')),
+        ]
+        return pa.Table.from_arrays(arrays, names=list(COLUMNS))
+
+    buffer = io.BytesIO()
+    writer = pq.ParquetWriter(buffer, schema, compression=config['COMPRESSION'])
+    count = 0
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= config['ROW_GROUP_SIZE']:
+            writer.write_table(table(batch))
+            count += len(batch)
+            batch = []
+
+    if batch:
+        writer.write_table(table(batch))
+        count += len(batch)
+    writer.close()
+
+    storage = get_storage()
+    path = month_path(month)
+    if storage.exists(path):
+        storage.delete(path)
+    path = storage.save(path, ContentFile(buffer.getvalue()))
+
+    return path, count
+
+
+def read_month(path):
+    """ Read an archived month back as transaction dicts.
+
+    Args:
+        path: str, Storage path of the archive.
+
+    Returns:
+        generator, Dicts of COLUMNS ordered by transfer_time.
+    """
+    _, pq = _pyarrow()
+
+    with get_storage().open(path, 'rb') as archive:
+        parquet = pq.ParquetFile(archive)
+
+        for index in range(parquet.num_row_groups):
+            group = parquet.read_row_group(index)
+            columns = [group.column(name_index).to_pylist() for name_index in range(len(COLUMNS))]
+
+            for values in zip(*columns):
+                row = dict(zip(COLUMNS, values))
+                row['amount'] = Decimal(row['amount']) / CENTS
+                row['balance_after'] = Decimal(row['balance_after']) / CENTS
+                row['transfer_time'] = timezone.make_aware(row['transfer_time'], timezone.utc)
+                yield row
+
+
+def iter_rows(start, end):
+    """ Archived transactions between two dates, ordered by transfer_time.
+
+    Args:
+        start: datetime.date, Start of the window, inclusive.
+        end: datetime.date, End of the window, inclusive.
+
+    Returns:
+        generator, Transaction dicts from the archived months of the window.
+    """
+    archived = apps.get_model('transaction', 'ArchivedMonth')
+    start, end = _to_datetime(start), _to_datetime(end)
+
+    for month in archived.objects.filter(month__gte=datetime.date(start.year, start.month, 1),
+                                         month__lte=end.date()).order_by('month'):
+        for row in read_month(month.path):
+            if start <= row['transfer_time'] <= end:
+                yield row
@@ -0,0 +1,115 @@
+import datetime
+from contextlib import ExitStack
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.transaction import atomic
+
+from transaction.management import archives, partitions, sharding
+from transaction.models import ArchivedMonth, Transaction, TransactionOutbox
+
+
+class Command(BaseCommand):
+    help = 'Move closed months older than the retention window into cold storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, default=None,
+                            help='Months kept in the transaction table, defaults to '
+                                 'TRANSACTION_ARCHIVE["RETENTION_MONTHS"].')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        retention = options['retention']
+        if retention is None:
+            retention = archives.get_config()['RETENTION_MONTHS']
+
+        # info reads the last month and the current one from the table.
+        if retention < 2:
+            raise CommandError('Retention must be at least 2 months.')
+
+        today = datetime.date.today()
+        cutoff = datetime.date(today.year, today.month, 1) - relativedelta(months=retention)
+
+        aliases = sharding.databases()
+        oldest = min(filter(None, (Transaction.objects.using(alias).order_by('transfer_time')
+                                   .values_list('transfer_time', flat=True).first() for alias in aliases)),
+                     default=None)
+        if oldest is None or oldest.date() >= cutoff:
+            self.stdout.write('Nothing to archive.')
+            return
+
+        # Partitions of archived months are dropped whole instead of deleting rows.
+        partitioned = {alias: partitions.is_partitioned(connections[alias]) for alias in aliases}
+
+        for month in archives.months(oldest.date(), cutoff - relativedelta(days=1)):
+            window = [month, month + relativedelta(months=1)]
+            queryset = Transaction.objects \
+                .filter(transfer_time__gte=window[0], transfer_time__lt=window[1])
+
+            if not any(queryset.using(alias).exists() for alias in aliases):
+                continue
+
+            if options['dry_run']:
+                self.stdout.write('{:%Y-%m}: {} transactions'
+                                  .format(month, sum(queryset.using(alias).count() for alias in aliases)))
+                continue
+
+            if ArchivedMonth.objects.filter(month=month).exists():
+                raise CommandError('{:%Y-%m} is archived but still has transactions, '
+                                   'inspect it before archiving again.'.format(month))
+
+            # The shards of a month are merged into a single archive.
+            rows = sharding.gather(queryset.order_by('transfer_time').values_list(*archives.COLUMNS),
+                                   key=lambda row: row[-1])
+            path, count = archives.write_month(month, rows)
+
+            # The month is deleted from every shard or from none of them.
+            with ExitStack() as stack:
+                for alias in sharding.replicas():
+                    stack.enter_context(atomic(using=alias))
+
+                ArchivedMonth.objects.create(month=month, path=path, rows=count)
+                deleted = sum(self.delete_month(connections[alias], month, queryset.using(alias),
+                                                partitioned[alias]) for alias in aliases)
+
+                # Rows written after the archive was read would be lost, roll the month back.
+                if deleted != count:
+                    raise CommandError('{:%Y-%m}: archived {} transactions but {} were in the table, '
+                                       'nothing was deleted.'.format(month, count, deleted))
+
+            self.stdout.write('{:%Y-%m}: archived {} transactions to {}'.format(month, count, path))
+
+    @classmethod
+    def delete_month(cls, connection, month, queryset, partitioned):
+        """ Delete the transactions of a month and their change feed entries
+        from one shard.
+
+        Returns:
+            int, Number of transactions deleted.
+        """
+        TransactionOutbox.objects.using(connection.alias) \
+            .filter(transaction__transfer_time__gte=month,
+                    transaction__transfer_time__lt=month + relativedelta(months=1)).delete()
+
+        name = partitions.detach(connection, month) if partitioned else None
+        if name is not None:
+            return cls.drop_table(connection, name)
+
+        _, deleted = queryset.delete()
+        return deleted.get(Transaction._meta.label, 0)
+
+    @staticmethod
+    def drop_table(connection, name):
+        """ Drop a detached partition.
+
+        Returns:
+            int, Number of rows it held.
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM {}'.format(quote(name)))
+            rows = cursor.fetchone()[0]
+            cursor.execute('DROP TABLE {}'.format(quote(name)))
+
+        return rows
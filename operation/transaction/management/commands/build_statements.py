@@ -0,0 +1,57 @@
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from transaction.management import sharding, statements
+
+
+class Command(BaseCommand):
+    help = 'Build the monthly statements of every customer for a closed month.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', default=None,
+                            help='Month as YYYY-MM, defaults to last month.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--ranges-per-worker', type=int, default=4,
+                            help='Customer ranges handed to each worker, more ranges balance '
+                                 'uneven ranges better.')
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        this_month = datetime.date(today.year, today.month, 1)
+
+        if options['month'] is None:
+            month = this_month - relativedelta(months=1)
+        else:
+            try:
+                month = datetime.datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('Month must be formatted as YYYY-MM.')
+
+        if month >= this_month:
+            raise CommandError('Statements can only be built for closed months.')
+
+        workers = max(1, options['workers'])
+        # Customers never span shards, every shard is split into its own ranges.
+        ranges = [(low, high, alias) for alias in sharding.databases()
+                  for low, high in statements.customer_ranges(month, workers * options['ranges_per_worker'],
+                                                              using=alias)]
+
+        if workers == 1:
+            created = sum(statements.build(month, low, high, using=alias) for low, high, alias in ranges)
+        else:
+            # Forked workers must open their own database connections.
+            connections.close_all()
+            created = 0
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(statements.build, month, low, high, using=alias)
+                           for low, high, alias in ranges]
+                for future in as_completed(futures):
+                    created += future.result()
+
+        self.stdout.write('{:%Y-%m}: built {} statements over {} customer ranges.'
+                          .format(month, created, len(ranges)))
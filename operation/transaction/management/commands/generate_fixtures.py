@@ -0,0 +1,72 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from operation.util import fixtures
+from transaction.management import sharding
+from transaction.models import CustomerAttributes, Transaction
+
+TRANSACTION_COLUMNS = ('identifier', 'customer_id', 'amount', 'balance_after',
+                       'category', 'transfer_time', 'transfer_method')
+
+ATTRIBUTE_COLUMNS = ('customer_id', 'occupation_type', 'birth_year',
+                     'updated_at', 'synced_at')
+
+
+class Command(BaseCommand):
+    help = 'Load synthetic transactions for benchmarking. Run generate_fixtures ' \
+           'of the customer service with the same options for matching customers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--months', type=int, default=12)
+        parser.add_argument('--per-month', type=int, default=30,
+                            help='Average spending transactions per customer and month.')
+        parser.add_argument('--seed', default='fixtures')
+        parser.add_argument('--until', default=None,
+                            help='Last day of history (exclusive) as YYYY-MM-DD, defaults to today.')
+        parser.add_argument('--batch-size', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'postgresql':
+            raise CommandError('generate_fixtures loads data with COPY and requires PostgreSQL.')
+
+        until = datetime.datetime.strptime(options['until'], '%Y-%m-%d').date() \
+            if options['until'] else datetime.date.today()
+        now = timezone.now()
+
+        def customers():
+            return fixtures.customers(options['seed'], options['customers'], options['months'], until)
+
+        def transaction_rows(alias):
+            for customer in customers():
+                if sharding.shard_for(customer['identifier']) != alias:
+                    continue
+                for transaction in fixtures.transactions(options['seed'], customer, options['months'],
+                                                         options['per_month'], until):
+                    yield (transaction['identifier'], transaction['customer_id'],
+                           transaction['amount'], transaction['balance_after'],
+                           transaction['category'], transaction['transfer_time'],
+                           transaction['transfer_method'])
+
+        def attribute_rows():
+            for customer in customers():
+                yield (customer['identifier'], customer['occupation_type'],
+                       customer['birth_year'], now, now)
+
+        # Every shard gets the transactions of its customers and a copy of the attributes.
+        for alias in sharding.databases():
+            started = time.monotonic()
+            loaded = fixtures.copy_rows(connections[alias], Transaction._meta.db_table, TRANSACTION_COLUMNS,
+                                        transaction_rows(alias), options['batch_size'], skip_conflicts=True)
+            elapsed = time.monotonic() - started
+            self.stdout.write('Loaded {} transactions into {} in {:.1f}s ({:.0f} rows/s).'
+                              .format(loaded, alias, elapsed, loaded / elapsed if elapsed else 0))
+
+        for alias in sharding.replicas():
+            loaded = fixtures.copy_rows(connections[alias], CustomerAttributes._meta.db_table, ATTRIBUTE_COLUMNS,
+                                        attribute_rows(), options['batch_size'], skip_conflicts=True)
+            self.stdout.write('Loaded {} customer attributes into {}.'.format(loaded, alias))
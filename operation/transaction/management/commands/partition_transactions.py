@@ -0,0 +1,60 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from transaction.management import partitions, sharding
+
+
+class Command(BaseCommand):
+    help = 'Manage the monthly partitions of the transaction table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Rebuild the unpartitioned transaction table as a partitioned one.')
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='Future months to create partitions for, defaults to '
+                                 'TRANSACTION_PARTITIONING["MONTHS_AHEAD"].')
+        parser.add_argument('--detach', default=None,
+                            help='Detach the partition of a month, as YYYY-MM.')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop the detached partition as well.')
+
+    def handle(self, *args, **options):
+        month = None
+        if options['detach']:
+            try:
+                month = datetime.datetime.strptime(options['detach'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('Month must be formatted as YYYY-MM.')
+
+        # Every shard holds its own partitioned transaction table.
+        for alias in sharding.databases():
+            self.handle_shard(connections[alias], month, options)
+
+    def handle_shard(self, connection, month, options):
+        prefix = '{}: '.format(connection.alias) if sharding.is_sharded() else ''
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL.')
+
+        if options['convert']:
+            if partitions.is_partitioned(connection):
+                raise CommandError(prefix + 'The transaction table is already partitioned.')
+            partitions.convert(connection, options['ahead'])
+            self.stdout.write(prefix + 'Converted, {} monthly partitions.'
+                              .format(len(partitions.partitions(connection))))
+            return
+
+        if not partitions.is_partitioned(connection):
+            raise CommandError(prefix + 'The transaction table is not partitioned, run with --convert first.')
+
+        if month is not None:
+            name = partitions.detach(connection, month, drop=options['drop'])
+            if name is None:
+                raise CommandError(prefix + '{:%Y-%m} has no partition.'.format(month))
+            self.stdout.write(prefix + '{} {}.'.format('Dropped' if options['drop'] else 'Detached', name))
+            return
+
+        for name in partitions.ensure_partitions(connection, options['ahead']):
+            self.stdout.write(prefix + 'Created {}.'.format(name))
@@ -0,0 +1,50 @@
+import os
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from operation.util import remote
+from transaction.management import sharding
+from transaction.management.secret_constants import APIConsts
+from transaction.models import CustomerAttributes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the local customer attribute projection from the customer service.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--token', required=True,
+                            help='Authorization header value of an admin token.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, 'attributes', '')
+        started = timezone.now()
+        after = ''
+        synced = 0
+
+        while True:
+            response = remote.get(url, 'customer', token=options['token'],
+                                  params={'after': after, 'limit': options['batch_size']})
+            if response.status_code != requests.codes.ok:
+                raise CommandError('Customer service responded with {}.'.format(response.status_code))
+
+            rows = remote.payload(response)['results']
+            if not rows:
+                break
+
+            for row in rows:
+                row['updated_at'] = parse_datetime(row['updated_at'])
+
+            for alias in sharding.replicas():
+                CustomerAttributes.objects.db_manager(alias).replace(rows)
+            synced += len(rows)
+            after = rows[-1]['customer_id']
+
+        # Customers that were not seen during the resync no longer exist.
+        for alias in sharding.replicas():
+            removed, _ = CustomerAttributes.objects.using(alias).filter(synced_at__lt=started).delete()
+
+        self.stdout.write('Synced {} customers, removed {}.'.format(synced, removed))
@@ -0,0 +1,115 @@
+import datetime
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+DEFAULTS = {
+    'MAX_BATCH': 1000,
+    'MAX_WAIT': 30,
+    'POLL_INTERVAL': 0.25,
+    'GAP_GRACE': 5,
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'TRANSACTION_FEED', {}))
+
+
+def oldest_transaction(connection):
+    """ Start time of the oldest transaction open in another session.
+
+    The feed reads as the same database user that writes the outbox, so
+    pg_stat_activity shows the start of every session that could hold a
+    sequence value.
+
+    Args:
+        connection: DatabaseWrapper, Connection of the shard being read.
+
+    Returns:
+        datetime, None when no other transaction is open.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(xact_start) FROM pg_stat_activity '
+                       'WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL')
+        return cursor.fetchone()[0]
+
+
+def contiguous(entries, position, grace, oldest):
+    """ Cut a batch of outbox entries at the first sequence gap.
+
+    Sequence values are taken when a row is inserted but become visible on
+    commit, a gap may be a transaction that has not committed yet. The
+    transaction holding a gap started before the entry after the gap was
+    created, so the gap is only skipped once every open transaction started
+    later than that, the missing value was then rolled back. A long running
+    transaction holds the feed at the gap until it ends. A consumer at
+    position 0 starts from the oldest entry.
+
+    Args:
+        entries: list, Outbox entries ordered by sequence.
+        position: int, Last sequence the consumer has seen.
+        grace: int, Seconds of clock skew allowed between the application
+            and the database.
+        oldest: datetime, Start of the oldest open transaction, None when
+            there is none.
+
+    Returns:
+        list, Entries that can be delivered.
+    """
+    expected = position + 1 if position else None
+    delivered = []
+
+    for entry in entries:
+        if expected is not None and entry.sequence != expected:
+            settled = entry.created + datetime.timedelta(seconds=grace)
+            if oldest is not None and oldest <= settled:
+                break
+        delivered.append(entry)
+        expected = entry.sequence + 1
+
+    return delivered
+
+
+def read(position, batch_size, wait, using='default'):
+    """ Read change feed entries after position, waiting up to wait seconds
+    for new entries.
+
+    Args:
+        position: int, Last sequence the consumer has seen.
+        batch_size: int, Maximum number of entries.
+        wait: float, Seconds to wait when there are no entries.
+        using: str, Shard whose outbox is read.
+
+    Returns:
+        list, Events ordered by sequence.
+    """
+    config = get_config()
+    outbox = apps.get_model('transaction', 'TransactionOutbox')
+    batch_size = max(1, min(batch_size, config['MAX_BATCH']))
+    deadline = time.monotonic() + max(0, min(wait, config['MAX_WAIT']))
+
+    while True:
+        # Taken before the entries, a gap holder that commits in between is then visible.
+        oldest = oldest_transaction(connections[using])
+        entries = list(outbox.objects.using(using)
+                       .filter(sequence__gt=position)
+                       .select_related('transaction')
+                       .order_by('sequence')[:batch_size])
+        entries = contiguous(entries, position, config['GAP_GRACE'], oldest)
+
+        if entries or time.monotonic() >= deadline:
+            break
+        time.sleep(config['POLL_INTERVAL'])
+
+    return [{
+        'sequence': entry.sequence,
+        'identifier': entry.transaction.identifier,
+        'customer_id': entry.transaction.customer_id,
+        'amount': entry.transaction.amount,
+        'category': entry.transaction.category,
+        'transfer_method': entry.transaction.transfer_method,
+        'transfer_time': entry.transaction.transfer_time,
+        'balance_after': entry.transaction.balance_after,
+    } for entry in entries]
@@ -0,0 +1,15 @@
+from django_filters import rest_framework as filters
+
+from transaction.models import Transaction
+
+
+class TransactionFilter(filters.FilterSet):
+    transfer_after = filters.IsoDateTimeFilter(field_name='transfer_time', lookup_expr='gte')
+    transfer_before = filters.IsoDateTimeFilter(field_name='transfer_time', lookup_expr='lte')
+    min_amount = filters.NumberFilter(field_name='amount', lookup_expr='gte')
+    max_amount = filters.NumberFilter(field_name='amount', lookup_expr='lte')
+    min_anomaly_score = filters.NumberFilter(field_name='anomaly_score', lookup_expr='gte')
+
+    class Meta:
+        model = Transaction
+        fields = ['customer_id', 'category', 'transfer_method']
@@ -0,0 +1,285 @@
+import datetime
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from operation.util import caching
+from . import sharding
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Newest transactions kept per customer.
+    'DEPTH': 50,
+    # Memory the buffers of one worker may take, least recently used customers go first.
+    'MAX_BYTES': 16 * 1024 * 1024,
+    # Seconds version stamps are kept in the shared cache.
+    'VERSION_TTL': 24 * 60 * 60,
+    # Allow a process-local default cache, only correct with a single worker process.
+    'SINGLE_PROCESS': False,
+}
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+CENTS = Decimal('0.01')
+
+
+def get_config():
+    """ Hot cache settings.
+
+    Raises:
+        ImproperlyConfigured, The cache is enabled without a shared default
+            cache, workers would not see each other's version stamps.
+    """
+    config = dict(DEFAULTS, **getattr(settings, 'TRANSACTION_HOT_CACHE', {}))
+    if config['ENABLED'] and not config['SINGLE_PROCESS'] and not caching.is_shared():
+        raise ImproperlyConfigured('HOT_CACHE requires a shared CACHE_URL, '
+                                   'or HOT_CACHE_SINGLE_PROCESS with a single worker process.')
+    return config
+
+
+def _codes(field):
+    transaction = apps.get_model('transaction', 'Transaction')
+    return [code for code, _ in transaction._meta.get_field(field).choices]
+
+
+class RingBuffer:
+    """ Newest transactions of one customer in parallel fixed-size arrays,
+    the oldest entry is overwritten once the buffer is full.
+
+    Amounts are kept in cents, times in microseconds since the epoch and
+    categories and transfer methods as indexes of their choices.
+    """
+    __slots__ = ('capacity', 'version', 'complete', 'start', 'size', 'identifiers', 'times',
+                 'amounts', 'balances', 'scores', 'categories', 'methods')
+
+    def __init__(self, capacity, version, complete):
+        self.capacity = capacity
+        self.version = version
+        # Whether the buffer holds every transaction of the customer.
+        self.complete = complete
+        self.start = 0
+        self.size = 0
+        self.identifiers = array('q', [0]) * capacity
+        self.times = array('q', [0]) * capacity
+        self.amounts = array('q', [0]) * capacity
+        self.balances = array('q', [0]) * capacity
+        self.scores = array('d', [0.0]) * capacity
+        self.categories = array('B', [0]) * capacity
+        self.methods = array('B', [0]) * capacity
+
+    @property
+    def nbytes(self):
+        return self.capacity * (8 * 5 + 2) + 128
+
+    def append(self, transaction, categories, methods):
+        """ Add a transaction newer than every buffered one.
+
+        Raises:
+            ValueError, The transaction cannot be stored compactly.
+        """
+        if not str(transaction.identifier).isdigit():
+            raise ValueError('Identifier {} is not numeric.'.format(transaction.identifier))
+
+        index = (self.start + self.size) % self.capacity
+        self.identifiers[index] = int(transaction.identifier)
+        self.times[index] = (transaction.transfer_time - EPOCH) // datetime.timedelta(microseconds=1)
+        self.amounts[index] = int(Decimal(str(transaction.amount)) / CENTS)
+        self.balances[index] = int(Decimal(str(transaction.balance_after)) / CENTS)
+        self.scores[index] = math.nan if transaction.anomaly_score is None else transaction.anomaly_score
+        self.categories[index] = categories.index(transaction.category)
+        self.methods[index] = methods.index(transaction.transfer_method)
+
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.complete = False
+        else:
+            self.size += 1
+
+    def oldest_time(self):
+        return EPOCH + datetime.timedelta(microseconds=self.times[self.start])
+
+    def rows(self, customer_id, categories, methods, count=None):
+        """ Buffered transactions as unsaved Transaction instances, newest first."""
+        transaction = apps.get_model('transaction', 'Transaction')
+        count = self.size if count is None else min(count, self.size)
+
+        rows = []
+        for offset in range(self.size - 1, self.size - 1 - count, -1):
+            index = (self.start + offset) % self.capacity
+            score = self.scores[index]
+            rows.append(transaction(
+                identifier=str(self.identifiers[index]),
+                customer_id=customer_id,
+                amount=Decimal(self.amounts[index]) * CENTS,
+                balance_after=Decimal(self.balances[index]) * CENTS,
+                category=categories[self.categories[index]],
+                transfer_method=methods[self.methods[index]],
+                transfer_time=EPOCH + datetime.timedelta(microseconds=self.times[index]),
+                anomaly_score=None if math.isnan(score) else score))
+
+        # Same order as the database, identifiers break ties as strings.
+        rows.sort(key=lambda row: (row.transfer_time, row.identifier), reverse=True)
+        return rows
+
+
+class HotCache:
+    """ Per-worker cache of the newest transactions of recently used
+    customers. Workers agree on freshness through a version stamp per
+    customer in the shared cache, bumped by every new transaction.
+    """
+    def __init__(self):
+        self.buffers = OrderedDict()
+        self.nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version_key(customer_id):
+        return 'transactions:hot:{}'.format(customer_id)
+
+    def current_version(self, customer_id, config):
+        key = self.version_key(customer_id)
+        version = cache.get(key)
+        if version is None:
+            # Start from the clock so a stamp that expired is not reused.
+            cache.add(key, int(time.time() * 1000), config['VERSION_TTL'])
+            version = cache.get(key)
+        return version
+
+    def _store(self, customer_id, buffer, config):
+        with self._lock:
+            self._drop(customer_id)
+            self.buffers[customer_id] = buffer
+            self.nbytes += buffer.nbytes
+
+            while self.nbytes > config['MAX_BYTES'] and len(self.buffers) > 1:
+                self._drop(next(iter(self.buffers)))
+
+    def _drop(self, customer_id):
+        buffer = self.buffers.pop(customer_id, None)
+        if buffer is not None:
+            self.nbytes -= buffer.nbytes
+
+    def _load(self, customer_id, config):
+        transaction = apps.get_model('transaction', 'Transaction')
+
+        # Read the version first, a write landing during the load makes it stale.
+        version = self.current_version(customer_id, config)
+        latest = list(transaction.objects
+                      .using(sharding.shard_for(customer_id))
+                      .filter(customer_id=customer_id)
+                      .order_by('-transfer_time', '-identifier')[:config['DEPTH']])
+
+        buffer = RingBuffer(config['DEPTH'], version, complete=len(latest) < config['DEPTH'])
+        categories, methods = _codes('category'), _codes('transfer_method')
+        try:
+            for row in reversed(latest):
+                buffer.append(row, categories, methods)
+        except ValueError:
+            return None
+
+        self._store(customer_id, buffer, config)
+        return buffer
+
+    def get(self, customer_id):
+        """ Fresh buffer of a customer, loaded from the database when missing
+        or stale.
+
+        Returns:
+            RingBuffer, None if the cache is disabled or the customer's
+                transactions cannot be buffered.
+        """
+        config = get_config()
+        if not config['ENABLED']:
+            return None
+
+        with self._lock:
+            buffer = self.buffers.get(customer_id)
+            if buffer is not None:
+                self.buffers.move_to_end(customer_id)
+
+        if buffer is not None and buffer.version == cache.get(self.version_key(customer_id)):
+            return buffer
+
+        return self._load(customer_id, config)
+
+    def record(self, transaction):
+        """ Write a new transaction through to the buffer of its customer and
+        bump the customer's version so other workers reload theirs."""
+        config = get_config()
+        if not config['ENABLED']:
+            return
+
+        customer_id = transaction.customer_id
+        key = self.version_key(customer_id)
+        cache.add(key, int(time.time() * 1000), config['VERSION_TTL'])
+        version = cache.incr(key)
+
+        with self._lock:
+            buffer = self.buffers.get(customer_id)
+            if buffer is None:
+                return
+            if buffer.version != version - 1:
+                self._drop(customer_id)
+                return
+
+            try:
+                buffer.append(transaction, _codes('category'), _codes('transfer_method'))
+            except ValueError:
+                self._drop(customer_id)
+                return
+            buffer.version = version
+
+    def clear(self):
+        with self._lock:
+            self.buffers.clear()
+            self.nbytes = 0
+
+
+hot_cache = HotCache()
+
+
+def recent(customer_id, count):
+    """ Newest transactions of a customer from the hot cache.
+
+    Args:
+        customer_id: str, Customer identifier.
+        count: int, Number of transactions.
+
+    Returns:
+        list, Up to count transactions newest first, None if the cache
+            cannot answer.
+    """
+    buffer = hot_cache.get(customer_id)
+    if buffer is None or (buffer.size < count and not buffer.complete):
+        return None
+    return buffer.rows(customer_id, _codes('category'), _codes('transfer_method'), count)
+
+
+def since(customer_id, start):
+    """ Transactions of a customer since a date from the hot cache.
+
+    Args:
+        customer_id: str, Customer identifier.
+        start: datetime.date, First day included.
+
+    Returns:
+        list, Transactions newest first, None if the cache does not reach back to start.
+    """
+    buffer = hot_cache.get(customer_id)
+    if buffer is None:
+        return None
+
+    start = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    if not buffer.complete and (buffer.size == 0 or buffer.oldest_time() >= start):
+        return None
+
+    rows = buffer.rows(customer_id, _codes('category'), _codes('transfer_method'))
+    return [row for row in rows if row.transfer_time >= start]
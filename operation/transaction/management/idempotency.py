@@ -0,0 +1,134 @@
+import datetime
+import functools
+import hashlib
+import json
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from requests.exceptions import ConnectTimeout
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from operation.util.remote import DependencyUnavailable
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+# Request attribute holding the key and owner of the request's record.
+CLAIM = '_idempotency_claim'
+
+# Failures raised before a request leaves this service.
+NOT_SENT = (DependencyUnavailable, ConnectTimeout)
+
+
+class Superseded(Exception):
+    """ Raised by mark_started when another request took over the key."""
+
+
+class ResponseEncoder(JSONEncoder):
+    """ Stored responses may hold exceptions, keep their message."""
+    def default(self, obj):
+        try:
+            return super().default(obj)
+        except TypeError:
+            return str(obj)
+
+
+def _digest(*parts):
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+def mark_started(request):
+    """ Mark the point after which the action may have had an effect,
+    such as a transfer on the customer service. A started key is never
+    taken over and failures past this point keep it, so retries can not
+    apply the effect twice.
+
+    Raises:
+        Superseded, The key was taken over by another request, the action
+            must stop without an effect.
+    """
+    claim = getattr(request, CLAIM, None)
+    if claim is None:
+        return
+
+    key, owner = claim
+    record_model = apps.get_model('transaction', 'IdempotencyKey')
+    if not record_model.objects.filter(key=key, owner=owner).update(started=True):
+        raise Superseded
+
+
+def idempotent(view_method):
+    """ Make a viewset action safe to retry with an Idempotency-Key header.
+
+    The first request with a key is processed and its response is stored,
+    repeated requests with the same key get the stored response without
+    running the action again. Keys are scoped to the Authorization header
+    and expire after settings.IDEMPOTENCY_KEY_TTL hours. A key without an
+    outcome for settings.IDEMPOTENCY_KEY_LEASE seconds that has not been
+    marked started belongs to a crashed worker and is taken over by the
+    next request.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        record_model = apps.get_model('transaction', 'IdempotencyKey')
+        scoped_key = _digest(request.META.get('HTTP_AUTHORIZATION') or '', key)
+        fingerprint = _digest(request.method, request.path,
+                              json.dumps(request.data, sort_keys=True, cls=ResponseEncoder))
+        owner = uuid.uuid4()
+        now = timezone.now()
+        ttl = datetime.timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24))
+        lease = datetime.timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 60))
+
+        record_model.objects.filter(key=scoped_key, expires__lte=now).delete()
+        record, created = record_model.objects.get_or_create(
+            key=scoped_key, defaults={'fingerprint': fingerprint, 'expires': now + ttl, 'owner': owner})
+
+        if not created:
+            if record.fingerprint != fingerprint:
+                return Response({'error': 'Idempotency-Key was used for a different request.'},
+                                status=422)
+            if record.status_code is not None:
+                return Response(json.loads(record.response), status=record.status_code,
+                                headers={'Idempotent-Replayed': 'true'})
+
+            abandoned = record_model.objects \
+                .filter(key=scoped_key, status_code__isnull=True, started=False, created__lte=now - lease) \
+                .update(created=now, owner=owner)
+            if not abandoned:
+                return Response({'error': 'A request with this Idempotency-Key is in progress.'},
+                                status=409, headers={'Retry-After': '1'})
+
+        setattr(request, CLAIM, (scoped_key, owner))
+        claimed = record_model.objects.filter(key=scoped_key, owner=owner)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Superseded:
+            return Response({'error': 'A request with this Idempotency-Key is in progress.'},
+                            status=409, headers={'Retry-After': '1'})
+        except Exception as exc:
+            if isinstance(exc, NOT_SENT):
+                claimed.delete()
+            else:
+                claimed.filter(started=False).delete()
+                claimed.update(status_code=500,
+                               response=json.dumps({'error': 'The request failed after it may have been applied,'
+                                                             ' check before retrying with a new key.'}))
+            raise
+
+        # Server errors before the action had an effect are not final, let the client retry them.
+        if response.status_code >= 500:
+            claimed.filter(started=False).delete()
+
+        claimed.update(status_code=response.status_code,
+                       response=json.dumps(response.data, cls=ResponseEncoder))
+
+        return response
+
+    return wrapper
@@ -1,19 +1,27 @@
+import math
 import os
 from decimal import Decimal
 
 import requests
 from django.core.exceptions import ValidationError
+from django.apps import apps
+from django.db import IntegrityError
+from django.db.transaction import atomic, on_commit
 from django.db.models import Manager
+from django.utils import timezone
 
+from operation.util import remote
+from . import hotcache, sharding
 from .secret_constants import APIConsts
 from requests.exceptions import HTTPError
 
 
 class TransactionManager(Manager):
     def create(self, customer_id, amount,
-               category, transfer_method, token=None):
+               category, transfer_method, token=None, balance=None):
         """ Create a new transaction, checks if the customer_id exists
-        before saving to db.
+        before saving to db. The transaction and its change feed entry
+        are written in the same database transaction.
 
         Args:
             customer_id: str, Customer identifier, pk.
@@ -21,25 +29,26 @@ class TransactionManager(Manager):
             category: str, Category of transaction.
             transfer_method: str, Method of transfer.
             token: str, OAuth token.
+            balance: Decimal, Balance after a transfer the customer service
+                already made, the transfer is not made again.
 
         Returns:
-            None
+            Transaction, The saved transaction with its anomaly score.
         """
         amount = Decimal(amount)
         if amount == 0:
             raise ValidationError
 
-        balance = 0
-        if not APIConsts.TESTING.value:
-            url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, 'transfer', '')
-            data = {'amount': amount, 'customer_id': customer_id}
+        if balance is None:
+            balance = 0
+            if not APIConsts.TESTING.value:
+                url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, 'transfer', '')
+                data = {'amount': amount, 'customer_id': customer_id}
 
-            headers = {'Authorization': token} if token else {}
-
-            response = requests.post(url=url, data=data, headers=headers)
-            if response.status_code != requests.codes.ok:
-                raise HTTPError(response)
-            balance = str(response.json()['balance'])
+                response = remote.post(url=url, service='customer', data=data, token=token)
+                if response.status_code != requests.codes.ok:
+                    raise HTTPError(response)
+                balance = str(remote.payload(response)['balance'])
 
         if category == 'INCOME' and amount < 0:
             category = 'MISC'
@@ -50,4 +59,119 @@ class TransactionManager(Manager):
                                  transfer_method=transfer_method, customer_id=customer_id,
                                  balance_after=balance)
         transaction.full_clean()
-        transaction.save()
+
+        outbox = apps.get_model('transaction', 'TransactionOutbox')
+        spending_stats = apps.get_model('transaction', 'SpendingStats')
+        shard = sharding.shard_for(customer_id)
+        with atomic(using=shard):
+            stats = spending_stats.objects.db_manager(shard)
+            transaction.anomaly_score = stats.observe(customer_id, category, amount)
+            transaction.save(using=shard)
+            outbox.objects.db_manager(shard).create(transaction=transaction)
+
+        on_commit(lambda: hotcache.hot_cache.record(transaction), using=shard)
+
+        return transaction
+
+
+class SpendingStatsManager(Manager):
+    # Transactions seen in a category before they are scored.
+    MIN_COUNT = 5
+    # Applied to the recent maximum on every transaction.
+    RECENT_MAX_DECAY = 0.95
+    # Lower bound of the deviation, keeps scores finite for constant amounts.
+    MIN_DEVIATION = 0.01
+
+    def observe(self, customer_id, category, amount):
+        """ Score a transaction against the customer's running statistics of
+        its category, then add it to them with Welford's method. Must run in
+        the transaction that saves it, the statistics row stays locked until
+        it commits.
+
+        Args:
+            customer_id: str, Customer identifier.
+            category: str, Category of transaction.
+            amount: Decimal, Amount of transaction.
+
+        Returns:
+            float, Deviations of the amount from the category mean, None while
+                the category has too little history.
+        """
+        value = float(abs(amount))
+        stats, _ = self.select_for_update().get_or_create(customer_id=customer_id, category=category)
+
+        score = None
+        if stats.count >= self.MIN_COUNT:
+            deviation = max(math.sqrt(stats.m2 / (stats.count - 1)), self.MIN_DEVIATION)
+            score = round((value - stats.mean) / deviation, 4)
+
+        stats.count += 1
+        delta = value - stats.mean
+        stats.mean += delta / stats.count
+        stats.m2 += delta * (value - stats.mean)
+        stats.recent_max = max(value, stats.recent_max * self.RECENT_MAX_DECAY)
+        stats.save(update_fields=['count', 'mean', 'm2', 'recent_max'])
+
+        return score
+
+
+class CustomerAttributesManager(Manager):
+    def apply(self, customer_id, occupation_type, birth_year, updated_at):
+        """ Apply a change pushed by the customer service, changes older than
+        the stored projection are ignored.
+
+        Args:
+            customer_id: str, Customer identifier.
+            occupation_type: str, Type of occupation.
+            birth_year: int, Year of birth.
+            updated_at: datetime, Time of the change on the customer service.
+
+        Returns:
+            bool, True if the projection changed.
+        """
+        values = {'occupation_type': occupation_type,
+                  'birth_year': birth_year,
+                  'updated_at': updated_at}
+
+        if self.filter(customer_id=customer_id, updated_at__lt=updated_at).update(**values):
+            return True
+
+        try:
+            with atomic(using=self.db):
+                _, created = self.get_or_create(customer_id=customer_id, defaults=values)
+        except IntegrityError:
+            return self.filter(customer_id=customer_id,
+                               updated_at__lt=updated_at).update(**values) > 0
+
+        return created
+
+    def replace(self, rows):
+        """ Replace projections in bulk, used by full resync. Like apply, rows
+        older than the stored projection are ignored, the stored row is only
+        marked as synced.
+
+        Args:
+            rows: list, dicts with customer_id, occupation_type, birth_year and updated_at.
+
+        Returns:
+            int, Number of projections replaced.
+        """
+        customer_ids = [row['customer_id'] for row in rows]
+
+        with atomic(using=self.db):
+            stored = dict(self.select_for_update()
+                          .filter(customer_id__in=customer_ids)
+                          .values_list('customer_id', 'updated_at'))
+            newer = [row for row in rows
+                     if row['customer_id'] not in stored or stored[row['customer_id']] < row['updated_at']]
+            newer_ids = [row['customer_id'] for row in newer]
+
+            self.filter(customer_id__in=newer_ids).delete()
+            self.bulk_create([self.model(**row) for row in newer])
+
+            # Kept projections were still seen by the resync.
+            self.filter(customer_id__in=customer_ids) \
+                .exclude(customer_id__in=newer_ids) \
+                .update(synced_at=timezone.now())
+
+        return len(newer)
@@ -1,6 +1,101 @@
-from rest_framework.pagination import CursorPagination
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
 
 
 class TransactionPaginator(CursorPagination):
-    ordering = '-transfer_time'
+    """ Keyset pagination on (transfer_time, identifier). Positions hold both
+    values, so pages stay stable when many transactions share a transfer_time
+    and can be served by index range scans."""
+    ordering = ('-transfer_time', '-identifier')
     page_size = 10
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        time_ordering = ordering[0] if ordering[0].lstrip('-') == 'transfer_time' else self.ordering[0]
+        direction = '-' if time_ordering.startswith('-') else ''
+        return time_ordering, direction + 'identifier'
+
+    @staticmethod
+    def _position(transaction):
+        return '{}|{}'.format(transaction.transfer_time.isoformat(), transaction.identifier)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor.reverse if self.cursor else False
+        current_position = self.cursor.position if self.cursor else None
+        descending = self.ordering[0].startswith('-')
+
+        if reverse:
+            order = [field[1:] if field.startswith('-') else '-' + field for field in self.ordering]
+        else:
+            order = list(self.ordering)
+        queryset = queryset.order_by(*order)
+
+        if current_position is not None:
+            transfer_time, _, identifier = current_position.partition('|')
+            transfer_time = parse_datetime(transfer_time)
+            if transfer_time is None or not identifier:
+                raise NotFound(self.invalid_cursor_message)
+
+            lookup = 'lt' if descending != reverse else 'gt'
+            queryset = queryset.filter(
+                Q(**{'transfer_time__' + lookup: transfer_time}) |
+                Q(**{'transfer_time': transfer_time, 'identifier__' + lookup: identifier}))
+
+        return self._paginate(list(queryset[:self.page_size + 1]), current_position, reverse)
+
+    def paginate_rows(self, rows, request, view=None):
+        """ First page from rows already in the default ordering, such as
+        the newest transactions of a customer from the hot cache.
+
+        Args:
+            rows: list, Up to page_size + 1 transactions.
+            request: Request, Current request.
+
+        Returns:
+            list, Transactions on the page.
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = None
+
+        return self._paginate(rows, None, False)
+
+    def _paginate(self, results, current_position, reverse):
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = current_position is not None
+
+        if self.page:
+            self.next_position = self._position(self.page[-1])
+            self.previous_position = self._position(self.page[0])
+        else:
+            self.next_position = self.previous_position = current_position
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
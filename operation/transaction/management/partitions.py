@@ -0,0 +1,193 @@
+""" Monthly range partitioning of the transaction table on transfer_time.
+
+Requires PostgreSQL 11 or later. Partitions are named after the table and
+the month, rows outside every partition land in the default partition.
+The partitioned table has a primary key on (identifier, transfer_time), so
+identifiers are no longer enforced unique across months by the database.
+"""
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+from django.conf import settings
+from django.db.transaction import atomic
+
+from . import sampling
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Future months that always have a partition.
+    'MONTHS_AHEAD': 3,
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'TRANSACTION_PARTITIONING', {}))
+
+
+def _model():
+    return apps.get_model('transaction', 'Transaction')
+
+
+def _table():
+    return _model()._meta.db_table
+
+
+def partition_name(month):
+    return '{}_{:%Y_%m}'.format(_table(), month)
+
+
+def default_name():
+    return '{}_default'.format(_table())
+
+
+def _bounds(month):
+    return '{:%Y-%m-%d} 00:00:00+00'.format(month), \
+           '{:%Y-%m-%d} 00:00:00+00'.format(month + relativedelta(months=1))
+
+
+def _exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table '
+                       'WHERE partrelid = to_regclass(%s))', [_table()])
+        return cursor.fetchone()[0]
+
+
+def partitions(connection):
+    """ Names of the attached monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT child.relname FROM pg_inherits '
+                       'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                       'WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname',
+                       [_table()])
+        return [name for name, in cursor.fetchall() if name != default_name()]
+
+
+def create_partition(connection, month):
+    """ Attach the partition of a month, rows of the month that went to the
+    default partition are moved into it.
+
+    Args:
+        connection: Database connection.
+        month: datetime.date, First day of the month.
+
+    Returns:
+        bool, True if the partition was created.
+    """
+    table, name = _table(), partition_name(month)
+    start, end = _bounds(month)
+    quote = connection.ops.quote_name
+
+    with atomic(using=connection.alias), connection.cursor() as cursor:
+        if _exists(cursor, name):
+            return False
+
+        cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                       .format(quote(name), quote(table)))
+        if _exists(cursor, default_name()):
+            cursor.execute('WITH moved AS (DELETE FROM {} WHERE transfer_time >= %s AND transfer_time < %s '
+                           'RETURNING *) INSERT INTO {} SELECT * FROM moved'
+                           .format(quote(default_name()), quote(name)), [start, end])
+        cursor.execute('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)'
+                       .format(quote(table), quote(name)), [start, end])
+
+    return True
+
+
+def ensure_partitions(connection, months_ahead=None):
+    """ Create the partitions of the current month and the months ahead.
+
+    Returns:
+        list, Names of the partitions created.
+    """
+    if months_ahead is None:
+        months_ahead = get_config()['MONTHS_AHEAD']
+
+    today = datetime.date.today()
+    month = datetime.date(today.year, today.month, 1)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        if create_partition(connection, month + relativedelta(months=offset)):
+            created.append(partition_name(month + relativedelta(months=offset)))
+    return created
+
+
+def convert(connection, months_ahead=None):
+    """ Rebuild the transaction table as a partitioned table, with one
+    partition per month from the oldest transaction to the months ahead.
+    Takes an exclusive lock on the table until the copy is done.
+
+    A partitioned key must include the partition column, so the primary key
+    becomes (identifier, transfer_time) and the database no longer enforces
+    identifier alone to be unique, see Transaction.identifier.
+    """
+    model = _model()
+    table = _table()
+    original = '{}_unpartitioned'.format(table)
+    quote = connection.ops.quote_name
+
+    with atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT min(transfer_time) FROM {}'.format(quote(table)))
+            oldest = cursor.fetchone()[0]
+
+            cursor.execute('ALTER TABLE {} RENAME TO {}'.format(quote(table), quote(original)))
+            cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE (transfer_time)'
+                           .format(quote(table), quote(original)))
+            cursor.execute('CREATE TABLE {} PARTITION OF {} DEFAULT'
+                           .format(quote(default_name()), quote(table)))
+
+        if oldest is not None:
+            month = datetime.date(oldest.year, oldest.month, 1)
+            while month <= datetime.date.today():
+                create_partition(connection, month)
+                month += relativedelta(months=1)
+        ensure_partitions(connection, months_ahead)
+
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(quote(table), quote(original)))
+            cursor.execute('DROP TABLE {}'.format(quote(original)))
+
+            # Keys and indexes are built once the rows are in, the old ones went with the old table.
+            cursor.execute('ALTER TABLE {} ADD PRIMARY KEY (identifier, transfer_time)'.format(quote(table)))
+
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for index in model._meta.indexes:
+                schema_editor.add_index(model, index)
+            # The pattern index Django made for the varchar key, under the name migrations expect.
+            schema_editor.execute(schema_editor._create_like_index_sql(model, model._meta.get_field('identifier')))
+        sampling.ensure_indexes(connection)
+
+
+def detach(connection, month, drop=False):
+    """ Detach the partition of a month, its rows leave the transaction table.
+
+    Args:
+        connection: Database connection.
+        month: datetime.date, First day of the month.
+        drop: bool, Drop the detached table as well.
+
+    Returns:
+        str, Name of the detached table, None if the month has no partition.
+    """
+    name = partition_name(month)
+    quote = connection.ops.quote_name
+
+    with atomic(using=connection.alias), connection.cursor() as cursor:
+        if name not in partitions(connection):
+            return None
+
+        cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(quote(_table()), quote(name)))
+        if drop:
+            cursor.execute('DROP TABLE {}'.format(quote(name)))
+
+    return name
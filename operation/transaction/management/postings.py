@@ -0,0 +1,255 @@
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal
+
+import requests
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from requests.exceptions import ConnectionError, HTTPError, RequestException
+
+from operation.util import remote
+from operation.util.remote import DependencyUnavailable
+from .secret_constants import APIConsts
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Post every create asynchronously, clients can also ask with Prefer: respond-async.
+    'ASYNC': False,
+    # Seconds before a customer's queue is retried after the customer service was unreachable.
+    'RETRY_DELAY': 5,
+}
+
+# First key of the advisory locks, keeps them apart from other locks in the database.
+LOCK_NAMESPACE = 4701
+
+
+class Retry(Exception):
+    """ Raised when a posting could not be sent to the customer service or
+    its outcome is still unknown, it stays first in the customer's queue
+    until it is retried."""
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'TRANSACTION_POSTING', {}))
+
+
+def is_async(request):
+    """ Whether a create request is posted asynchronously.
+
+    Args:
+        request: Request, Create request.
+
+    Returns:
+        bool, True if the mode is on or the request has Prefer: respond-async.
+    """
+    if get_config()['ASYNC']:
+        return True
+
+    preferences = request.META.get('HTTP_PREFER', '').split(',')
+    return any(preference.partition(';')[0].strip().lower() == 'respond-async'
+               for preference in preferences)
+
+
+@contextmanager
+def customer_lock(customer_id):
+    """ Hold the advisory lock of a customer for the session, only one worker
+    applies a customer's postings at a time."""
+    key = zlib.crc32(customer_id.encode('utf-8')) - 2 ** 31
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s, %s)', [LOCK_NAMESPACE, key])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [LOCK_NAMESPACE, key])
+
+
+def enqueue(customer_id, amount, category, transfer_method):
+    """ Accept a transaction for asynchronous posting.
+
+    Args:
+        customer_id: str, Customer identifier.
+        amount: str, Amount of transaction.
+        category: str, Category of transaction.
+        transfer_method: str, Method of transfer.
+
+    Returns:
+        Posting, The queued posting.
+    """
+    posting_model = apps.get_model('transaction', 'Posting')
+    return posting_model.objects.create(customer_id=customer_id, amount=amount,
+                                        category=category, transfer_method=transfer_method)
+
+
+def retry_after(response):
+    """ Seconds asked by a Retry-After header, None without one."""
+    try:
+        return int(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def current_balance(customer_id):
+    """ Balance of the customer on the customer service.
+
+    Returns:
+        Decimal, The balance, None when the customer does not exist.
+
+    Raises:
+        Retry, The customer service could not be reached or is busy.
+    """
+    if APIConsts.TESTING.value:
+        return Decimal(0)
+
+    url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, customer_id, 'basic', '')
+    try:
+        response = remote.get(url, 'customer', token=APIConsts.SERVICE_TOKEN.value)
+    except RequestException as exc:
+        raise Retry(str(exc), getattr(exc, 'retry_after', None)) from exc
+
+    if response.status_code == requests.codes.not_found:
+        return None
+    if response.status_code != requests.codes.ok:
+        raise Retry('Customer service answered {}.'.format(response.status_code), retry_after(response))
+
+    return Decimal(remote.payload(response)['balance'])
+
+
+def reconcile(posting):
+    """ Settle a posting whose transfer has an unknown outcome by comparing
+    the customer's balance with the balance before the transfer. Postings
+    of a customer are applied one at a time, so the balance moved by the
+    amount if and only if the transfer was made, unless a synchronous
+    transfer of the customer ran meanwhile. Then the posting is left
+    UNKNOWN to be reconciled by hand.
+
+    Args:
+        posting: Posting, UNKNOWN posting with a balance_before.
+
+    Raises:
+        Retry, The customer service could not be reached.
+    """
+    posting_model = apps.get_model('transaction', 'Posting')
+    transaction_model = apps.get_model('transaction', 'Transaction')
+
+    balance = current_balance(posting.customer_id)
+    if balance == posting.balance_before + posting.amount:
+        posting.transaction = transaction_model.objects.create(customer_id=posting.customer_id,
+                                                               amount=posting.amount,
+                                                               category=posting.category,
+                                                               transfer_method=posting.transfer_method,
+                                                               balance=balance)
+        posting.status = posting_model.POSTED
+        posting.error = ''
+    elif balance == posting.balance_before:
+        posting.status = posting_model.QUEUED
+    else:
+        logger.warning('Posting {} can not be reconciled, balance is {}.'.format(posting.tracking_id, balance))
+        posting.error = 'Balance changed by another transfer, reconcile by hand.'
+
+    posting.balance_before = None
+    posting.save(update_fields=['status', 'error', 'transaction', 'balance_before', 'updated'])
+
+
+def apply_pending(customer_id):
+    """ Apply the queued postings of a customer, oldest first. Every posting
+    is committed on its own, a worker that picks up a customer's queue
+    drains postings queued by other requests too.
+
+    Failures that mean the transfer was not made are retried. The balance
+    of the customer is read before every transfer, a posting whose transfer
+    may have been made, after a read timeout or a gateway error, is marked
+    UNKNOWN and reconciled against it before the customer's next posting
+    is applied.
+
+    Args:
+        customer_id: str, Customer identifier.
+
+    Returns:
+        int, Number of postings posted, failed or reconciled.
+
+    Raises:
+        Retry, The customer service could not be reached or answered that
+            it is busy, or a posting waits to be reconciled.
+    """
+    posting_model = apps.get_model('transaction', 'Posting')
+    transaction_model = apps.get_model('transaction', 'Transaction')
+
+    done = 0
+    with customer_lock(customer_id):
+        while True:
+            unknown = posting_model.objects.filter(customer_id=customer_id, status=posting_model.UNKNOWN,
+                                                   balance_before__isnull=False).order_by('sequence').first()
+            if unknown is not None:
+                reconcile(unknown)
+                done += 1
+                continue
+
+            posting = posting_model.objects.filter(customer_id=customer_id,
+                                                   status=posting_model.QUEUED).order_by('sequence').first()
+            if posting is None:
+                return done
+
+            # The base a transfer with an unknown outcome is reconciled against,
+            # nothing is sent while it can not be read.
+            balance_before = current_balance(customer_id)
+            if balance_before is None:
+                posting.status = posting_model.FAILED
+                posting.error = 'Customer does not exist.'
+                posting.save(update_fields=['status', 'error', 'updated'])
+                done += 1
+                continue
+
+            posting.attempts += 1
+            try:
+                transaction = transaction_model.objects.create(customer_id=posting.customer_id,
+                                                               amount=posting.amount,
+                                                               category=posting.category,
+                                                               transfer_method=posting.transfer_method,
+                                                               token=APIConsts.SERVICE_TOKEN.value)
+            except (DependencyUnavailable, ConnectionError) as exc:
+                posting.save(update_fields=['attempts', 'updated'])
+                raise Retry(str(exc), getattr(exc, 'retry_after', None)) from exc
+            except HTTPError as he:
+                response = he.args[0]
+                status_code = getattr(response, 'status_code', None)
+                if status_code in (429, 503):
+                    # Throttled or shedding load, the transfer was not made.
+                    posting.save(update_fields=['attempts', 'updated'])
+                    raise Retry('Customer service answered {}.'.format(status_code), retry_after(response)) from he
+
+                posting.error = getattr(response, 'text', str(he))
+                if status_code is not None and status_code >= 500:
+                    posting.status = posting_model.UNKNOWN
+                    posting.balance_before = balance_before
+                else:
+                    posting.status = posting_model.FAILED
+            except ValidationError as ve:
+                logger.warning(ve)
+                posting.status = posting_model.FAILED
+                posting.error = str(ve)
+            except RequestException as exc:
+                # Sent but not answered, the transfer may have been made.
+                logger.warning(exc)
+                posting.status = posting_model.UNKNOWN
+                posting.balance_before = balance_before
+                posting.error = str(exc)
+            else:
+                posting.status = posting_model.POSTED
+                posting.transaction = transaction
+
+            posting.save(update_fields=['status', 'error', 'transaction', 'balance_before', 'attempts', 'updated'])
+            done += 1
+
+            if posting.status == posting_model.UNKNOWN:
+                # Give the customer service time to finish before reconciling.
+                raise Retry('Posting {} has an unknown outcome.'.format(posting.tracking_id))
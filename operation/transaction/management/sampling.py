@@ -0,0 +1,51 @@
+""" Reproducible samples of the transaction table on the random bits of ids.
+
+Django 2.0 models can not declare expression indexes, so the indexes on the
+random bits are created after migrations run. Filters must use sample_bits
+so PostgreSQL matches them against the indexed expression.
+"""
+from django.apps import apps
+from django.db.models import BigIntegerField
+from django.db.models.functions import Cast
+
+from operation.util import auxiliary
+
+# Id fields a sample can be drawn on, each has its own index.
+FIELDS = ('identifier', 'customer_id')
+
+
+def sample_bits(field):
+    """ The random bits of an id field, the indexed expression.
+
+    Args:
+        field: str, One of FIELDS.
+
+    Returns:
+        Expression, (field::bigint & RANDOM_MASK).
+    """
+    return Cast(field, BigIntegerField()).bitand(auxiliary.RANDOM_MASK)
+
+
+def sample(queryset, field, threshold):
+    """ Keep the rows whose random bits fall under threshold."""
+    return queryset.annotate(sample_bits=sample_bits(field)).filter(sample_bits__lt=threshold)
+
+
+def index_name(field):
+    return 'transaction_{}_sample'.format(field)
+
+
+def ensure_indexes(connection):
+    """ Create the sample indexes, ordered by transfer_time after the bits
+    so a sampled month is read as a range scan.
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    table = apps.get_model('transaction', 'Transaction')._meta.db_table
+    quote = connection.ops.quote_name
+
+    with connection.cursor() as cursor:
+        for field in FIELDS:
+            cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} ((({})::bigint & {:d}), transfer_time)'
+                           .format(quote(index_name(field)), quote(table), quote(field), auxiliary.RANDOM_MASK))
@@ -0,0 +1,190 @@
+import bisect
+import hashlib
+import heapq
+import itertools
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULTS = {
+    # Aliases in settings.DATABASES that transactions are spread over.
+    'DATABASES': ['default'],
+    # Points of each database on the hash ring, more points spread customers more evenly.
+    'VIRTUAL_NODES': 100,
+    # Rows a shard reader fetches at a time during a scatter/gather read.
+    'CHUNK_SIZE': 500,
+    # Chunks a shard reader may buffer ahead of the merge.
+    'BUFFER': 4,
+}
+
+# Models holding rows of a single customer, stored on the customer's shard.
+SHARDED_MODELS = {'transaction', 'transactionoutbox', 'spendingstats', 'statement'}
+# Models copied to every shard so sharded queries can join them.
+REPLICATED_MODELS = {'customerattributes'}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'TRANSACTION_SHARDING', {}))
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """ Consistent hash ring, adding or removing a database only moves the
+    keys of the ring segments it takes or gives up."""
+    def __init__(self, nodes, virtual_nodes):
+        points = sorted((_hash('{}#{}'.format(node, replica)), node)
+                        for node in nodes for replica in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+_ring = None
+_ring_lock = threading.Lock()
+
+
+def get_ring():
+    global _ring
+
+    config = get_config()
+    key = (tuple(config['DATABASES']), config['VIRTUAL_NODES'])
+    with _ring_lock:
+        if _ring is None or _ring[0] != key:
+            _ring = (key, HashRing(*key))
+        return _ring[1]
+
+
+def databases():
+    """ Aliases of the shards."""
+    return list(get_config()['DATABASES'])
+
+
+def replicas():
+    """ Aliases holding a copy of the replicated models, the shards and default."""
+    return ['default'] + [alias for alias in databases() if alias != 'default']
+
+
+def is_sharded():
+    return len(databases()) > 1
+
+
+def shard_for(customer_id):
+    """ Alias of the shard holding a customer's transactions."""
+    return get_ring().get(str(customer_id))
+
+
+class ShardRouter:
+    """ Routes saved instances of the sharded models to the shard of their
+    customer. Queries have no customer to route by, they pick the shard
+    with using(shard_for(customer_id)) or read every shard with gather.
+    """
+    def _route(self, model, **hints):
+        if model._meta.app_label != 'transaction' or model._meta.model_name not in SHARDED_MODELS:
+            return None
+
+        customer_id = getattr(hints.get('instance'), 'customer_id', None)
+        return shard_for(customer_id) if customer_id is not None else None
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """ Relations to sharded models have no database constraint, a
+        posting on default may point at a transaction on any shard."""
+        labels = {obj1._meta.app_label, obj2._meta.app_label}
+        models = {obj1._meta.model_name, obj2._meta.model_name}
+        if labels == {'transaction'} and models & SHARDED_MODELS:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'transaction' and model_name in SHARDED_MODELS:
+            return db in databases()
+        if app_label == 'transaction' and model_name in REPLICATED_MODELS:
+            return db in replicas()
+        if db != 'default' and db in databases():
+            return False
+        return None
+
+
+class ShardReader(threading.Thread):
+    """ Reads a queryset on one shard into a bounded buffer, shards are read
+    in parallel while their rows are merged."""
+    DONE = object()
+
+    def __init__(self, queryset, alias, config):
+        super().__init__(daemon=True)
+        self.queryset = queryset.using(alias)
+        self.alias = alias
+        self.chunk_size = config['CHUNK_SIZE']
+        self.chunks = queue.Queue(maxsize=config['BUFFER'])
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            rows = self.queryset.iterator()
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if not chunk or not self._put(chunk):
+                    break
+            self._put(self.DONE)
+        except Exception as exc:
+            self._put(exc)
+        finally:
+            connections[self.alias].close()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stop(self):
+        self.stopped.set()
+
+    def __iter__(self):
+        while True:
+            item = self.chunks.get()
+            if item is self.DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+
+def gather(queryset, key):
+    """ Read a queryset on every shard in parallel and merge the rows.
+
+    Args:
+        queryset: QuerySet, Query ordered by the merge key.
+        key: callable, Merge key of a row.
+
+    Returns:
+        generator, Rows of every shard in key order.
+    """
+    aliases = databases()
+    if len(aliases) == 1:
+        yield from queryset.using(aliases[0]).iterator()
+        return
+
+    config = get_config()
+    readers = [ShardReader(queryset, alias, config) for alias in aliases]
+    for reader in readers:
+        reader.start()
+
+    try:
+        yield from heapq.merge(*readers, key=key)
+    finally:
+        for reader in readers:
+            reader.stop()
@@ -0,0 +1,119 @@
+import itertools
+from collections import defaultdict
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+
+
+def customer_ranges(month, count, using='default'):
+    """ Split the customers with transactions in a month into ranges of
+    about the same number of customers.
+
+    Args:
+        month: datetime.date, First day of the month.
+        count: int, Number of ranges.
+        using: str, Alias of the shard.
+
+    Returns:
+        list, Tuples of the first customer_id of a range and the first
+            customer_id of the next one, None for the last range.
+    """
+    transaction = apps.get_model('transaction', 'Transaction')
+    customer_ids = list(transaction.objects
+                        .using(using)
+                        .filter(transfer_time__gte=month,
+                                transfer_time__lt=month + relativedelta(months=1))
+                        .order_by('customer_id')
+                        .values_list('customer_id', flat=True)
+                        .distinct())
+    if not customer_ids:
+        return []
+
+    size = max(1, -(-len(customer_ids) // count))
+    lows = customer_ids[::size]
+    return list(zip(lows, lows[1:] + [None]))
+
+
+def summarize(rows):
+    """ Totals and breakdowns of one customer's transactions.
+
+    Args:
+        rows: iterable, Tuples of identifier, amount, category and transfer_method.
+
+    Returns:
+        dict, Statement fields.
+    """
+    total_spending = Decimal('0')
+    total_income = Decimal('0')
+    methods = defaultdict(Decimal)
+    spending = defaultdict(Decimal)
+    history = []
+
+    for identifier, amount, category, transfer_method in rows:
+        history.append(identifier)
+        if amount < 0:
+            total_spending -= amount
+            methods[transfer_method] -= amount
+            spending[category] -= amount
+        else:
+            total_income += amount
+
+    return {
+        'total_spending': total_spending,
+        'total_income': total_income,
+        'transfer_methods': {key: str(value) for key, value in methods.items()},
+        'spending': {key: str(value) for key, value in spending.items()},
+        'history': history,
+    }
+
+
+def build(month, low, high=None, batch_size=1000, using='default'):
+    """ Build the missing statements of a month for a range of customers.
+    Existing statements are never rebuilt.
+
+    Args:
+        month: datetime.date, First day of the month.
+        low: str, First customer_id of the range.
+        high: str, customer_id the range stops before, None for no bound.
+        batch_size: int, Statements inserted per query.
+        using: str, Alias of the shard holding the customers.
+
+    Returns:
+        int, Number of statements created.
+    """
+    transaction = apps.get_model('transaction', 'Transaction')
+    statement = apps.get_model('transaction', 'Statement')
+
+    in_range = {'customer_id__gte': low}
+    if high is not None:
+        in_range['customer_id__lt'] = high
+
+    built = set(statement.objects.using(using).filter(month=month, **in_range).values_list('customer_id', flat=True))
+    previous = dict(statement.objects
+                    .using(using)
+                    .filter(month__lt=month, **in_range)
+                    .order_by('customer_id', '-month')
+                    .distinct('customer_id')
+                    .values_list('customer_id', 'pk'))
+
+    rows = transaction.objects \
+        .using(using) \
+        .filter(transfer_time__gte=month, transfer_time__lt=month + relativedelta(months=1), **in_range) \
+        .order_by('customer_id', 'transfer_time', 'identifier') \
+        .values_list('customer_id', 'identifier', 'amount', 'category', 'transfer_method') \
+        .iterator()
+
+    statements = (statement(customer_id=customer_id, month=month, previous_id=previous.get(customer_id),
+                            **summarize(row[1:] for row in group))
+                  for customer_id, group in itertools.groupby(rows, key=lambda row: row[0])
+                  if customer_id not in built)
+
+    created = 0
+    while True:
+        batch = list(itertools.islice(statements, batch_size))
+        if not batch:
+            return created
+        statement.objects.using(using).bulk_create(batch)
+        created += len(batch)
+
@@ -1,8 +1,11 @@
+import uuid
+
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.db import models
 from django.utils import timezone
 
 from operation.util import auxiliary
-from .management.managers import TransactionManager
+from .management.managers import CustomerAttributesManager, SpendingStatsManager, TransactionManager
 
 
 class Transaction(models.Model):
@@ -26,6 +29,8 @@ class Transaction(models.Model):
         ('INCOME', 'Income'),
     ]
 
+    # Once the table is partitioned the database only enforces (identifier, transfer_time)
+    # to be unique, identifiers rely on the random bits of auxiliary.make_id to not collide.
     identifier = models.CharField(max_length=20, unique=True,
                                   primary_key=True, default=auxiliary.make_id)
     customer_id = models.CharField(max_length=20, null=False,
@@ -41,7 +46,164 @@ class Transaction(models.Model):
                                          editable=False)
     transfer_method = models.CharField(max_length=30, choices=TRANSFER_METHODS)
 
+    # Deviation from the customer's usual amounts in the category, see SpendingStats.
+    anomaly_score = models.FloatField(null=True, blank=True, editable=False)
+
     objects = TransactionManager()
 
     class Meta:
         ordering = ['-transfer_time']
+        indexes = [
+            models.Index(fields=['customer_id', '-transfer_time', '-identifier'],
+                         name='transaction_customer_time'),
+            models.Index(fields=['-transfer_time', '-identifier'], name='transaction_time'),
+            models.Index(fields=['category', '-transfer_time'], name='transaction_category_time'),
+            models.Index(fields=['transfer_method', '-transfer_time'], name='transaction_method_time'),
+            models.Index(fields=['amount'], name='transaction_amount'),
+        ]
+
+
+class CustomerAttributes(models.Model):
+    """ Read-only projection of the customer attributes the transaction
+    service needs, pushed by the customer service."""
+    customer_id = models.CharField(max_length=20, primary_key=True)
+    occupation_type = models.CharField(max_length=20, null=False)
+    birth_year = models.IntegerField(null=False)
+
+    # Time of the change on the customer service, older pushes are ignored.
+    updated_at = models.DateTimeField(null=False)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    objects = CustomerAttributesManager()
+
+
+class TransactionOutbox(models.Model):
+    """ Append-only change feed of transactions. Entries are written in the
+    same database transaction as the transaction they point to."""
+    sequence = models.BigAutoField(primary_key=True)
+    transaction = models.ForeignKey(Transaction, on_delete=models.DO_NOTHING,
+                                    db_constraint=False, related_name='+')
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class FeedConsumer(models.Model):
+    """ Durable position of a change feed consumer, every shard has its
+    own outbox sequence and so its own position."""
+    name = models.CharField(max_length=50)
+    shard = models.CharField(max_length=50, default='default')
+    position = models.BigIntegerField(null=False, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('name', 'shard')
+
+
+class ArchivedMonth(models.Model):
+    """ Month of transactions moved out of the transaction table into
+    cold storage by the archive_transactions command."""
+    month = models.DateField(primary_key=True)
+    path = models.CharField(max_length=255, null=False)
+    rows = models.IntegerField(null=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['month']
+
+
+class IdempotencyKey(models.Model):
+    """ Outcome of a request made with an Idempotency-Key header."""
+    key = models.CharField(max_length=64, primary_key=True)
+    fingerprint = models.CharField(max_length=64, null=False)
+    # Request currently processing the key, changes when an abandoned key is taken over.
+    owner = models.UUIDField(null=True)
+    # Set once the action may have had an effect, the key is then never taken over.
+    started = models.BooleanField(default=False)
+    status_code = models.IntegerField(null=True)
+    response = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(null=False, db_index=True)
+
+
+class Statement(models.Model):
+    """ Immutable monthly statement of a customer, built after the month
+    closes by the build_statements command."""
+    customer_id = models.CharField(max_length=20, null=False)
+    month = models.DateField(null=False)
+
+    total_spending = models.DecimalField(decimal_places=2, max_digits=32)
+    total_income = models.DecimalField(decimal_places=2, max_digits=32)
+    transfer_methods = JSONField(default=dict)
+    spending = JSONField(default=dict)
+
+    # Identifiers of the month's transactions in transfer_time order.
+    history = ArrayField(models.CharField(max_length=20), default=list)
+    previous = models.ForeignKey('self', null=True, on_delete=models.SET_NULL, related_name='+')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('customer_id', 'month')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Statements are immutable.')
+        super().save(*args, **kwargs)
+
+
+class SpendingStats(models.Model):
+    """ Running statistics of a customer's transaction amounts in a category,
+    updated with every transaction to score it in constant time."""
+    customer_id = models.CharField(max_length=20, null=False)
+    category = models.CharField(max_length=30, choices=Transaction.SPENDING_CATEGORIES)
+
+    count = models.IntegerField(null=False, default=0)
+    mean = models.FloatField(null=False, default=0)
+    # Sum of squared deviations from the mean, Welford's M2.
+    m2 = models.FloatField(null=False, default=0)
+    recent_max = models.FloatField(null=False, default=0)
+
+    objects = SpendingStatsManager()
+
+    class Meta:
+        unique_together = ('customer_id', 'category')
+
+
+class Posting(models.Model):
+    """ Transaction accepted in the asynchronous posting mode. Workers apply
+    the postings of a customer in the order they were accepted."""
+    QUEUED = 'QUEUED'
+    POSTED = 'POSTED'
+    FAILED = 'FAILED'
+    # The transfer was sent but its outcome is not known, see postings.reconcile.
+    UNKNOWN = 'UNKNOWN'
+
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (POSTED, 'Posted'),
+        (FAILED, 'Failed'),
+        (UNKNOWN, 'Unknown'),
+    ]
+
+    sequence = models.BigAutoField(primary_key=True)
+    tracking_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    customer_id = models.CharField(max_length=20, null=False)
+
+    amount = models.DecimalField(decimal_places=2, max_digits=32)
+    category = models.CharField(max_length=30, choices=Transaction.SPENDING_CATEGORIES)
+    transfer_method = models.CharField(max_length=30, choices=Transaction.TRANSFER_METHODS)
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    transaction = models.ForeignKey(Transaction, null=True, on_delete=models.DO_NOTHING,
+                                    db_constraint=False, related_name='+')
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(null=False, default=0)
+    # Customer balance the transfer of an UNKNOWN posting is reconciled against,
+    # cleared when it has to be reconciled by hand.
+    balance_before = models.DecimalField(decimal_places=2, max_digits=32, null=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_id', 'status', 'sequence'], name='posting_customer_queue'),
+        ]
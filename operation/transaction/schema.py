@@ -0,0 +1,188 @@
+import datetime
+from collections import defaultdict
+
+import graphene
+from dateutil.relativedelta import relativedelta
+from django.db.models import Count, Sum
+from graphene_django import DjangoObjectType
+from graphql import GraphQLError
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .management import sharding
+from .models import CustomerAttributes, Transaction
+
+
+# Largest page of transactions per customer or query.
+MAX_FIRST = 500
+
+
+def check_first(first):
+    """ Reject a page size outside 1..MAX_FIRST before it reaches SQL.
+
+    Raises:
+        GraphQLError, first is out of range.
+    """
+    if not 1 <= first <= MAX_FIRST:
+        raise GraphQLError('first must be between 1 and {}.'.format(MAX_FIRST))
+    return first
+
+
+def default_since():
+    """ First day of last month, the window of info."""
+    day = datetime.date.today() - relativedelta(months=1)
+    return datetime.date(day.year, day.month, 1)
+
+
+def by_shard(customer_ids):
+    """ Customer ids grouped by the shard holding their transactions."""
+    grouped = defaultdict(list)
+    for customer_id in customer_ids:
+        grouped[sharding.shard_for(customer_id)].append(customer_id)
+    return grouped
+
+
+class CustomerAttributesLoader(DataLoader):
+    def batch_load_fn(self, keys):
+        customers = CustomerAttributes.objects.in_bulk(keys)
+        return Promise.resolve([customers.get(key) for key in keys])
+
+
+class TransactionsLoader(DataLoader):
+    """ Newest transactions of many customers in one query, the database
+    stops at the first rows of each customer."""
+    QUERY = 'SELECT * FROM (' \
+            'SELECT *, ROW_NUMBER() OVER (PARTITION BY customer_id ORDER BY transfer_time DESC, identifier DESC)' \
+            ' AS position FROM {table} WHERE customer_id = ANY(%s) AND transfer_time >= %s' \
+            ') ranked WHERE position <= %s ORDER BY customer_id, position'
+
+    def __init__(self, since, first):
+        super().__init__()
+        self.since = since
+        self.first = first
+
+    def batch_load_fn(self, keys):
+        grouped = defaultdict(list)
+        for shard, customer_ids in by_shard(keys).items():
+            queryset = Transaction.objects.db_manager(shard) \
+                .raw(self.QUERY.format(table=Transaction._meta.db_table),
+                     [customer_ids, self.since, self.first])
+
+            for transaction in queryset:
+                grouped[transaction.customer_id].append(transaction)
+
+        return Promise.resolve([grouped.get(key, []) for key in keys])
+
+
+class SummaryLoader(DataLoader):
+    """ Spending and income of many customers in two aggregate queries."""
+    def __init__(self, since):
+        super().__init__()
+        self.since = since
+
+    def batch_load_fn(self, keys):
+        summaries = {key: {'total_spending': 0, 'total_income': 0, 'transaction_count': 0,
+                           'spending': [], 'transfer_methods': []} for key in keys}
+
+        for shard, customer_ids in by_shard(keys).items():
+            queryset = Transaction.objects.using(shard) \
+                .filter(customer_id__in=customer_ids, transfer_time__gte=self.since)
+
+            for row in queryset.order_by().values('customer_id', 'category') \
+                    .annotate(total=Sum('amount'), count=Count('identifier')):
+                summary = summaries[row['customer_id']]
+                summary['transaction_count'] += row['count']
+                if row['category'] == 'INCOME':
+                    summary['total_income'] += row['total']
+                else:
+                    summary['total_spending'] -= row['total']
+                    summary['spending'].append(CategoryTotal(name=row['category'], total=-row['total'],
+                                                             count=row['count']))
+
+            for row in queryset.filter(amount__lt=0).order_by().values('customer_id', 'transfer_method') \
+                    .annotate(total=Sum('amount'), count=Count('identifier')):
+                summaries[row['customer_id']]['transfer_methods'].append(
+                    CategoryTotal(name=row['transfer_method'], total=-row['total'], count=row['count']))
+
+        return Promise.resolve([Summary(**summaries[key]) for key in keys])
+
+
+class CategoryTotal(graphene.ObjectType):
+    name = graphene.String()
+    total = graphene.Float()
+    count = graphene.Int()
+
+
+class Summary(graphene.ObjectType):
+    total_spending = graphene.Float()
+    total_income = graphene.Float()
+    transaction_count = graphene.Int()
+    spending = graphene.List(CategoryTotal)
+    transfer_methods = graphene.List(CategoryTotal)
+
+
+class CustomerType(graphene.ObjectType):
+    customer_id = graphene.ID()
+    occupation_type = graphene.String()
+    birth_year = graphene.Int()
+    transactions = graphene.List(lambda: TransactionType,
+                                 first=graphene.Int(default_value=50),
+                                 since=graphene.Date())
+    summary = graphene.Field(Summary, since=graphene.Date())
+
+    @staticmethod
+    def from_attributes(customer_id, attributes):
+        return CustomerType(customer_id=customer_id,
+                            occupation_type=attributes.occupation_type if attributes else None,
+                            birth_year=attributes.birth_year if attributes else None)
+
+    def resolve_transactions(self, info, first, since=None):
+        loader = info.context.loaders.get(TransactionsLoader, since or default_since(), check_first(first))
+        return loader.load(self.customer_id)
+
+    def resolve_summary(self, info, since=None):
+        return info.context.loaders.get(SummaryLoader, since or default_since()).load(self.customer_id)
+
+
+class TransactionType(DjangoObjectType):
+    customer = graphene.Field(CustomerType)
+
+    class Meta:
+        model = Transaction
+        only_fields = ('identifier', 'customer_id', 'amount', 'balance_after',
+                       'category', 'transfer_method', 'transfer_time', 'anomaly_score')
+
+    def resolve_customer(self, info):
+        customer_id = self.customer_id
+        return info.context.loaders.get(CustomerAttributesLoader).load(customer_id) \
+            .then(lambda attributes: CustomerType.from_attributes(customer_id, attributes))
+
+
+class Query(graphene.ObjectType):
+    customers = graphene.List(CustomerType, ids=graphene.List(graphene.ID, required=True))
+    transactions = graphene.List(TransactionType,
+                                 customer_ids=graphene.List(graphene.ID),
+                                 since=graphene.Date(),
+                                 first=graphene.Int(default_value=50))
+
+    def resolve_customers(self, info, ids):
+        return info.context.loaders.get(CustomerAttributesLoader).load_many(ids) \
+            .then(lambda customers: [CustomerType.from_attributes(customer_id, attributes)
+                                     for customer_id, attributes in zip(ids, customers)])
+
+    def resolve_transactions(self, info, first, customer_ids=None, since=None):
+        first = check_first(first)
+        queryset = Transaction.objects \
+            .filter(transfer_time__gte=since or default_since()) \
+            .order_by('-transfer_time', '-identifier')
+
+        if customer_ids is None:
+            shards = {shard: queryset for shard in sharding.databases()}
+        else:
+            shards = {shard: queryset.filter(customer_id__in=ids) for shard, ids in by_shard(customer_ids).items()}
+
+        # The newest of every shard, merged.
+        transactions = [transaction for shard, shard_queryset in shards.items()
+                        for transaction in shard_queryset.using(shard)[:first]]
+        transactions.sort(key=lambda transaction: (transaction.transfer_time, transaction.identifier), reverse=True)
+        return transactions[:first]
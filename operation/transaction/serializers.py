@@ -1,6 +1,6 @@
-from rest_framework.serializers import HyperlinkedModelSerializer, Field
+from rest_framework.serializers import HyperlinkedModelSerializer, Field, ModelSerializer
 
-from .models import Transaction
+from .models import CustomerAttributes, Posting, Transaction
 
 
 class TransactionSerializer(HyperlinkedModelSerializer):
@@ -34,4 +34,34 @@ class TransactionRetrievalSerializer(HyperlinkedModelSerializer):
             'category',
             'transfer_method',
             'balance_after',
+            'anomaly_score',
+        )
+
+
+class CustomerAttributesSerializer(ModelSerializer):
+    class Meta:
+        model = CustomerAttributes
+        fields = (
+            'customer_id',
+            'occupation_type',
+            'birth_year',
+            'updated_at',
+        )
+        extra_kwargs = {'customer_id': {'validators': []}}
+
+
+class PostingSerializer(ModelSerializer):
+    class Meta:
+        model = Posting
+        fields = (
+            'tracking_id',
+            'customer_id',
+            'amount',
+            'category',
+            'transfer_method',
+            'status',
+            'transaction',
+            'error',
+            'created',
+            'updated',
         )
@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from .management import postings
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None, acks_late=True)
+def post_transactions(self, customer_id):
+    """ Apply the queued postings of a customer, retried while the customer
+    service cannot be reached or a transfer is not reconciled."""
+    try:
+        return postings.apply_pending(customer_id)
+    except postings.Retry as exc:
+        raise self.retry(exc=exc, countdown=exc.delay or postings.get_config()['RETRY_DELAY'])
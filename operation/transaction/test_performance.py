@@ -0,0 +1,116 @@
+import datetime
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from operation.util.testing import budget, fake_transport, live_constants
+from .management import managers
+from .management.secret_constants import APIConsts
+from . import views
+from .models import (CustomerAttributes, FeedConsumer, SpendingStats, Statement,
+                     Transaction, TransactionOutbox)
+
+CUSTOMER_API_ROOT = 'http://customer.test/customers/'
+
+# Every request is made against both data sizes, counts must not grow with the data.
+SIZES = (2, 12)
+
+
+class TransactionViewPerformanceTest(TestCase):
+    """ Most SQL queries and calls to the customer service allowed per
+    TransactionView request."""
+    def setUp(self):
+        cache.clear()
+
+        transport = fake_transport()
+        self.transport = transport.__enter__()
+        self.addCleanup(transport.__exit__, None, None, None)
+
+        constants = live_constants(APIConsts, [views, managers], CUSTOMER_API_ROOT=CUSTOMER_API_ROOT)
+        constants.__enter__()
+        self.addCleanup(constants.__exit__, None, None, None)
+
+        self.transport.add('GET', r'/verify_admin/$', {'message': 'Token verified.'})
+        self.transport.add('GET', r'/[0-9]+/verify/$', {'message': 'Token verified.'})
+        self.transport.add('POST', r'/transfer/$', {'balance': '100.00'})
+        self.transport.add('POST', r'/id/$', {'customer_id': '0'})
+
+    @staticmethod
+    def seed(size):
+        """ size customers with size transactions each in the current month."""
+        for model in (TransactionOutbox, Transaction, CustomerAttributes,
+                      FeedConsumer, SpendingStats, Statement):
+            model.objects.all().delete()
+
+        now = timezone.now()
+        CustomerAttributes.objects.bulk_create([
+            CustomerAttributes(customer_id=str(customer), occupation_type='MISC',
+                               birth_year=1980, updated_at=now)
+            for customer in range(size)])
+        transactions = Transaction.objects.bulk_create([
+            Transaction(identifier='{}{:04d}'.format(customer + 1, number), customer_id=str(customer),
+                        amount='-1.00', balance_after='100.00', category='DINING',
+                        transfer_method='CARD', transfer_time=now - datetime.timedelta(minutes=number))
+            for customer in range(size) for number in range(size)])
+        TransactionOutbox.objects.bulk_create([TransactionOutbox(transaction=transaction)
+                                               for transaction in transactions])
+
+    def assertBudget(self, method, path, queries, calls, data=None):
+        usages = []
+        for size in SIZES:
+            self.seed(size)
+            identifier = Transaction.objects.values_list('identifier', flat=True).first()
+
+            with budget(self, queries, calls, self.transport) as usage:
+                request = getattr(self.client, method)
+                url = path.format(identifier=identifier)
+                response = request(url, data) if data is not None else request(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+            self.assertLess(response.status_code, 500)
+            usages.append(usage)
+
+        self.assertEqual(usages[0], usages[-1], 'Queries or calls grow with the data.')
+
+    def test_list(self):
+        self.assertBudget('get', '/transactions/', queries=2, calls=1)
+
+    def test_retrieve(self):
+        self.assertBudget('get', '/transactions/{identifier}/', queries=1, calls=0)
+
+    def test_create(self):
+        self.assertBudget('post', '/transactions/', queries=12, calls=1,
+                          data={'customer_id': '0', 'amount': '-5.00',
+                                'category': 'DINING', 'transfer_method': 'CARD'})
+
+    def test_create_by_username(self):
+        self.assertBudget('post', '/transactions/create_by_username/', queries=12, calls=2,
+                          data={'username': 'john123', 'amount': '-5.00',
+                                'category': 'DINING', 'transfer_method': 'CARD'})
+
+    def test_info(self):
+        self.assertBudget('post', '/transactions/info/', queries=2, calls=1,
+                          data={'customer_id': '0'})
+
+    def test_dataset(self):
+        self.assertBudget('get', '/transactions/dataset/', queries=3, calls=1)
+
+    def test_customer_attributes(self):
+        self.assertBudget('post', '/transactions/customer_attributes/', queries=3, calls=1,
+                          data={'customer_id': '0', 'occupation_type': 'CLERICAL',
+                                'birth_year': 1981, 'updated_at': timezone.now().isoformat()})
+
+    def test_feed(self):
+        self.assertBudget('get', '/transactions/feed/', queries=6, calls=1,
+                          data={'consumer': 'performance'})
+
+    def test_destroy(self):
+        self.assertBudget('delete', '/transactions/{identifier}/', queries=1, calls=0)
+
+    def test_partial_update(self):
+        self.assertBudget('patch', '/transactions/{identifier}/', queries=1, calls=0)
+
+    def test_update(self):
+        self.assertBudget('put', '/transactions/{identifier}/', queries=1, calls=0)
@@ -1,5 +1,33 @@
-from django.test import TestCase
-from .models import Transaction
+import datetime
+import gzip
+import tempfile
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from dateutil.relativedelta import relativedelta
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from django.test import TestCase, RequestFactory, TransactionTestCase, override_settings
+
+from operation.util import auxiliary, boot, instrumentation, remote
+from operation.runner import SHARD_TEST_DATABASE
+from operation.util.compression import CompressionMiddleware
+from operation.util.remote import CircuitBreaker
+from operation.util.throttling import LoadSheddingMiddleware, TokenBucketThrottle
+from django.core.cache import cache
+from django.utils import timezone
+from requests.exceptions import HTTPError, ReadTimeout
+from rest_framework.request import Request
+
+from . import tasks, views
+from .management import archives, feeds, hotcache, partitions, postings, sampling, sharding
+from .management.filters import TransactionFilter
+from .management.paginators import TransactionPaginator
+from .models import ArchivedMonth, CustomerAttributes, IdempotencyKey, Posting, SpendingStats, Statement, \
+    Transaction, TransactionOutbox
 
 
 class TransactionTest(TestCase):
@@ -12,3 +40,558 @@ class TransactionTest(TestCase):
 
         self.assertEqual(Transaction.objects.filter(category='ENTERTAINMENT').count(),
                          entertainment_counts + 1)
+
+    def test_idempotent_create(self):
+        data = {'customer_id': '000', 'amount': '-20.00',
+                'category': 'DINING', 'transfer_method': 'CARD'}
+
+        first = self.client.post('/transactions/', data, HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.client.post('/transactions/', data, HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.filter(customer_id='000').count(), 1)
+
+    def test_idempotency_key_after_failure(self):
+        data = {'customer_id': '000', 'amount': '-20.00',
+                'category': 'DINING', 'transfer_method': 'CARD'}
+
+        # The transfer may have been applied, the key is kept with its failure.
+        with mock.patch.object(Transaction.objects, 'create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/transactions/', data, HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post('/transactions/', data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 500)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        # A started key is never taken over, its transfer may still be running.
+        IdempotencyKey.objects.update(status_code=None, created=timezone.now() - datetime.timedelta(hours=1))
+        retry = self.client.post('/transactions/', data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 409)
+
+        # A key left before the transfer by a crashed worker is taken over after its lease.
+        IdempotencyKey.objects.update(started=False)
+        retry = self.client.post('/transactions/', data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 200)
+
+    def test_async_posting(self):
+        data = {'customer_id': '000', 'amount': '-20.00',
+                'category': 'DINING', 'transfer_method': 'CARD'}
+
+        first = self.client.post('/transactions/', data, HTTP_PREFER='respond-async')
+        self.client.post('/transactions/', dict(data, amount='-5.00'), HTTP_PREFER='respond-async')
+
+        self.assertEqual(first.status_code, 202)
+        self.assertFalse(Transaction.objects.exists())
+
+        # Run by a worker once the request commits.
+        tasks.post_transactions.apply(args=['000'])
+
+        self.assertEqual([posting.transaction.amount for posting in Posting.objects.order_by('sequence')],
+                         [Decimal('-20.00'), Decimal('-5.00')])
+
+        response = self.client.get('/transactions/postings/{}/'.format(first.data['tracking_id']))
+        self.assertEqual(response.data['status'], Posting.POSTED)
+
+    def test_posting_outcomes(self):
+        Transaction.objects.create(customer_id='000', amount='10.00',
+                                   category='INCOME', transfer_method='WIRE')
+        posting = postings.enqueue(customer_id='000', amount='-20.00',
+                                   category='DINING', transfer_method='CARD')
+
+        # Shedding load, the transfer was not made.
+        busy = HTTPError(mock.Mock(status_code=503, headers={'Retry-After': '7'}))
+        with mock.patch.object(Transaction.objects, 'create', side_effect=busy):
+            with self.assertRaises(postings.Retry) as retry:
+                postings.apply_pending('000')
+        self.assertEqual(retry.exception.delay, 7)
+        self.assertEqual(Posting.objects.get(pk=posting.pk).status, Posting.QUEUED)
+
+        # No answer, the transfer may have been made.
+        with mock.patch.object(Transaction.objects, 'create', side_effect=ReadTimeout):
+            with self.assertRaises(postings.Retry):
+                postings.apply_pending('000')
+        self.assertEqual(Posting.objects.get(pk=posting.pk).status, Posting.UNKNOWN)
+
+        # The balance moved by the amount, the transfer was made.
+        with mock.patch.object(postings, 'current_balance', return_value=Decimal('-20.00')):
+            postings.apply_pending('000')
+        posting = Posting.objects.get(pk=posting.pk)
+        self.assertEqual(posting.status, Posting.POSTED)
+        self.assertEqual(posting.transaction.balance_after, Decimal('-20.00'))
+
+    def test_feed(self):
+        Transaction.objects.create(customer_id='000',
+                                   amount='-20.00',
+                                   category='DINING',
+                                   transfer_method='CARD')
+        sequence = TransactionOutbox.objects.get().sequence
+
+        response = self.client.get('/transactions/feed/', {'consumer': 'fraud'})
+        self.assertEqual([event['sequence'] for event in response.data['events']], [sequence])
+
+        self.client.post('/transactions/feed/', {'consumer': 'fraud', 'position': sequence})
+        response = self.client.get('/transactions/feed/', {'consumer': 'fraud'})
+        self.assertEqual(response.data['events'], [])
+
+    def test_feed_gap(self):
+        created = timezone.now() - datetime.timedelta(minutes=10)
+        entries = [mock.Mock(sequence=1, created=created), mock.Mock(sequence=3, created=created)]
+
+        # The gap is held while a transaction older than the entry after it is open.
+        self.assertEqual(len(feeds.contiguous(entries, 0, 5, created - datetime.timedelta(minutes=1))), 1)
+        self.assertEqual(len(feeds.contiguous(entries, 0, 5, None)), 2)
+        self.assertEqual(len(feeds.contiguous(entries, 0, 5, timezone.now())), 2)
+
+    def test_dataset_projection(self):
+        CustomerAttributes.objects.apply(customer_id='000', occupation_type='CLERICAL',
+                                         birth_year=1976, updated_at=timezone.now())
+        Transaction.objects.create(customer_id='000',
+                                   amount='-20.00',
+                                   category='DINING',
+                                   transfer_method='CARD')
+
+        response = self.client.get('/transactions/dataset/')
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('000,CLERICAL,1976,CARD,DINING', content)
+
+    def test_sample_index(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Sample indexes require PostgreSQL.')
+
+        sampling.ensure_indexes(connection)
+        queryset = sampling.sample(Transaction.objects.all(), 'customer_id', auxiliary.sample_threshold(0.5))
+        sql, params = queryset.values_list('identifier').query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn(sampling.index_name('customer_id'), plan)
+
+    def test_replace_keeps_newer_projection(self):
+        pushed = timezone.now()
+        CustomerAttributes.objects.apply(customer_id='000', occupation_type='CLERICAL',
+                                         birth_year=1976, updated_at=pushed)
+
+        replaced = CustomerAttributes.objects.replace([
+            {'customer_id': '000', 'occupation_type': 'MISC', 'birth_year': 1976,
+             'updated_at': pushed - datetime.timedelta(minutes=1)},
+            {'customer_id': '001', 'occupation_type': 'MISC', 'birth_year': 1980, 'updated_at': pushed},
+        ])
+
+        self.assertEqual(replaced, 1)
+        self.assertEqual(CustomerAttributes.objects.get(customer_id='000').occupation_type, 'CLERICAL')
+        self.assertEqual(CustomerAttributes.objects.get(customer_id='001').occupation_type, 'MISC')
+
+    def test_keyset_pagination(self):
+        for _ in range(25):
+            Transaction.objects.create(customer_id='000',
+                                       amount='-1.00',
+                                       category='MISC',
+                                       transfer_method='CARD')
+        Transaction.objects.update(transfer_time=timezone.now())
+
+        factory = RequestFactory()
+        queryset = Transaction.objects.all()
+        url, seen = '/transactions/', []
+
+        while url:
+            paginator = TransactionPaginator()
+            page = paginator.paginate_queryset(queryset, Request(factory.get(url)))
+            seen += [transaction.identifier for transaction in page]
+            url = paginator.get_next_link()
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_statements(self):
+        today = timezone.now()
+        last_month = today.replace(day=1) - relativedelta(months=1)
+        Transaction.objects.bulk_create([
+            Transaction(identifier='1', customer_id='000', amount='-20.00', balance_after=0,
+                        category='DINING', transfer_method='CARD', transfer_time=last_month),
+            Transaction(identifier='2', customer_id='000', amount='100.00', balance_after=0,
+                        category='INCOME', transfer_method='WIRE', transfer_time=last_month),
+            Transaction(identifier='3', customer_id='000', amount='-5.00', balance_after=0,
+                        category='DINING', transfer_method='CARD', transfer_time=today),
+        ])
+
+        call_command('build_statements', workers=1)
+        call_command('build_statements', workers=1)
+
+        statement = Statement.objects.get(customer_id='000')
+        self.assertEqual(statement.history, ['1', '2'])
+        self.assertEqual(statement.spending, {'DINING': '20.00'})
+
+        response = self.client.post('/transactions/info/', {'customer_id': '000'})
+        self.assertEqual(response.data['total_spending'], Decimal('25.00'))
+        self.assertEqual(response.data['total_income'], Decimal('100.00'))
+        self.assertEqual(len(response.data['last_month_history']), 3)
+
+    def test_archive(self):
+        old = timezone.now() - relativedelta(months=4)
+        Transaction.objects.bulk_create([
+            Transaction(identifier=str(number), customer_id='000', amount='-1.00', balance_after=0,
+                        category='MISC', transfer_method='CARD', transfer_time=old)
+            for number in range(2)
+        ])
+
+        with tempfile.TemporaryDirectory() as location, \
+                override_settings(TRANSACTION_ARCHIVE={'OPTIONS': {'location': location}}):
+            # An archive missing rows of the table must not delete anything.
+            with mock.patch.object(archives, 'write_month', return_value=('short.parquet', 1)):
+                with self.assertRaises(CommandError):
+                    call_command('archive_transactions', retention=2)
+
+            self.assertEqual(Transaction.objects.count(), 2)
+            self.assertFalse(ArchivedMonth.objects.exists())
+
+            call_command('archive_transactions', retention=2)
+
+            archived = ArchivedMonth.objects.get()
+            self.assertEqual(archived.rows, 2)
+            self.assertFalse(Transaction.objects.exists())
+            self.assertEqual(len(list(archives.iter_rows(archived.month,
+                                                         archived.month + relativedelta(months=1)))), 2)
+
+    def test_anomaly_score(self):
+        for amount in ('-20.00', '-22.00', '-18.00', '-21.00', '-19.00'):
+            transaction = Transaction.objects.create(customer_id='000', amount=amount,
+                                                     category='DINING', transfer_method='CARD')
+            self.assertIsNone(transaction.anomaly_score)
+
+        response = self.client.post('/transactions/', {'customer_id': '000', 'amount': '-400.00',
+                                                       'category': 'DINING', 'transfer_method': 'CARD'})
+        self.assertGreater(response.data['anomaly_score'], 10)
+
+        stats = SpendingStats.objects.get(customer_id='000', category='DINING')
+        self.assertEqual(stats.count, 6)
+        self.assertAlmostEqual(stats.mean, 500 / 6)
+
+        flagged = TransactionFilter({'min_anomaly_score': 10}, queryset=Transaction.objects.all()).qs
+        self.assertEqual([transaction.amount for transaction in flagged], [Decimal('-400.00')])
+
+    def test_partitioning(self):
+        if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+            self.skipTest('Partitioning requires PostgreSQL 11.')
+
+        transaction = Transaction.objects.create(customer_id='000', amount='-1.00',
+                                                 category='DINING', transfer_method='CARD')
+        partitions.convert(connection, months_ahead=1)
+
+        today = datetime.date.today()
+        month = datetime.date(today.year, today.month, 1)
+        following = month + relativedelta(months=1)
+        self.assertTrue(partitions.is_partitioned(connection))
+        self.assertEqual(partitions.partitions(connection),
+                         [partitions.partition_name(month), partitions.partition_name(following)])
+        self.assertTrue(Transaction.objects.filter(pk=transaction.pk).exists())
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+                           [Transaction._meta.db_table, '%_like'])
+            self.assertIn('varchar_pattern_ops', cursor.fetchone()[0])
+
+        self.assertEqual(partitions.detach(connection, following, drop=True),
+                         partitions.partition_name(following))
+        self.assertEqual(partitions.partitions(connection), [partitions.partition_name(month)])
+
+    @override_settings(TRANSACTION_HOT_CACHE={'ENABLED': True, 'DEPTH': 3, 'SINGLE_PROCESS': True})
+    def test_hot_cache(self):
+        with override_settings(TRANSACTION_HOT_CACHE={'ENABLED': True}), \
+                self.assertRaises(ImproperlyConfigured):
+            hotcache.recent('000', 5)
+
+        cache.clear()
+        hotcache.hot_cache.clear()
+
+        def create(amount):
+            transaction = Transaction.objects.create(customer_id='000', amount=amount,
+                                                     category='DINING', transfer_method='CARD')
+            # What the commit hook does outside of TestCase.
+            hotcache.hot_cache.record(transaction)
+            return transaction
+
+        create('-1.00')
+        create('-2.00')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(hotcache.recent('000', 5)), 2)
+
+        newest = create('-3.00')
+        with self.assertNumQueries(0):
+            rows = hotcache.recent('000', 5)
+        self.assertEqual([row.identifier for row in rows][0], newest.identifier)
+        self.assertEqual(rows[0].amount, Decimal('-3.00'))
+
+        # A write on another worker bumps the version.
+        cache.incr(hotcache.HotCache.version_key('000'))
+        with self.assertNumQueries(1):
+            hotcache.recent('000', 2)
+
+        # The oldest transaction is overwritten, the buffer no longer holds all of them.
+        create('-4.00')
+        self.assertEqual(len(hotcache.recent('000', 3)), 3)
+        self.assertIsNone(hotcache.recent('000', 5))
+        self.assertIsNone(hotcache.since('000', timezone.now().date() - relativedelta(years=1)))
+
+
+class GraphQLTest(TestCase):
+    def setUp(self):
+        for amount in ('-1.00', '-2.00', '-3.00'):
+            Transaction.objects.create(customer_id='000', amount=amount,
+                                       category='DINING', transfer_method='CARD')
+        Transaction.objects.create(customer_id='001', amount='10.00',
+                                   category='INCOME', transfer_method='WIRE')
+
+    def query(self, query):
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_customers(self):
+        data = self.query('{ customers(ids: ["000", "001", "002"]) {'
+                          ' customerId transactions(first: 2) { amount } summary { transactionCount } } }')
+        customers = data['customers']
+
+        self.assertEqual([len(customer['transactions']) for customer in customers], [2, 1, 0])
+        self.assertEqual([customer['summary']['transactionCount'] for customer in customers], [3, 1, 0])
+
+    def test_transactions(self):
+        data = self.query('{ transactions(customerIds: ["000"], first: 2) { customerId customer { customerId } } }')
+
+        self.assertEqual(len(data['transactions']), 2)
+        self.assertEqual(data['transactions'][0]['customer']['customerId'], '000')
+
+    def test_first_bounds(self):
+        for first in (0, -1, 501):
+            response = self.client.post('/graphql/', {'query': '{ transactions(first: %d) { amount } }' % first},
+                                        content_type='application/json')
+            self.assertIn('first must be between 1 and 500.',
+                          [error['message'] for error in response.json()['errors']])
+
+
+@override_settings(COMPRESSION={'MIN_SIZE': 100, 'ENDPOINTS': [{'PATH': r'^/transactions/'}]})
+class CompressionTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = CompressionMiddleware()
+
+    def test_streaming_gzip(self):
+        request = self.factory.get('/transactions/dataset/', HTTP_ACCEPT_ENCODING='gzip')
+        rows = [b'customer_id,amount\n'] + [b'000,300.00\n'] * 1000
+        response = self.middleware.process_response(request, StreamingHttpResponse(iter(rows)))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(rows))
+
+    def test_below_threshold(self):
+        request = self.factory.get('/transactions/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.middleware.process_response(request, HttpResponse(b'{}'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class CircuitBreakerTest(TestCase):
+    def test_open_and_probe(self):
+        breaker = CircuitBreaker('customer', failure_threshold=2, recovery_time=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Recovery time has passed, one probe goes through.
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_dependency_metrics(self):
+        dependency = remote.Dependency('customer', remote.DEFAULTS)
+        with mock.patch.object(remote.session, 'request', return_value=HttpResponse(status=502)):
+            dependency.request('GET', 'http://customer/')
+
+        metrics = dependency.snapshot()
+        self.assertEqual((metrics['calls'], metrics['failures']), (1, 1))
+        self.assertEqual(metrics['state'], CircuitBreaker.CLOSED)
+
+        response = self.client.get('/transactions/dependencies/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('results', response.json())
+
+
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+
+    @override_settings(THROTTLING={'RATE': 1.0, 'BURST': 10, 'COSTS': {'dataset': 4}})
+    def test_action_cost(self):
+        view = type('View', (), {'action': 'dataset'})()
+        request = self.factory.get('/transactions/dataset/')
+
+        throttle = TokenBucketThrottle()
+        self.assertTrue(throttle.allow_request(request, view))
+        self.assertTrue(throttle.allow_request(request, view))
+        self.assertFalse(throttle.allow_request(request, view))
+        self.assertAlmostEqual(throttle.wait(), 2, delta=0.1)
+
+        # Buckets are kept per action.
+        view.action = 'list'
+        self.assertTrue(throttle.allow_request(request, view))
+
+    def test_bucket_lock(self):
+        view = type('View', (), {'action': 'list'})()
+        request = self.factory.get('/transactions/')
+        throttle = TokenBucketThrottle()
+
+        # Another request of the client is updating the bucket.
+        cache.add('throttle:list:{}:lock'.format(throttle.get_client(request)), True)
+        self.assertFalse(throttle.allow_request(request, view))
+
+        cache.clear()
+        self.assertTrue(throttle.allow_request(request, view))
+
+    @mock.patch.object(views, 'APIConsts', mock.Mock(**{'SERVICE_TOKEN.value': 'Bearer service'}))
+    def test_service_token(self):
+        view = views.TransactionView(request=self.factory.post('/transactions/customer_attributes/',
+                                                               HTTP_AUTHORIZATION='Bearer client'))
+        self.assertTrue(view.get_throttles())
+
+        view.request = self.factory.post('/transactions/customer_attributes/', HTTP_AUTHORIZATION='Bearer service')
+        self.assertEqual(view.get_throttles(), [])
+
+    @override_settings(LOAD_SHEDDING={'MAX_IN_FLIGHT': 1, 'PATHS': [r'^/transactions/dataset/$']})
+    def test_shedding(self):
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse(b'{}'))
+        middleware.in_flight = 1
+
+        response = middleware(self.factory.get('/transactions/dataset/'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+
+        response = middleware(self.factory.get('/transactions/'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_shedding_streams(self):
+        middleware = LoadSheddingMiddleware(lambda request: StreamingHttpResponse(iter([b'a', b'b'])))
+
+        response = middleware(self.factory.get('/transactions/dataset/'))
+        self.assertEqual(middleware.in_flight, 1)
+
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+        response.close()
+        self.assertEqual(middleware.in_flight, 0)
+
+
+class ShardingTest(TestCase):
+    def test_hash_ring(self):
+        customers = [str(number) for number in range(1000)]
+        ring = sharding.HashRing(['default', 'shard_1'], 100)
+        grown = sharding.HashRing(['default', 'shard_1', 'shard_2'], 100)
+
+        placed = [ring.get(customer) for customer in customers]
+        self.assertGreater(placed.count('shard_1'), 300)
+        self.assertGreater(placed.count('default'), 300)
+
+        # Only customers taken over by the new shard move.
+        moved = [customer for customer, shard in zip(customers, placed) if grown.get(customer) != shard]
+        self.assertTrue(all(grown.get(customer) == 'shard_2' for customer in moved))
+        self.assertLess(len(moved), 500)
+
+    def test_routing(self):
+        transaction = Transaction.objects.create(customer_id='000', amount='-20.00',
+                                                 category='DINING', transfer_method='CARD')
+
+        self.assertEqual(transaction._state.db, sharding.shard_for('000'))
+        self.assertEqual(list(sharding.gather(Transaction.objects.order_by('transfer_time')
+                                              .values_list('identifier', 'transfer_time'),
+                                              key=lambda row: row[1])),
+                         [(transaction.identifier, transaction.transfer_time)])
+
+
+@skipUnless(SHARD_TEST_DATABASE in settings.DATABASES, 'Requires the ShardTestRunner database.')
+@override_settings(TRANSACTION_SHARDING={'DATABASES': ['default', SHARD_TEST_DATABASE]})
+class TwoShardTest(TransactionTestCase):
+    """ Shard readers use their own connections, rows have to be committed."""
+    multi_db = True
+
+    def setUp(self):
+        customers = [str(number) for number in range(100)]
+        self.on_default = next(customer for customer in customers if sharding.shard_for(customer) == 'default')
+        self.on_shard = next(customer for customer in customers
+                             if sharding.shard_for(customer) == SHARD_TEST_DATABASE)
+
+    def test_posting_across_shards(self):
+        on_default, on_shard = self.on_default, self.on_shard
+
+        posting = postings.enqueue(customer_id=on_shard, amount='-20.00', category='DINING', transfer_method='CARD')
+        postings.apply_pending(on_shard)
+        Transaction.objects.create(customer_id=on_default, amount='-5.00', category='DINING', transfer_method='CARD')
+
+        posting = Posting.objects.get(pk=posting.pk)
+        self.assertEqual(posting.status, Posting.POSTED)
+        self.assertEqual(posting.transaction._state.db, SHARD_TEST_DATABASE)
+        self.assertFalse(Transaction.objects.using('default').filter(customer_id=on_shard).exists())
+
+        rows = sharding.gather(Transaction.objects.order_by('customer_id').values_list('customer_id', flat=True),
+                               key=lambda customer_id: customer_id)
+        self.assertEqual(list(rows), sorted([on_default, on_shard]))
+
+    def test_reads_across_shards(self):
+        for customer_id in (self.on_default, self.on_shard):
+            Transaction.objects.create(customer_id=customer_id, amount='-5.00',
+                                       category='DINING', transfer_method='CARD')
+
+        response = self.client.post('/graphql/', {'query': '{{ customers(ids: ["{}", "{}"]) {{'
+                                                           ' transactions {{ customerId }} }} }}'
+                                                  .format(self.on_default, self.on_shard)},
+                                    content_type='application/json')
+        self.assertEqual([len(customer['transactions']) for customer in response.json()['data']['customers']],
+                         [1, 1])
+
+        response = self.client.get('/transactions/feed/', {'consumer': 'fraud'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/transactions/feed/', {'consumer': 'fraud',
+                                                           'shard': SHARD_TEST_DATABASE})
+        self.assertEqual([event['customer_id'] for event in response.data['events']], [self.on_shard])
+
+
+class SlowQueryTest(TestCase):
+    def tearDown(self):
+        instrumentation.slow_queries.clear()
+
+    def test_fingerprint(self):
+        self.assertEqual(instrumentation.fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND a = 'x'"),
+                         instrumentation.fingerprint('SELECT * FROM t WHERE id IN (%s)  AND a = 3'))
+
+    def test_analyzable(self):
+        self.assertTrue(instrumentation.analyzable("SELECT COUNT(*) FROM t WHERE id IN (%s) AND a = 'f(x)'"))
+        self.assertFalse(instrumentation.analyzable('SELECT pg_advisory_lock(%s, %s)'))
+        self.assertFalse(instrumentation.analyzable("SELECT nextval('t_id_seq')"))
+
+    @override_settings(SLOW_QUERIES={'THRESHOLD_MS': 0, 'EXPLAIN_SAMPLE': 1.0})
+    def test_capture(self):
+        with instrumentation.capture(instrumentation.QueryRecorder('TransactionView.info')):
+            Transaction.objects.filter(customer_id='000').count()
+
+        entry = instrumentation.slow_queries.top(1)[0]
+        self.assertEqual(entry['actions'], {'TransactionView.info': 1})
+        self.assertIn('Execution', entry['plan'])
+
+        response = self.client.get('/transactions/slow_queries/')
+        self.assertEqual([result['fingerprint'] for result in response.data['results']],
+                         [entry['fingerprint']])
+
+
+class BootTest(TestCase):
+    def test_lean_boot(self):
+        times = boot.import_times(['operation.wsgi', 'operation.urls'], {'LEAN_BOOT': 'True'})
+
+        self.assertIn('operation.urls', times)
+        self.assertNotIn('django.contrib.admin.sites', times)
+        self.assertNotIn('rest_framework.documentation', times)
@@ -1,7 +1,9 @@
 import csv
 import datetime
-import json
+import hmac
+import itertools
 import logging
+import math
 import os
 from collections import defaultdict
 from decimal import Decimal
@@ -9,31 +11,78 @@ from decimal import Decimal
 import requests
 from dateutil.relativedelta import relativedelta
 from django.core.exceptions import ValidationError
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db.models import OuterRef, Q, Subquery
+from django.db.transaction import on_commit
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from requests.exceptions import HTTPError
 from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.viewsets import ModelViewSet
 
-from . import serializers
+from operation.util import auxiliary, instrumentation, remote
+from operation.util.graph import LoaderGraphQLView
+from operation.util.throttling import TokenBucketThrottle
+from . import serializers, tasks
+from .management import archives, feeds, hotcache, postings, sampling, sharding
+from .management.filters import TransactionFilter
+from .management.idempotency import idempotent, mark_started
 from .management.paginators import TransactionPaginator
 from .management.secret_constants import APIConsts
-from .models import Transaction
+from .models import CustomerAttributes, FeedConsumer, Posting, Statement, Transaction
 
 logger = logging.getLogger(__name__)
 
 
+class EchoBuffer:
+    """ File-like object that hands back what is written, lets csv.writer
+    produce rows for a streaming response."""
+    def write(self, value):
+        return value
+
+
+class TransactionGraphQLView(LoaderGraphQLView):
+    """ GraphQL endpoint over transactions, restricted to admin tokens."""
+    throttle_scope = 'graphql'
+
+    def dispatch(self, request, *args, **kwargs):
+        throttle = TokenBucketThrottle()
+        if not throttle.allow_request(request, self):
+            response = JsonResponse({'error': 'Request was throttled.'}, status=429)
+            response['Retry-After'] = str(math.ceil(throttle.wait()))
+            return response
+
+        if not APIConsts.TESTING.value:
+            url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, 'verify_admin', '')
+            response = remote.get(url, 'customer', token=request.META.get('HTTP_AUTHORIZATION'))
+
+            if response.status_code != requests.codes.ok:
+                return JsonResponse({'error': 'Not authorized'}, status=response.status_code)
+
+        return super().dispatch(request, *args, **kwargs)
+
+
 class TransactionView(ModelViewSet):
     queryset = Transaction.objects.all()
     pagination_class = TransactionPaginator
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
 
+    filterset_class = TransactionFilter
     ordering = ['-transfer_time']
+    ordering_fields = ['transfer_time']
     search_fields = ['=category', '=transfer_method']
 
+    def get_throttles(self):
+        """ The customer service calls with the service token on behalf of many clients,
+        it is not throttled like one."""
+        token = APIConsts.SERVICE_TOKEN.value
+        authorization = self.request.META.get('HTTP_AUTHORIZATION') or ''
+        if token and hmac.compare_digest(authorization, token):
+            return []
+        return super().get_throttles()
+
     def get_serializer_class(self):
         if self.action == 'destroy' or \
                 self.action == 'retrieve' or \
@@ -44,6 +93,20 @@ class TransactionView(ModelViewSet):
         else:
             return serializers.TransactionSerializer
 
+    def get_object(self):
+        """ Identifiers do not tell the customer, every shard is searched."""
+        if not sharding.is_sharded():
+            return super().get_object()
+
+        lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        for alias in sharding.databases():
+            obj = self.get_queryset().using(alias).filter(**lookup).first()
+            if obj is not None:
+                self.check_object_permissions(self.request, obj)
+                return obj
+
+        raise Http404
+
     @staticmethod
     def _get_last_month(rewind_months=None, to_date=False):
         """ Get datetime object of the first and last days of last months"""
@@ -62,17 +125,80 @@ class TransactionView(ModelViewSet):
 
         return last_month_first, last_month_last
 
-    def list(self, request, *args, **kwargs):
+    @staticmethod
+    def _verify_admin(request):
+        """ Verify with the customer service that the request carries an admin token.
+
+        Returns:
+            Response, Error response if the token is rejected, None otherwise.
+        """
         token = request.META.get('HTTP_AUTHORIZATION')
 
         url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, 'verify_admin', '')
-        headers = {'Authorization': token}
-        response = requests.get(url, headers=headers)
+        response = remote.get(url, 'customer', token=token)
 
         if response.status_code != requests.codes.ok:
             return Response(response, status=response.status_code)
 
+        return None
+
+    def _post_async(self, request, customer_id, data):
+        """ Queue a transaction for the posting workers instead of making it
+        while the client waits.
+
+        Returns:
+            Response, 202 with the tracking id of the posting, or the error.
+        """
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
+
+        if Decimal(data['amount']) == 0:
+            return Response({'error': 'Amount can not be zero.'}, status=400)
+
+        mark_started(request)
+        posting = postings.enqueue(customer_id=customer_id,
+                                   amount=data['amount'],
+                                   category=data['category'],
+                                   transfer_method=data['transfer_method'])
+        on_commit(lambda: tasks.post_transactions.delay(customer_id))
+
+        location = reverse('transaction-posting', kwargs={'tracking_id': posting.tracking_id},
+                           request=request)
+        return Response({'message': 'Transaction accepted.',
+                         'tracking_id': str(posting.tracking_id),
+                         'status': posting.status}, status=202, headers={'Location': location})
+
+    def _recent_page(self, request):
+        """ First page of a single customer's newest transactions from the
+        hot cache, None when the request asks for anything else."""
+        params = set(request.query_params) - {'format'}
+        if params != {'customer_id'} and params != {'customer_id', 'ordering'} \
+                or request.query_params.get('ordering', '-transfer_time') != '-transfer_time':
+            return None
+
+        return hotcache.recent(request.query_params['customer_id'], self.paginator.page_size + 1)
+
+    def list(self, request, *args, **kwargs):
+        denied = self._verify_admin(request)
+        if denied is not None:
+            return denied
+
+        recent = self._recent_page(request)
+        if recent is not None:
+            page = self.paginator.paginate_rows(recent, request, view=self)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        customer_id = request.query_params.get('customer_id')
+        if customer_id is None and sharding.is_sharded():
+            return Response({'error': 'Include customer_id, transactions are sharded by customer.'},
+                            status=400)
+
         queryset = self.filter_queryset(self.get_queryset())
+        if customer_id is not None:
+            queryset = queryset.using(sharding.shard_for(customer_id))
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -82,6 +208,7 @@ class TransactionView(ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         """ Create a transaction.
         """
@@ -90,14 +217,18 @@ class TransactionView(ModelViewSet):
         if serializer.is_valid():
             data = serializer.data
 
+            if postings.is_async(request):
+                return self._post_async(request, data['customer_id'], data)
+
             token = request.META.get('HTTP_AUTHORIZATION')
 
+            mark_started(request)
             try:
-                Transaction.objects.create(customer_id=data['customer_id'],
-                                           amount=data['amount'],
-                                           category=data['category'],
-                                           transfer_method=data['transfer_method'],
-                                           token=token)
+                transaction = Transaction.objects.create(customer_id=data['customer_id'],
+                                                         amount=data['amount'],
+                                                         category=data['category'],
+                                                         transfer_method=data['transfer_method'],
+                                                         token=token)
             except HTTPError as he:
                 logger.warning(he)
                 return Response({'error': he})
@@ -105,11 +236,13 @@ class TransactionView(ModelViewSet):
                 logger.warning(ve)
                 return Response({'error': ve}, status=400)
 
-            return Response({'message': 'Transaction made.'}, status=200)
+            return Response({'message': 'Transaction made.',
+                             'anomaly_score': transaction.anomaly_score}, status=200)
         else:
             return Response({'error': serializer.errors}, status=400)
 
     @action(methods=['post'], detail=False)
+    @idempotent
     def create_by_username(self, request, *args, **kwargs):
         """ Create a transaction by referencing username
         """
@@ -124,20 +257,24 @@ class TransactionView(ModelViewSet):
 
             url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, 'id', '')
             request_data = {'username': username}
-            response = requests.post(url=url, data=request_data)
+            response = remote.post(url=url, service='customer', data=request_data)
 
             if response.status_code != requests.codes.ok:
                 return Response({'message': 'Username does not exist.'})
 
-            customer_id = response.json()['customer_id']
+            customer_id = remote.payload(response)['customer_id']
+            if postings.is_async(request):
+                return self._post_async(request, customer_id, data)
+
             token = request.META.get('HTTP_AUTHORIZATION')
 
+            mark_started(request)
             try:
-                Transaction.objects.create(customer_id=customer_id,
-                                           amount=data['amount'],
-                                           category=data['category'],
-                                           transfer_method=data['transfer_method'],
-                                           token=token)
+                transaction = Transaction.objects.create(customer_id=customer_id,
+                                                         amount=data['amount'],
+                                                         category=data['category'],
+                                                         transfer_method=data['transfer_method'],
+                                                         token=token)
             except HTTPError as he:
                 logger.warning(he)
                 return Response({'error': str(he)})
@@ -145,10 +282,30 @@ class TransactionView(ModelViewSet):
                 logger.warning(ve)
                 return Response({'error': str(ve)}, status=400)
 
-            return Response({'message': 'Transaction made.'}, status=200)
+            return Response({'message': 'Transaction made.',
+                             'anomaly_score': transaction.anomaly_score}, status=200)
         else:
             return Response({'error': serializer.errors}, status=400)
 
+    @action(methods=['get'], detail=False, url_path=r'postings/(?P<tracking_id>[0-9a-f-]+)')
+    def posting(self, request, tracking_id=None, *args, **kwargs):
+        """ Status of a transaction accepted for asynchronous posting.
+        """
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
+
+        try:
+            posting = Posting.objects.filter(tracking_id=tracking_id).first()
+        except ValidationError:
+            posting = None
+
+        if posting is None:
+            return Response({'error': 'Posting does not exist.'}, status=404)
+
+        return Response(serializers.PostingSerializer(posting).data)
+
     @action(methods=['post'], detail=False)
     def info(self, request, *args, **kwargs):
         """ Get transaction history for customer.
@@ -158,18 +315,41 @@ class TransactionView(ModelViewSet):
             token = request.META.get('HTTP_AUTHORIZATION')
 
             url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, customer_id, 'verify', '')
-            headers = {'Authorization': token}
-            response = requests.get(url=url, headers=headers)
+            response = remote.get(url=url, service='customer', token=token)
 
             if response.status_code != requests.codes.ok:
                 return Response({'error': response}, status=response.status_code)
 
         last_month_first, last = self._get_last_month(to_date=True)
-
-        # All transactions by this customer since last month.
-        queryset = self.get_queryset().filter(Q(customer_id=customer_id)
-                                              & Q(transfer_time__range=[last_month_first,
-                                                                        last]))
+        this_month_first = last_month_first + relativedelta(months=1)
+        shard = sharding.shard_for(customer_id)
+
+        # The closed month comes from its statement when one was built,
+        # only the current month is summed up here.
+        statement = Statement.objects.using(shard).filter(customer_id=customer_id,
+                                                          month=last_month_first).first()
+
+        # Hot customers have their newest transactions cached.
+        recent = hotcache.since(customer_id, last_month_first if statement is None else this_month_first)
+
+        if recent is not None:
+            queryset = recent
+            if statement is not None and statement.history:
+                queryset += list(self.get_queryset().using(shard).filter(identifier__in=statement.history,
+                                                                         transfer_time__gte=last_month_first,
+                                                                         transfer_time__lt=this_month_first))
+        elif statement is None:
+            queryset = self.get_queryset().using(shard).filter(Q(customer_id=customer_id)
+                                                               & Q(transfer_time__range=[last_month_first,
+                                                                                         last]))
+        else:
+            # Bounding the history lookup by time lets it skip other partitions.
+            queryset = self.get_queryset().using(shard).filter(Q(identifier__in=statement.history,
+                                                                 transfer_time__gte=last_month_first,
+                                                                 transfer_time__lt=this_month_first)
+                                                               | Q(customer_id=customer_id)
+                                                               & Q(transfer_time__range=[this_month_first,
+                                                                                         last]))
 
         if not queryset:
             return Response({
@@ -182,6 +362,14 @@ class TransactionView(ModelViewSet):
         methods = defaultdict(Decimal)
         spending = defaultdict(Decimal)
 
+        closed = set()
+        if statement is not None:
+            closed = set(statement.history)
+            total_spending = statement.total_spending
+            total_income = statement.total_income
+            methods.update({key: Decimal(value) for key, value in statement.transfer_methods.items()})
+            spending.update({key: Decimal(value) for key, value in statement.spending.items()})
+
         for transaction in queryset:
             last_month_trans.append({
                 'identifier': transaction.identifier,
@@ -193,6 +381,9 @@ class TransactionView(ModelViewSet):
                 'balance_after': transaction.balance_after,
             })
 
+            if transaction.identifier in closed:
+                continue
+
             if transaction.amount < 0:
                 total_spending -= transaction.amount
                 methods[transaction.transfer_method] -= transaction.amount
@@ -209,19 +400,46 @@ class TransactionView(ModelViewSet):
         transaction_info = {
             'total_spending': total_spending,
             'total_income': total_income,
-            'transfer_methods': json.dumps(methods),
-            'transfer_methods_ratio': json.dumps(methods_ratio),
-            'spending': json.dumps(spending),
-            'spending_ratio': json.dumps(spending_ratio),
+            'transfer_methods': methods,
+            'transfer_methods_ratio': methods_ratio,
+            'spending': spending,
+            'spending_ratio': spending_ratio,
             'last_month_history': last_month_trans,
         }
 
         return Response(transaction_info)
 
+    @staticmethod
+    def _archived_rows(start, end, sample=None, batch_size=1000):
+        """ Dataset rows from archived months, customer attributes are
+        looked up in the projection once per batch."""
+        archived = archives.iter_rows(start, end)
+        if sample is not None:
+            field, threshold = sample
+            archived = (row for row in archived if auxiliary.in_sample(row[field], threshold))
+
+        while True:
+            batch = list(itertools.islice(archived, batch_size))
+            if not batch:
+                break
+
+            customers = CustomerAttributes.objects.in_bulk({row['customer_id'] for row in batch})
+            for row in batch:
+                customer = customers.get(row['customer_id'])
+                yield (row['customer_id'],
+                       customer.occupation_type if customer else None,
+                       customer.birth_year if customer else None,
+                       row['transfer_method'], row['category'], row['balance_after'],
+                       row['amount'], row['transfer_time'])
+
     @action(methods=['get'], detail=False)
     def dataset(self, request, *args, **kwargs):
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
+
         rewind = request.query_params.get('rewind')
-        token = request.META.get('HTTP_AUTHORIZATION')
 
         try:
             rewind = int(rewind)
@@ -230,36 +448,165 @@ class TransactionView(ModelViewSet):
         except TypeError:
             rewind = None
 
+        sample = request.query_params.get('sample')
+        if sample is not None:
+            try:
+                fraction = float(sample)
+            except ValueError:
+                fraction = 0
+            if not 0 < fraction <= 1:
+                return Response({'error': 'sample must be a fraction in (0, 1].'}, status=400)
+
+            # Sample on the random bits of transaction ids, or of customer ids
+            # to keep whole customer histories together.
+            field = 'customer_id' if request.query_params.get('stratify') == 'customer' else 'identifier'
+            sample = (field, auxiliary.sample_threshold(fraction))
+
         start, end = self._get_last_month(rewind_months=rewind, to_date=True)
-        queryset = self.get_queryset() \
-            .filter(transfer_time__range=[start, end]) \
-            .order_by('transfer_time')
 
-        response = HttpResponse(content_type='text/csv')
+        queryset = self.get_queryset().filter(transfer_time__range=[start, end])
+        if sample is not None:
+            field, threshold = sample
+            queryset = sampling.sample(queryset, field, threshold)
+
+        # Customer attributes are joined from the local projection.
+        attributes = CustomerAttributes.objects.filter(customer_id=OuterRef('customer_id'))
+        queryset = queryset \
+            .annotate(occupation_type=Subquery(attributes.values('occupation_type')[:1]),
+                      birth_year=Subquery(attributes.values('birth_year')[:1])) \
+            .order_by('transfer_time') \
+            .values_list('customer_id', 'occupation_type', 'birth_year',
+                         'transfer_method', 'category', 'balance_after',
+                         'amount', 'transfer_time')
+
+        writer = csv.writer(EchoBuffer())
+
+        def rows():
+            yield writer.writerow(['customer_id', 'occupation', 'birth_year',
+                                   'transfer_method', 'category', 'balance',
+                                   'balance_diff', 'transfer_time'])
+
+            # Archived months are older than anything left in the table.
+            for row in self._archived_rows(start, end, sample):
+                yield writer.writerow(row)
+
+            # Shards are read in parallel and merged on transfer_time.
+            for row in sharding.gather(queryset, key=lambda row: row[7]):
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(rows(), content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="dataset.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['customer_id', 'occupation', 'birth_year',
-                         'transfer_method', 'category', 'balance',
-                         'balance_diff', 'transfer_time'])
 
-        for transaction in queryset:
-            customer_id = transaction.customer_id
+        return response
 
-            url = os.path.join(APIConsts.CUSTOMER_API_ROOT.value, customer_id, 'basic', '')
-            headers = {'Authorization': token}
-            customer_response = requests.get(url, headers=headers)
+    @action(methods=['post'], detail=False)
+    def customer_attributes(self, request, *args, **kwargs):
+        """ Receive customer attribute changes pushed by the customer service.
+        """
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
 
-            if customer_response.status_code != requests.codes.ok:
-                return Response({'error': 'Not authorized'}, status=405)
-            else:
-                customer = customer_response.json()
+        serializer = serializers.CustomerAttributesSerializer(data=request.data)
+
+        if serializer.is_valid():
+            # Copied to every shard, the dataset export joins it there.
+            for alias in sharding.replicas():
+                CustomerAttributes.objects.db_manager(alias).apply(**serializer.validated_data)
+            return Response({'message': 'Customer attributes updated.'}, status=200)
+        else:
+            return Response({'error': serializer.errors}, status=400)
 
-            writer.writerow([customer['customer_id'], customer['occupation_type'],
-                             customer['birth_year'], transaction.transfer_method,
-                             transaction.category, transaction.balance_after,
-                             transaction.amount, transaction.transfer_time])
+    @action(methods=['get', 'post'], detail=False)
+    def feed(self, request, *args, **kwargs):
+        """ Long-poll the transaction change feed.
 
-        return response
+        GET returns events after the stored position of the consumer,
+        POST commits the position a consumer has processed. Shards have
+        their own feeds, consumers read each with the shard parameter.
+        """
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
+
+        params = request.query_params if request.method == 'GET' else request.data
+        name = params.get('consumer')
+        if not name:
+            return Response({'error': 'Include consumer in request.'}, status=400)
+
+        shard = params.get('shard')
+        if shard is None and sharding.is_sharded():
+            return Response({'error': 'Include shard, one of {}.'.format(', '.join(sharding.databases()))},
+                            status=400)
+        shard = shard or 'default'
+        if shard not in sharding.databases():
+            return Response({'error': 'Unknown shard.'}, status=400)
+
+        consumer, _ = FeedConsumer.objects.get_or_create(name=name, shard=shard)
+
+        if request.method == 'POST':
+            try:
+                consumer.position = int(request.data.get('position'))
+            except (TypeError, ValueError):
+                return Response({'error': 'Invalid position.'}, status=400)
+            consumer.save()
+            return Response({'consumer': consumer.name, 'shard': shard, 'position': consumer.position})
+
+        try:
+            batch_size = int(params.get('batch', 100))
+            wait = float(params.get('wait', 0))
+        except ValueError:
+            return Response({'error': 'Invalid batch or wait.'}, status=400)
+
+        events = feeds.read(consumer.position, batch_size, wait, using=shard)
+
+        return Response({
+            'consumer': consumer.name,
+            'shard': shard,
+            'position': consumer.position,
+            'next_position': events[-1]['sequence'] if events else consumer.position,
+            'events': events,
+        })
+
+    @action(methods=['get', 'delete'], detail=False)
+    def slow_queries(self, request, *args, **kwargs):
+        """ Slowest queries recorded by this process, DELETE starts over.
+        """
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
+
+        if request.method == 'DELETE':
+            instrumentation.slow_queries.clear()
+            return Response({'message': 'Slow queries cleared.'})
+
+        order = request.query_params.get('order', 'total_ms')
+        if order not in ('total_ms', 'max_ms', 'count'):
+            return Response({'error': 'Order by total_ms, max_ms or count.'}, status=400)
+
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'Invalid limit.'}, status=400)
+
+        config = instrumentation.get_config()
+        return Response({'enabled': config['ENABLED'],
+                         'threshold_ms': config['THRESHOLD_MS'],
+                         'results': instrumentation.slow_queries.top(limit, order)})
+
+    @action(methods=['get'], detail=False)
+    def dependencies(self, request, *args, **kwargs):
+        """ Call counters and circuit state of the services this process calls.
+        """
+        if not APIConsts.TESTING.value:
+            denied = self._verify_admin(request)
+            if denied is not None:
+                return denied
+
+        return Response({'results': remote.metrics()})
 
     def destroy(self, request, *args, **kwargs):
         """ DELETE action not allowed on transactions.
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_search_indexes(sender, using, **kwargs):
+    """ Index the upper-cased fields autocomplete filters on."""
+    from django.db import connections
+    from .management import search
+
+    search.ensure_indexes(connections[using])
 
 
 class CustomerConfig(AppConfig):
     name = 'customer'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(create_search_indexes, sender=self)
@@ -0,0 +1,88 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model
+
+from customer.models import Customer
+
+# Attributes kept for the authenticated user, other attributes are loaded
+# from the database on first access.
+PRINCIPAL_FIELDS = ('identifier', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_key(token):
+    return 'auth:token:{}'.format(hashlib.sha256(token.encode('utf-8')).hexdigest())
+
+
+def principal_key(user_id):
+    return 'auth:principal:{}'.format(user_id)
+
+
+def invalidate_token(token):
+    cache.delete(token_key(token))
+
+
+def invalidate_principal(user_id):
+    cache.delete(principal_key(user_id))
+
+
+def invalidate_principals(user_ids):
+    cache.delete_many([principal_key(user_id) for user_id in user_ids])
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """ OAuth2 authentication that caches validated access tokens and a
+    compact principal of their user until the token expires, so repeated
+    calls with the same token skip the database.
+
+    Tokens are dropped from the cache when they are revoked or changed and
+    principals when their customer is saved, deleted or updated through the
+    customer queryset, see customer.signals and CustomerQuerySet. Principals
+    are kept at most OAUTH2_PRINCIPAL_CACHE_TTL seconds to bound changes
+    made with raw SQL. Use a shared cache across workers for invalidation
+    to reach all of them.
+    """
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not header.startswith('Bearer '):
+            return super().authenticate(request)
+
+        token = header[len('Bearer '):].strip()
+        cached = cache.get(token_key(token))
+        principal = cache.get(principal_key(cached['user_id'])) if cached else None
+
+        if cached is None or principal is None or cached['expires'] <= timezone.now():
+            return self._authenticate_and_cache(request, token)
+
+        fields = [field.attname for field in Customer._meta.concrete_fields
+                  if field.attname in principal]
+        user = Customer.from_db('default', fields, [principal[field] for field in fields])
+
+        access_token_model = get_access_token_model()
+        access_token = access_token_model(id=cached['token_id'], token=token, user_id=cached['user_id'],
+                                          expires=cached['expires'], scope=cached['scope'])
+        access_token._state.adding = False
+
+        return user, access_token
+
+    def _authenticate_and_cache(self, request, token):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+
+        user, access_token = result
+        timeout = (access_token.expires - timezone.now()).total_seconds()
+        timeout = min(timeout, getattr(settings, 'OAUTH2_TOKEN_CACHE_TTL', 3600))
+
+        if timeout > 0:
+            cache.set(token_key(token), {'user_id': user.pk,
+                                         'token_id': access_token.pk,
+                                         'expires': access_token.expires,
+                                         'scope': access_token.scope}, timeout)
+            cache.set(principal_key(user.pk), {field: getattr(user, field) for field in PRINCIPAL_FIELDS},
+                      min(timeout, getattr(settings, 'OAUTH2_PRINCIPAL_CACHE_TTL', 60)))
+
+        return result
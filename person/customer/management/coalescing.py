@@ -0,0 +1,100 @@
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': False,
+    'WINDOW_MS': 5,
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'TRANSFER_COALESCING', {}))
+
+
+class PendingTransfer:
+    def __init__(self, amount):
+        self.amount = amount
+        self.balance = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class TransferCoalescer:
+    """ Group commit for transfers to the same account within one process.
+
+    The first transfer to an account waits for the window, collects the
+    transfers that arrived meanwhile and applies them with one conditional
+    update. Every caller gets the balance after its own transfer.
+    """
+    def __init__(self, window):
+        self.window = window
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, customer_id, amount):
+        pending = PendingTransfer(amount)
+
+        with self._lock:
+            queue = self._queues.get(customer_id)
+            leader = queue is None
+            if leader:
+                queue = self._queues[customer_id] = []
+            queue.append(pending)
+
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                batch = self._queues.pop(customer_id)
+            self._apply(customer_id, batch)
+        else:
+            pending.done.wait()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.balance
+
+    @staticmethod
+    def _apply(customer_id, batch):
+        customer = apps.get_model('customer', 'Customer')
+        try:
+            balances = customer.objects.apply_transfers(customer_id, [pending.amount for pending in batch])
+            for pending, balance in zip(batch, balances):
+                pending.balance = balance
+        except Exception as exc:
+            for pending in batch:
+                pending.error = exc
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def transfer(customer_id, amount):
+    """ Apply a transfer, grouped with concurrent transfers to the same
+    account when settings.TRANSFER_COALESCING is enabled.
+
+    Args:
+        customer_id: str, Customer identifier.
+        amount: Decimal, Amount of the transfer.
+
+    Returns:
+        Decimal, Balance after the transfer, None if it would overdraw the account.
+    """
+    global _coalescer
+
+    config = get_config()
+    if not config['ENABLED']:
+        customer = apps.get_model('customer', 'Customer')
+        return customer.objects.apply_transfers(customer_id, [amount])[0]
+
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = TransferCoalescer(config['WINDOW_MS'] / 1000.0)
+
+    return _coalescer.submit(customer_id, amount)
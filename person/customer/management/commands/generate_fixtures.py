@@ -0,0 +1,63 @@
+import datetime
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from customer.models import Customer
+from person.util import fixtures
+
+COLUMNS = ('identifier', 'password', 'is_superuser', 'username', 'email',
+           'first_name', 'last_name', 'is_staff', 'is_active', 'creation_date',
+           'birth_year', 'occupation_type', 'balance', 'updated_at')
+
+
+class Command(BaseCommand):
+    help = 'Load synthetic customers for benchmarking. Run generate_fixtures ' \
+           'of the transaction service with the same options for matching transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--months', type=int, default=12)
+        parser.add_argument('--per-month', type=int, default=30,
+                            help='Average spending transactions per customer and month.')
+        parser.add_argument('--seed', default='fixtures')
+        parser.add_argument('--until', default=None,
+                            help='Last day of history (exclusive) as YYYY-MM-DD, defaults to today.')
+        parser.add_argument('--password', default='fixture-password',
+                            help='Password of every generated customer.')
+        parser.add_argument('--batch-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('generate_fixtures loads data with COPY and requires PostgreSQL.')
+
+        until = datetime.datetime.strptime(options['until'], '%Y-%m-%d').date() \
+            if options['until'] else datetime.date.today()
+
+        # Hashing is slow by design, every fixture customer shares one hash.
+        password = make_password(options['password'])
+        now = timezone.now()
+
+        def rows():
+            for customer in fixtures.customers(options['seed'], options['customers'],
+                                               options['months'], until):
+                balance = 0
+                for transaction in fixtures.transactions(options['seed'], customer, options['months'],
+                                                         options['per_month'], until):
+                    balance = transaction['balance_after']
+
+                yield (customer['identifier'], password, False, customer['username'],
+                       customer['email'], customer['first_name'], customer['last_name'],
+                       False, True, customer['creation_date'], customer['birth_year'],
+                       customer['occupation_type'], balance, now)
+
+        started = time.monotonic()
+        loaded = fixtures.copy_rows(connection, Customer._meta.db_table, COLUMNS, rows(),
+                                    options['batch_size'], skip_conflicts=True)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write('Loaded {} customers in {:.1f}s ({:.0f} rows/s).'
+                          .format(loaded, elapsed, loaded / elapsed if elapsed else 0))
@@ -0,0 +1,170 @@
+import csv
+import datetime
+import itertools
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from person.util.renderers import FastJSONRenderer
+
+# Exported customer fields. An explicit list, so credentials such as the
+# password hash never leave the service when fields are added to Customer.
+FIELDS = ('identifier', 'username', 'email', 'first_name', 'last_name',
+          'is_active', 'is_staff', 'creation_date', 'birth_year',
+          'occupation_type', 'balance', 'updated_at')
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/octet-stream',
+}
+
+CENTS = Decimal('100')
+
+DEFAULTS = {
+    # Seconds the watermark of an export trails its start, longer than any
+    # transaction updating customers may take to commit.
+    'WATERMARK_LAG': 300,
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **getattr(settings, 'CUSTOMER_EXPORT', {}))
+
+
+def watermark(started):
+    """ Time the next incremental export starts from.
+
+    updated_at is taken when a row is saved but becomes visible on commit,
+    a change saved just before the export started may commit after the
+    export read past it. Starting the next pull a lag earlier picks those
+    up, at the cost of exporting the changes of the lag twice.
+
+    Args:
+        started: datetime, Start of the export.
+
+    Returns:
+        datetime, Value for updated_since of the next export.
+    """
+    return started - datetime.timedelta(seconds=get_config()['WATERMARK_LAG'])
+
+
+def _pyarrow():
+    """ pyarrow is heavy, only import it when a parquet export is requested."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured('pyarrow is required for parquet exports.')
+    return pyarrow, pyarrow.parquet
+
+
+def rows(queryset, chunk_size):
+    """ Customer rows in identifier order, fetched through a server-side
+    cursor chunk_size rows at a time.
+
+    Args:
+        queryset: QuerySet, Customers to export.
+        chunk_size: int, Rows fetched per round trip.
+
+    Returns:
+        generator, Lists of at most chunk_size tuples of FIELDS.
+    """
+    values = queryset.order_by('identifier').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(itertools.islice(values, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson(chunks):
+    """ One JSON object per line, balances as strings to keep their precision."""
+    renderer = FastJSONRenderer()
+    for chunk in chunks:
+        yield b''.join(renderer.render(dict(zip(FIELDS, row), balance=str(row[10]))) + b'\n'
+                       for row in chunk)
+
+
+class EchoBuffer:
+    """ File-like object that hands back what is written, lets csv.writer
+    produce rows for a streaming response."""
+    def write(self, value):
+        return value
+
+
+def csv_rows(chunks):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(FIELDS)
+    for chunk in chunks:
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+class ChunkSink:
+    """ Write-only file handing over what was written since the last drain,
+    positions keep counting from the start of the file."""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet(chunks, compression='snappy'):
+    """ Stream customers as a parquet file, one row group per chunk.
+    Balances are stored as int64 cents.
+    """
+    pa, pq = _pyarrow()
+
+    schema = pa.schema([
+        pa.field('identifier', pa.string()),
+        pa.field('username', pa.string()),
+        pa.field('email', pa.string()),
+        pa.field('first_name', pa.string()),
+        pa.field('last_name', pa.string()),
+        pa.field('is_active', pa.bool_()),
+        pa.field('is_staff', pa.bool_()),
+        pa.field('creation_date', pa.date32()),
+        pa.field('birth_year', pa.int32()),
+        pa.field('occupation_type', pa.string()),
+        pa.field('balance', pa.int64()),
+        pa.field('updated_at', pa.timestamp('us')),
+    ])
+
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+
+    for chunk in chunks:
+        columns = list(zip(*chunk))
+        arrays = [pa.array(columns[index], type=schema[index].type) for index in range(10)]
+        arrays.append(pa.array([int(value * CENTS) for value in columns[10]], type=pa.int64()))
+        arrays.append(pa.array([timezone.make_naive(value, timezone.utc) for value in columns[11]],
+                               type=pa.timestamp('us')))
+
+        writer.write_table(pa.Table.from_arrays(arrays, names=list(FIELDS)))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,51 @@
+import logging
+import os
+
+import requests
+from requests.exceptions import RequestException
+
+from person.util import remote
+from .secret_constants import APIConsts
+
+logger = logging.getLogger(__name__)
+
+# Customer fields projected by the transaction service.
+PROJECTED_FIELDS = ('occupation_type', 'birth_year')
+
+
+def attributes(customer):
+    """ Customer attributes as projected by the transaction service."""
+    return {
+        'customer_id': customer.identifier,
+        'occupation_type': customer.occupation_type,
+        'birth_year': customer.birth_year,
+        'updated_at': customer.updated_at.isoformat(),
+    }
+
+
+def publish_attributes(customer):
+    """ Push customer attributes to the transaction service. Failures are
+    logged only, the sync_customers command of the transaction service
+    repairs missed changes.
+
+    Args:
+        customer: Customer, Created or updated customer.
+
+    Returns:
+        None
+    """
+    if APIConsts.TESTING.value:
+        return
+
+    url = os.path.join(APIConsts.TRANSACTION_API_ROOT.value, 'customer_attributes', '')
+
+    try:
+        response = remote.post(url=url, service='transaction', data=attributes(customer),
+                               token=APIConsts.SERVICE_TOKEN.value)
+    except RequestException as exc:
+        logger.warning('Failed to publish attributes of customer {}: {}'.format(customer.identifier, exc))
+        return
+
+    if response.status_code != requests.codes.ok:
+        logger.warning('Failed to publish attributes of customer {}, transaction service '
+                       'responded with {}.'.format(customer.identifier, response.status_code))
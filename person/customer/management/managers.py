@@ -2,9 +2,32 @@ import datetime
 
 from django.contrib.auth.base_user import BaseUserManager
 from django.core.exceptions import ValidationError
+from django.db.models import QuerySet
+from django.db.transaction import atomic, on_commit
+from django.utils import timezone
 
 
-class CustomerManager(BaseUserManager):
+class CustomerQuerySet(QuerySet):
+    def update(self, **kwargs):
+        """ Update the customers, dropping their cached principals when a
+        principal field changes. Bulk updates send no post_save.
+        """
+        from .authentication import PRINCIPAL_FIELDS, invalidate_principals
+
+        if not set(kwargs) & set(PRINCIPAL_FIELDS):
+            return super().update(**kwargs)
+
+        with atomic():
+            user_ids = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            invalidate_principals(user_ids)
+            # Again once committed, a request may cache the old row meanwhile.
+            on_commit(lambda: invalidate_principals(user_ids))
+
+        return rows
+
+
+class CustomerManager(BaseUserManager.from_queryset(CustomerQuerySet)):
     def create(self, username, email,
                first_name, last_name, birth_year,
                password, occupation_type=None, **kwargs):
@@ -62,3 +85,44 @@ class CustomerManager(BaseUserManager):
         self.create(username=username, email=email, first_name=first_name,
                     last_name=last_name, birth_year=birth_year, occupation_type=occupation_type,
                     password=password, **kwargs)
+
+    def apply_transfers(self, customer_id, amounts, attempts=3):
+        """ Apply transfers to one account in order with a single conditional
+        update, a transfer that would overdraw the account is skipped.
+
+        Args:
+            customer_id: str, Customer identifier.
+            amounts: list, Decimal amounts of the transfers.
+            attempts: int, Optimistic attempts before locking the row.
+
+        Returns:
+            list, Balance after each transfer, None for skipped transfers.
+        """
+        def apply(original):
+            balance = original
+            balances = []
+            for amount in amounts:
+                if balance + amount < 0:
+                    balances.append(None)
+                else:
+                    balance += amount
+                    balances.append(balance)
+            return balance, balances
+
+        for _ in range(attempts):
+            original = self.filter(identifier=customer_id).values_list('balance', flat=True).get()
+            balance, balances = apply(original)
+
+            if balance == original or \
+                    self.filter(identifier=customer_id, balance=original) \
+                        .update(balance=balance, updated_at=timezone.now()):
+                return balances
+
+        # The account kept changing underneath, lock it instead.
+        with atomic():
+            original = self.select_for_update().filter(identifier=customer_id) \
+                .values_list('balance', flat=True).get()
+            balance, balances = apply(original)
+            self.filter(identifier=customer_id).update(balance=balance, updated_at=timezone.now())
+
+        return balances
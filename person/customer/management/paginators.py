@@ -2,5 +2,5 @@ from rest_framework.pagination import CursorPagination
 
 
 class CustomerPaginator(CursorPagination):
-    ordering = 'last_name'
+    ordering = ('last_name', 'identifier')
     page_size = 10
@@ -0,0 +1,44 @@
+""" Case-insensitive prefix search on customer usernames and emails.
+
+Django 2.0 models can not declare expression indexes, so the indexes on
+the upper-cased fields are created after migrations run. Django compiles
+istartswith to UPPER(field::text) LIKE UPPER(%s) on PostgreSQL, which is
+the indexed expression.
+"""
+from django.db.models import Q
+
+from customer.models import Customer
+
+# Fields matched regardless of case, each has its own index.
+FIELDS = ('username', 'email')
+
+
+def prefix(field, query):
+    """ Match the customers whose field starts with query, in any case.
+
+    Args:
+        field: str, One of FIELDS.
+        query: str, Prefix to match.
+
+    Returns:
+        Q, Filter on the indexed expression.
+    """
+    return Q(**{'{}__istartswith'.format(field): query})
+
+
+def index_name(field):
+    return 'customer_{}_upper_like'.format(field)
+
+
+def ensure_indexes(connection):
+    """ Create the upper-cased pattern indexes prefix filters use."""
+    if connection.vendor != 'postgresql':
+        return
+
+    table = Customer._meta.db_table
+    quote = connection.ops.quote_name
+
+    with connection.cursor() as cursor:
+        for field in FIELDS:
+            cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} ((UPPER({}::text)) text_pattern_ops)'
+                           .format(quote(index_name(field)), quote(table), quote(field)))
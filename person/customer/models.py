@@ -29,10 +29,12 @@ class Customer(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True, null=False,
                               blank=False)
     password = models.CharField(null=False, blank=False, max_length=100)
+    # Indexed CharFields also get a pattern_ops index on Postgres,
+    # which serves the prefix lookups of autocomplete.
     first_name = models.CharField(max_length=30, null=False,
-                                  blank=False)
+                                  blank=False, db_index=True)
     last_name = models.CharField(max_length=30, null=False,
-                                 blank=False)
+                                 blank=False, db_index=True)
 
     is_superuser = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
@@ -46,10 +48,17 @@ class Customer(AbstractBaseUser, PermissionsMixin):
     balance = models.DecimalField(null=False, default=0,
                                   max_digits=32, decimal_places=2)
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     objects = CustomerManager()
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name', 'birth_year']
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_name', 'identifier'], name='customer_name_identifier'),
+        ]
+
     def __str__(self):
         return self.username
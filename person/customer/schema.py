@@ -0,0 +1,134 @@
+import logging
+
+import graphene
+import requests
+from graphene_django import DjangoObjectType
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from person.util import remote
+from .management.secret_constants import APIConsts
+from .models import Customer
+
+logger = logging.getLogger(__name__)
+
+TRANSACTIONS_QUERY = '''
+query ($ids: [ID]!, $first: Int) {
+  customers(ids: $ids) {
+    customer_id: customerId
+    summary {
+      total_spending: totalSpending
+      total_income: totalIncome
+      transaction_count: transactionCount
+      spending { name total count }
+      transfer_methods: transferMethods { name total count }
+    }
+    transactions(first: $first) {
+      identifier
+      amount
+      balance_after: balanceAfter
+      category
+      transfer_method: transferMethod
+      transfer_time: transferTime
+    }
+  }
+}
+'''
+
+
+class CategoryTotal(graphene.ObjectType):
+    name = graphene.String()
+    total = graphene.Float()
+    count = graphene.Int()
+
+
+class Summary(graphene.ObjectType):
+    total_spending = graphene.Float()
+    total_income = graphene.Float()
+    transaction_count = graphene.Int()
+    spending = graphene.List(CategoryTotal)
+    transfer_methods = graphene.List(CategoryTotal)
+
+
+class TransactionType(graphene.ObjectType):
+    identifier = graphene.ID()
+    amount = graphene.Float()
+    balance_after = graphene.Float()
+    category = graphene.String()
+    transfer_method = graphene.String()
+    transfer_time = graphene.String()
+
+
+class TransactionInfoLoader(DataLoader):
+    """ Transactions and summaries of many customers with one call to the
+    transaction service."""
+    def __init__(self, first):
+        super().__init__()
+        self.first = first
+
+    def batch_load_fn(self, keys):
+        if APIConsts.TESTING.value:
+            return Promise.resolve([{'summary': None, 'transactions': []} for _ in keys])
+
+        response = remote.post(url=APIConsts.TRANSACTION_GRAPHQL_URL.value, service='transaction',
+                               token=APIConsts.SERVICE_TOKEN.value,
+                               json={'query': TRANSACTIONS_QUERY,
+                                     'variables': {'ids': list(keys), 'first': self.first}})
+
+        if response.status_code != requests.codes.ok:
+            logger.warning('Transaction service responded with {}.'.format(response.status_code))
+            return Promise.reject(Exception('Transaction information is unavailable.'))
+
+        customers = {customer['customer_id']: customer
+                     for customer in remote.payload(response)['data']['customers']}
+
+        return Promise.resolve([customers.get(key, {'summary': None, 'transactions': []})
+                                for key in keys])
+
+
+def _summary(summary):
+    if summary is None:
+        return None
+    return Summary(total_spending=summary['total_spending'],
+                   total_income=summary['total_income'],
+                   transaction_count=summary['transaction_count'],
+                   spending=[CategoryTotal(**item) for item in summary['spending']],
+                   transfer_methods=[CategoryTotal(**item) for item in summary['transfer_methods']])
+
+
+class CustomerType(DjangoObjectType):
+    transactions = graphene.List(TransactionType, first=graphene.Int(default_value=50))
+    summary = graphene.Field(Summary)
+
+    class Meta:
+        model = Customer
+        only_fields = ('identifier', 'username', 'email', 'first_name', 'last_name',
+                       'creation_date', 'birth_year', 'occupation_type', 'balance')
+
+    def resolve_transactions(self, info, first):
+        return info.context.loaders.get(TransactionInfoLoader, min(first, 500)).load(self.identifier) \
+            .then(lambda data: [TransactionType(**item) for item in data['transactions']])
+
+    def resolve_summary(self, info):
+        return info.context.loaders.get(TransactionInfoLoader, 50).load(self.identifier) \
+            .then(lambda data: _summary(data['summary']))
+
+
+class Query(graphene.ObjectType):
+    customers = graphene.List(CustomerType,
+                              identifiers=graphene.List(graphene.ID),
+                              usernames=graphene.List(graphene.String))
+
+    def resolve_customers(self, info, identifiers=None, usernames=None):
+        queryset = Customer.objects.all()
+        if identifiers is not None:
+            queryset = queryset.filter(identifier__in=identifiers)
+        if usernames is not None:
+            queryset = queryset.filter(username__in=usernames)
+
+        # Customers only see themselves, staff see everyone.
+        user = info.context.user
+        if not APIConsts.TESTING.value and not user.is_staff:
+            queryset = queryset.filter(identifier=user.identifier)
+
+        return queryset.order_by('last_name', 'identifier')[:500]
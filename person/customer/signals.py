@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import get_access_token_model
+
+from .management.authentication import invalidate_principal, invalidate_token
+from .management.feeds import PROJECTED_FIELDS, publish_attributes
+from .models import Customer
+
+
+@receiver(post_save, sender=Customer)
+def customer_saved(sender, instance, created, update_fields=None, **kwargs):
+    """ Publish projected attributes once the change is committed."""
+    if not created and update_fields is not None \
+            and not set(update_fields) & set(PROJECTED_FIELDS):
+        return
+
+    transaction.on_commit(lambda: publish_attributes(instance))
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_principal_changed(sender, instance, created=False, **kwargs):
+    """ Drop the cached principal so permission changes apply immediately."""
+    if not created:
+        invalidate_principal(instance.pk)
+
+
+@receiver(post_save, sender=get_access_token_model())
+@receiver(post_delete, sender=get_access_token_model())
+def access_token_changed(sender, instance, **kwargs):
+    """ Drop a cached token when it is revoked, refreshed or otherwise changed."""
+    invalidate_token(instance.token)
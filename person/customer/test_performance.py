@@ -0,0 +1,112 @@
+import datetime
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from person.util.testing import budget, fake_transport, live_constants
+from . import views
+from .management.secret_constants import APIConsts
+from .models import Customer
+
+TRANSACTION_API_ROOT = 'http://transaction.test/transactions/'
+
+# Every request is made against both data sizes, counts must not grow with the data.
+SIZES = (2, 12)
+
+
+class CustomerViewPerformanceTest(TestCase):
+    """ Most SQL queries and calls to the transaction service allowed per
+    CustomerView request, authentication with a cold token cache included."""
+    def setUp(self):
+        transport = fake_transport()
+        self.transport = transport.__enter__()
+        self.addCleanup(transport.__exit__, None, None, None)
+
+        constants = live_constants(APIConsts, [views], TRANSACTION_API_ROOT=TRANSACTION_API_ROOT)
+        constants.__enter__()
+        self.addCleanup(constants.__exit__, None, None, None)
+
+        self.transport.add('POST', r'/info/$', {'total_spending': '0.00', 'total_income': '0.00'})
+
+        Customer.objects.create_superuser(username='admin', email='admin@fake.com',
+                                          first_name='admin', last_name='admin',
+                                          birth_year=1970, password='admin_secret')
+        admin = Customer.objects.get(username='admin')
+        AccessToken.objects.create(user=admin, token='admin-token', scope='read write',
+                                   expires=timezone.now() + datetime.timedelta(hours=1))
+
+    @staticmethod
+    def seed(size):
+        Customer.objects.filter(is_staff=False).delete()
+        Customer.objects.bulk_create([
+            Customer(identifier=str(1000 + number), username='customer{}'.format(number),
+                     email='customer{}@fake.com'.format(number), password='!',
+                     first_name='John', last_name='Smith', birth_year=1980, balance=100)
+            for number in range(size)])
+
+    def assertBudget(self, method, path, queries, calls, data=None):
+        usages = []
+        for size in SIZES:
+            self.seed(size)
+            cache.clear()
+            customer = Customer.objects.filter(is_staff=False).order_by('identifier').first()
+
+            with budget(self, queries, calls, self.transport) as usage:
+                request = getattr(self.client, method)
+                url = path.format(identifier=customer.identifier)
+                kwargs = {'HTTP_AUTHORIZATION': 'Bearer admin-token'}
+                if data is not None:
+                    response = request(url, dict(data, customer_id=customer.identifier), **kwargs)
+                else:
+                    response = request(url, **kwargs)
+
+            self.assertLess(response.status_code, 500)
+            usages.append(usage)
+
+        self.assertEqual(usages[0], usages[-1], 'Queries or calls grow with the data.')
+
+    def test_list(self):
+        self.assertBudget('get', '/customers/', queries=2, calls=0)
+
+    def test_create(self):
+        self.assertBudget('post', '/customers/', queries=9, calls=0,
+                          data={'username': 'jim123', 'email': 'jim123@fake.com', 'first_name': 'jim',
+                                'last_name': 'smith', 'birth_year': 1976, 'occupation_type': 'MISC',
+                                'password': 'jim_secret'})
+
+    def test_retrieve(self):
+        self.assertBudget('get', '/customers/{identifier}/', queries=2, calls=1)
+
+    def test_basic(self):
+        self.assertBudget('get', '/customers/{identifier}/basic/', queries=2, calls=0)
+
+    def test_autocomplete(self):
+        self.assertBudget('get', '/customers/autocomplete/?q=Smi', queries=2, calls=0)
+
+    def test_attributes(self):
+        self.assertBudget('get', '/customers/attributes/', queries=2, calls=0)
+
+    def test_transfer(self):
+        self.assertBudget('post', '/customers/transfer/', queries=3, calls=0,
+                          data={'amount': '-1.00'})
+
+    def test_verify(self):
+        self.assertBudget('get', '/customers/{identifier}/verify/', queries=1, calls=0)
+
+    def test_verify_admin(self):
+        self.assertBudget('get', '/customers/verify_admin/', queries=1, calls=0)
+
+    def test_id(self):
+        self.assertBudget('post', '/customers/id/', queries=2, calls=0,
+                          data={'username': 'customer0'})
+
+    def test_self(self):
+        self.assertBudget('get', '/customers/self/?username=customer0', queries=2, calls=1)
+
+    def test_partial_update(self):
+        self.assertBudget('patch', '/customers/{identifier}/', queries=3, calls=0)
+
+    def test_destroy(self):
+        self.assertBudget('delete', '/customers/{identifier}/', queries=12, calls=0)
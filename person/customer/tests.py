@@ -1,7 +1,18 @@
+import json
 import os
+from datetime import timedelta
 from decimal import Decimal
 
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from rest_framework.request import Request
+
+from person.util import boot, instrumentation
+
+from .management import exports
+from .management.authentication import CachedOAuth2Authentication, token_key
 from .models import Customer
 
 
@@ -52,3 +63,98 @@ class CustomerTest(TestCase):
 
         self.assertEqual(customer.balance, Decimal('249.01'))
         self.assertEqual(response.status_code, 200)
+
+    def test_apply_transfers(self):
+        customer_id = Customer.objects.get(username='john123').identifier
+
+        balances = Customer.objects.apply_transfers(customer_id, [Decimal('-200'),
+                                                                  Decimal('-200'),
+                                                                  Decimal('50')])
+
+        self.assertEqual(balances, [Decimal('100'), None, Decimal('150')])
+        self.assertEqual(Customer.objects.get(identifier=customer_id).balance, Decimal('150'))
+
+    def test_autocomplete(self):
+        response = self.client.get(path='/customers/autocomplete/',
+                                   data={'q': 'smi', 'field': 'name'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([customer['username'] for customer in response.data['results']],
+                         ['john123'])
+
+        response = self.client.get(path='/customers/autocomplete/',
+                                   data={'q': 'JOHN', 'field': 'username'})
+        self.assertEqual([customer['username'] for customer in response.data['results']],
+                         ['john123'])
+
+    def test_cached_authentication(self):
+        customer = Customer.objects.get(username='john123')
+        access_token = AccessToken.objects.create(user=customer, token='john-token', scope='read write',
+                                                  expires=timezone.now() + timedelta(hours=1))
+        request = Request(RequestFactory().get('/customers/', HTTP_AUTHORIZATION='Bearer john-token'))
+        authentication = CachedOAuth2Authentication()
+
+        user, _ = authentication.authenticate(request)
+        self.assertEqual(user.identifier, customer.identifier)
+        self.assertIsNotNone(cache.get(token_key('john-token')))
+
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate(request)
+            self.assertEqual((user.username, user.is_staff), ('john123', False))
+
+        customer.is_staff = True
+        customer.save()
+        user, _ = authentication.authenticate(request)
+        self.assertTrue(user.is_staff)
+
+        Customer.objects.filter(pk=customer.pk).update(is_staff=False)
+        user, _ = authentication.authenticate(request)
+        self.assertFalse(user.is_staff)
+
+        access_token.delete()
+        self.assertIsNone(cache.get(token_key('john-token')))
+        self.assertIsNone(authentication.authenticate(request))
+
+    def test_export(self):
+        response = self.client.get('/customers/export/')
+        customers = [json.loads(line.decode('utf-8'))
+                     for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual([customer['username'] for customer in customers], ['john123'])
+        self.assertNotIn('password', customers[0])
+
+        # Changes within the lag of the watermark are exported again.
+        watermark = response['X-Export-Watermark']
+        response = self.client.get('/customers/export/', {'output': 'csv', 'updated_since': watermark})
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8').splitlines()), 2)
+
+        with override_settings(CUSTOMER_EXPORT={'WATERMARK_LAG': 0}):
+            response = self.client.get('/customers/export/')
+        response = self.client.get('/customers/export/', {'output': 'csv',
+                                                          'updated_since': response['X-Export-Watermark']})
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8').splitlines(),
+                         [','.join(exports.FIELDS)])
+
+
+class SlowQueryTest(TestCase):
+    def tearDown(self):
+        instrumentation.slow_queries.clear()
+
+    @override_settings(SLOW_QUERIES={'THRESHOLD_MS': 0, 'EXPLAIN_SAMPLE': 0})
+    def test_capture(self):
+        with instrumentation.capture(instrumentation.QueryRecorder('CustomerView.list')):
+            Customer.objects.count()
+            Customer.objects.count()
+
+        response = self.client.get('/customers/slow_queries/', {'order': 'count'})
+        self.assertEqual(response.data['results'][0]['count'], 2)
+        self.assertEqual(response.data['results'][0]['actions'], {'CustomerView.list': 2})
+
+
+class BootTest(TestCase):
+    def test_lean_boot(self):
+        times = boot.import_times(['person.wsgi', 'person.urls'], {'LEAN_BOOT': 'True'})
+
+        self.assertIn('person.urls', times)
+        self.assertNotIn('django.contrib.admin.sites', times)
+        self.assertNotIn('rest_framework.documentation', times)
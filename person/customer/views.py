@@ -1,30 +1,71 @@
+import hmac
 import os
 from decimal import Decimal
 
 import requests
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import ModelViewSet
 
+from person.util import instrumentation, remote
+from person.util.graph import LoaderGraphQLView
 from . import serializers
+from .management import coalescing, exports, feeds, search
 from .management.paginators import CustomerPaginator
 from .management.permissions import IsSelfOrAdmin
 from .management.secret_constants import APIConsts
 from .models import Customer
 
 
+class CustomerGraphQLView(LoaderGraphQLView):
+    """ GraphQL endpoint over customers, authenticated like the REST API."""
+    throttle_scope = 'graphql'
+
+    def parse_body(self, request):
+        if isinstance(request, Request):
+            return request.data
+        return super().parse_body(request)
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        if APIConsts.TESTING.value:
+            view = permission_classes([permissions.AllowAny])(view)
+        else:
+            view = permission_classes([permissions.IsAuthenticated])(view)
+        view = authentication_classes(api_settings.DEFAULT_AUTHENTICATION_CLASSES)(view)
+        view = api_view(['GET', 'POST'])(view)
+        view.cls.throttle_scope = cls.throttle_scope
+        return view
+
+
 class CustomerView(ModelViewSet):
     queryset = Customer.objects.all()
     pagination_class = CustomerPaginator
     filter_backends = [OrderingFilter, DjangoFilterBackend, SearchFilter]
 
-    ordering = ['last_name', '-creation_date', ]
+    ordering = ['last_name', 'identifier', ]
     search_fields = ['=username', '=email', ]
 
+    def get_throttles(self):
+        """ The transaction service calls with the service token on behalf of many clients,
+        it is not throttled like one."""
+        token = APIConsts.SERVICE_TOKEN.value
+        authorization = self.request.META.get('HTTP_AUTHORIZATION') or ''
+        if token and hmac.compare_digest(authorization, token):
+            return []
+        return super().get_throttles()
+
     def get_serializer_class(self):
         serializer_assignment = {
             'retrieve': serializers.CustomerRetrievalSerializer,
@@ -46,6 +87,11 @@ class CustomerView(ModelViewSet):
         elif self.action == 'list' or \
                 self.action == 'verify_admin' or \
                 self.action == 'basic' or \
+                self.action == 'attributes' or \
+                self.action == 'autocomplete' or \
+                self.action == 'dependencies' or \
+                self.action == 'export' or \
+                self.action == 'slow_queries' or \
                 self.action == 'transfer':
             permission_classes = [permissions.IsAdminUser]
         else:
@@ -83,16 +129,15 @@ class CustomerView(ModelViewSet):
 
         token = request.META.get('HTTP_AUTHORIZATION')
         data = {'customer_id': customer_id}
-        headers = {'Authorization': token}
         url = os.path.join(APIConsts.TRANSACTION_API_ROOT.value, 'info', '')
 
-        response = requests.post(url=url, data=data, headers=headers)
+        response = remote.post(url=url, service='transaction', data=data, token=token)
 
         if response.status_code != requests.codes.ok:
             return Response(response,
                             status=response.status_code)
 
-        transactions_data = response.json()
+        transactions_data = remote.payload(response)
         customer_data['transaction_info'] = transactions_data
 
         return Response(customer_data)
@@ -105,22 +150,130 @@ class CustomerView(ModelViewSet):
             'occupation_type': customer.occupation_type,
             'birth_year': customer.birth_year,
             'customer_id': customer.identifier,
+            'balance': str(customer.balance),
         })
 
+    @action(methods=['get'], detail=False)
+    def autocomplete(self, request, *args, **kwargs):
+        """ Top matches for a username, email or name prefix in any case, ordered
+        by last name and identifier. Pass the last match as after=<last_name>|<identifier>
+        to get the following matches."""
+        query = request.query_params.get('q', '').strip()
+        field = request.query_params.get('field', 'name')
+
+        if len(query) < 2:
+            return Response({'error': 'Query must have at least 2 characters.'}, status=400)
+
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+
+        if field in search.FIELDS:
+            match = search.prefix(field, query)
+        elif field == 'name':
+            # Names are stored capitalized by CustomerManager.
+            terms = [term.lower().capitalize() for term in query.split()]
+            if len(terms) > 1:
+                match = Q(first_name__startswith=terms[0]) & Q(last_name__startswith=terms[-1])
+            else:
+                match = Q(first_name__startswith=terms[0]) | Q(last_name__startswith=terms[0])
+        else:
+            return Response({'error': 'field must be username, email or name.'}, status=400)
+
+        customers = self.get_queryset().filter(match)
+
+        after = request.query_params.get('after')
+        if after:
+            last_name, _, identifier = after.partition('|')
+            customers = customers.filter(Q(last_name__gt=last_name) |
+                                         Q(last_name=last_name, identifier__gt=identifier))
+
+        customers = customers.order_by('last_name', 'identifier')[:limit]
+        return Response({'results': serializers.CustomerSerializer(customers, many=True).data})
+
+    @action(methods=['get'], detail=False)
+    def attributes(self, request, *args, **kwargs):
+        """ List projected customer attributes in identifier order,
+        used by the transaction service to resync its projection."""
+        after = request.query_params.get('after', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 1000)), 10000)
+        except ValueError:
+            limit = 1000
+
+        customers = self.get_queryset() \
+            .filter(identifier__gt=after) \
+            .order_by('identifier') \
+            .only('identifier', *feeds.PROJECTED_FIELDS, 'updated_at')[:limit]
+
+        return Response({'results': [feeds.attributes(customer) for customer in customers]})
+
+    @action(methods=['get'], detail=False)
+    def export(self, request, *args, **kwargs):
+        """ Stream every customer in identifier order as output=ndjson, csv or
+        parquet. Pass the X-Export-Watermark of the previous export as
+        updated_since=<ISO time> to pull only customers changed since then,
+        and after=<identifier> to resume an interrupted export."""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in exports.FORMATS:
+            return Response({'error': 'output must be ndjson, csv or parquet.'}, status=400)
+
+        customers = self.get_queryset()
+
+        updated_since = request.query_params.get('updated_since')
+        if updated_since is not None:
+            try:
+                updated_since = parse_datetime(updated_since)
+            except ValueError:
+                updated_since = None
+            if updated_since is None:
+                return Response({'error': 'updated_since must be an ISO 8601 time.'}, status=400)
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since, timezone.utc)
+            customers = customers.filter(updated_at__gte=updated_since)
+
+        after = request.query_params.get('after')
+        if after:
+            customers = customers.filter(identifier__gt=after)
+
+        try:
+            chunk_size = min(int(request.query_params.get('chunk_size', 2000)), 10000)
+        except ValueError:
+            return Response({'error': 'Invalid chunk_size.'}, status=400)
+
+        # Changes made while the export runs are picked up by the next pull from the watermark.
+        started = timezone.now()
+        chunks = exports.rows(customers, max(1, chunk_size))
+
+        if output == 'ndjson':
+            content = exports.ndjson(chunks)
+        elif output == 'csv':
+            content = exports.csv_rows(chunks)
+        else:
+            content = exports.parquet(chunks)
+
+        response = StreamingHttpResponse(content, content_type=exports.FORMATS[output])
+        response['Content-Disposition'] = 'attachment; filename="customers.{}"'.format(output)
+        response['X-Export-Watermark'] = exports.watermark(started).isoformat()
+
+        return response
+
     @action(methods=['post'], detail=False)
     def transfer(self, request, *args, **kwargs):
         """ Make a transfer and update customer account balance."""
         amount = Decimal(request.data.get('amount'))
         customer_id = request.data.get('customer_id')
-        customer = self.queryset.get(identifier=customer_id)
 
-        balance = customer.balance + amount
-        if balance < 0:
+        try:
+            balance = coalescing.transfer(customer_id, amount)
+        except Customer.DoesNotExist:
+            return Response({'error': 'User not found'}, status=404)
+
+        if balance is None:
             return Response({'error': 'Account overdrawn.'}, status=400)
 
-        customer.balance = balance
-        customer.save()
-        return Response({'message': 'Account balance updated.', 'balance': customer.balance}, status=200)
+        return Response({'message': 'Account balance updated.', 'balance': balance}, status=200)
 
     @action(methods=['get'], detail=True)
     def verify(self, request, *args, **kwargs):
@@ -132,6 +285,32 @@ class CustomerView(ModelViewSet):
         """ Verify that a credential represents admin."""
         return Response({'message': 'Token verified.'}, status=200)
 
+    @action(methods=['get', 'delete'], detail=False)
+    def slow_queries(self, request, *args, **kwargs):
+        """ Slowest queries recorded by this process, DELETE starts over."""
+        if request.method == 'DELETE':
+            instrumentation.slow_queries.clear()
+            return Response({'message': 'Slow queries cleared.'})
+
+        order = request.query_params.get('order', 'total_ms')
+        if order not in ('total_ms', 'max_ms', 'count'):
+            return Response({'error': 'Order by total_ms, max_ms or count.'}, status=400)
+
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'Invalid limit.'}, status=400)
+
+        config = instrumentation.get_config()
+        return Response({'enabled': config['ENABLED'],
+                         'threshold_ms': config['THRESHOLD_MS'],
+                         'results': instrumentation.slow_queries.top(limit, order)})
+
+    @action(methods=['get'], detail=False)
+    def dependencies(self, request, *args, **kwargs):
+        """ Call counters and circuit state of the services this process calls."""
+        return Response({'results': remote.metrics()})
+
     @action(methods=['post'], detail=False)
     def id(self, request, *args, **kwargs):
         """ Get user id."""
@@ -158,16 +337,15 @@ class CustomerView(ModelViewSet):
 
         token = request.META.get('HTTP_AUTHORIZATION')
         data = {'customer_id': customer_id}
-        headers = {'Authorization': token}
         url = os.path.join(APIConsts.TRANSACTION_API_ROOT.value, 'info', '')
 
-        response = requests.post(url=url, data=data, headers=headers)
+        response = remote.post(url=url, service='transaction', data=data, token=token)
 
         if response.status_code != requests.codes.ok:
             return Response(response,
                             status=response.status_code)
 
-        transactions_data = response.json()
+        transactions_data = remote.payload(response)
         customer_data['transaction_info'] = transactions_data
 
         return Response(customer_data)
@@ -0,0 +1,10 @@
+import graphene
+
+import customer.schema
+
+
+class Query(customer.schema.Query, graphene.ObjectType):
+    pass
+
+
+schema = graphene.Schema(query=Query)
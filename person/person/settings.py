@@ -1,5 +1,3 @@
-import logging
-
 import environ
 
 BASE_DIR = environ.Path(__file__) - 2
@@ -8,9 +6,25 @@ env = environ.Env()
 env_file = str(BASE_DIR('.env'))
 env.read_env(env_file)
 
-logging.basicConfig(handlers=[logging.FileHandler(env('LOG_FILE'), 'w', 'utf-8')],
-                    level=env('LOG_LEVEL'),
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# The log file is opened on the first record instead of at import.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s'},
+    },
+    'handlers': {
+        'file': {
+            'class': 'logging.FileHandler',
+            'filename': env('LOG_FILE'),
+            'mode': 'w',
+            'encoding': 'utf-8',
+            'delay': True,
+            'formatter': 'default',
+        },
+    },
+    'root': {'handlers': ['file'], 'level': env('LOG_LEVEL')},
+}
 
 SECRET_KEY = env('SECRET_KEY')
 
@@ -18,8 +32,14 @@ DEBUG = env.bool('DEBUG')
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS')
 
-DJANGO_APPS = [
-    'django.contrib.admin',
+# Lean boot leaves out the admin and the API docs for faster worker starts,
+# either can still be turned on on its own.
+LEAN_BOOT = env.bool('LEAN_BOOT', default=False)
+ADMIN_ENABLED = env.bool('ADMIN_ENABLED', default=not LEAN_BOOT)
+API_DOCS = env.bool('API_DOCS', default=not LEAN_BOOT)
+
+DJANGO_APPS = ['django.contrib.admin'] if ADMIN_ENABLED else []
+DJANGO_APPS += [
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -36,20 +56,43 @@ THIRD_PARTY_APPS = [
     'storages',
     'oauth2_provider',
     'corsheaders',
+    'graphene_django',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS + THIRD_PARTY_APPS
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'customer.management.authentication.CachedOAuth2Authentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'person.util.renderers.FastJSONRenderer',
+        'person.util.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'person.util.parsers.FastJSONParser',
+        'person.util.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
+    'EXCEPTION_HANDLER': 'person.util.remote.exception_handler',
+    'DEFAULT_THROTTLE_CLASSES': (
+        'person.util.throttling.TokenBucketThrottle',
+    ),
+}
+
+GRAPHENE = {
+    'SCHEMA': 'person.schema.schema',
 }
 
 AUTH_USER_MODEL = 'customer.Customer'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'person.util.throttling.LoadSheddingMiddleware',
+    'person.util.compression.CompressionMiddleware',
+    'person.util.instrumentation.SlowQueryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,6 +103,71 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
 ]
 
+COMPRESSION = {
+    'GZIP_LEVEL': env.int('COMPRESSION_GZIP_LEVEL', default=6),
+    'ZSTD_LEVEL': env.int('COMPRESSION_ZSTD_LEVEL', default=3),
+    'MIN_SIZE': env.int('COMPRESSION_MIN_SIZE', default=1024),
+    'ENDPOINTS': [
+        {'PATH': r'^/customers/$'},
+        {'PATH': r'^/customers/self/$'},
+        {'PATH': r'^/customers/[0-9]+/$'},
+        {'PATH': r'^/customers/export/$', 'MIN_SIZE': 0},
+    ],
+}
+
+REMOTE_SERVICES = {
+    'transaction': {
+        'TIMEOUT': (env.float('REMOTE_CONNECT_TIMEOUT', default=1.0),
+                    env.float('REMOTE_READ_TIMEOUT', default=5.0)),
+        'FAILURE_THRESHOLD': env.int('REMOTE_FAILURE_THRESHOLD', default=5),
+        'RECOVERY_TIME': env.int('REMOTE_RECOVERY_TIME', default=30),
+        'MAX_CONCURRENCY': env.int('REMOTE_MAX_CONCURRENCY', default=20),
+    },
+}
+
+TRANSFER_COALESCING = {
+    'ENABLED': env.bool('TRANSFER_COALESCING', default=False),
+    'WINDOW_MS': env.int('TRANSFER_COALESCING_WINDOW_MS', default=5),
+}
+
+THROTTLING = {
+    'RATE': env.float('THROTTLE_RATE', default=10.0),
+    'BURST': env.int('THROTTLE_BURST', default=60),
+    'COSTS': {
+        'attributes': env.int('THROTTLE_EXPORT_COST', default=20),
+        'export': env.int('THROTTLE_EXPORT_COST', default=20),
+        'autocomplete': 2,
+        'graphql': 5,
+    },
+}
+
+LOAD_SHEDDING = {
+    'MAX_IN_FLIGHT': env.int('SHED_MAX_IN_FLIGHT', default=50),
+    'MAX_LATENCY_MS': env.int('SHED_MAX_LATENCY_MS', default=500),
+    'RETRY_AFTER': env.int('SHED_RETRY_AFTER', default=5),
+    'PATHS': [
+        r'^/customers/attributes/$',
+        r'^/customers/export/$',
+        r'^/customers/autocomplete/$',
+        r'^/graphql/$',
+    ],
+}
+
+CUSTOMER_EXPORT = {
+    'WATERMARK_LAG': env.int('EXPORT_WATERMARK_LAG', default=300),
+}
+
+SLOW_QUERIES = {
+    'ENABLED': env.bool('SLOW_QUERIES', default=False),
+    'THRESHOLD_MS': env.int('SLOW_QUERY_THRESHOLD_MS', default=200),
+    'EXPLAIN_SAMPLE': env.float('SLOW_QUERY_EXPLAIN_SAMPLE', default=0.1),
+}
+
+# Validated access tokens are cached until they expire, at most OAUTH2_TOKEN_CACHE_TTL seconds.
+OAUTH2_TOKEN_CACHE_TTL = env.int('OAUTH2_TOKEN_CACHE_TTL', default=3600)
+# Permission flags of the token user are cached at most OAUTH2_PRINCIPAL_CACHE_TTL seconds.
+OAUTH2_PRINCIPAL_CACHE_TTL = env.int('OAUTH2_PRINCIPAL_CACHE_TTL', default=60)
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
 
@@ -83,6 +191,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'person.wsgi.application'
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
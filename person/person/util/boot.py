@@ -0,0 +1,83 @@
+""" Lean worker boot helpers.
+
+Run as a script to check the import time of the WSGI application and the
+URLconf, which is loaded on the first request, against a budget:
+
+    python -m person.util.boot person.wsgi person.urls --budget 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from django.utils.module_loading import import_string
+
+
+class LazyView:
+    """ View imported and built on its first request, keeps rarely used
+    views and their dependencies out of worker boot.
+
+    Args:
+        path: str, Dotted path of the view factory.
+        *args, **kwargs: Passed to the factory.
+    """
+    def __init__(self, path, *args, **kwargs):
+        self.path = path
+        self.args = args
+        self.kwargs = kwargs
+        self._view = None
+
+    def __call__(self, request, *args, **kwargs):
+        if self._view is None:
+            self._view = import_string(self.path)(*self.args, **self.kwargs)
+        return self._view(request, *args, **kwargs)
+
+
+def import_times(modules, environ=None):
+    """ Import modules in a fresh interpreter with -X importtime.
+
+    Args:
+        modules: list, Dotted paths of the modules, imported in order.
+        environ: dict, Extra environment variables.
+
+    Returns:
+        dict, Cumulative import time in microseconds by module name.
+    """
+    code = '; '.join('import {}'.format(module) for module in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            env=dict(os.environ, **(environ or {})),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError('Importing {} failed:\n{}'.format(', '.join(modules), result.stderr))
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check module import time against a budget.')
+    parser.add_argument('modules', nargs='+')
+    parser.add_argument('--budget', type=int, required=True, help='Budget in milliseconds.')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list.')
+    options = parser.parse_args()
+
+    times = import_times(options.modules, {'LEAN_BOOT': 'True'})
+    # Cumulative times of later modules only count what earlier ones did not import.
+    total = sum(times.get(module, 0) for module in options.modules) / 1000
+
+    for name, cumulative in sorted(times.items(), key=lambda item: -item[1])[:options.top]:
+        print('{:10.1f} ms  {}'.format(cumulative / 1000, name))
+    print('{}: {:.1f} ms of {} ms budget'.format(', '.join(options.modules), total, options.budget))
+
+    sys.exit(0 if total <= options.budget else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+""" Deterministic synthetic data shared by the generate_fixtures commands
+of both services. The same seed and end date yield the same customers and
+transactions on both sides, so customer balances match the balance_after
+of their last transaction.
+"""
+import calendar
+import csv
+import datetime
+import io
+import random
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db.transaction import atomic
+
+from .auxiliary import START_TIME
+
+OCCUPATIONS = [
+    ('MANAGERIAL', 10), ('PROFESSIONAL', 22), ('CLERICAL', 14),
+    ('TECHNICAL', 16), ('SERVICE', 18), ('AGRICULTURAL', 3),
+    ('ELEMENTARY', 9), ('MILITARY', 2), ('MISC', 6),
+]
+
+TRANSFER_METHODS = [
+    ('CARD', 55), ('ONLINE', 25), ('ATM', 8),
+    ('WIRE', 5), ('CHECK', 5), ('MONEY_ORDER', 2),
+]
+
+# Category, weight and the median and spread of a log-normal amount.
+SPENDING_CATEGORIES = [
+    ('GROCERIES', 30, 45, 0.6),
+    ('DINING', 22, 25, 0.7),
+    ('UTILITIES', 8, 90, 0.4),
+    ('ENTERTAINMENT', 12, 30, 0.9),
+    ('TRAVEL', 4, 350, 0.9),
+    ('MEDICAL', 4, 120, 1.0),
+    ('MISC', 20, 35, 1.1),
+]
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael',
+               'Linda', 'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan',
+               'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen']
+
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+              'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
+              'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin']
+
+CENT = Decimal('0.01')
+
+
+def _choice(rng, weighted):
+    return rng.choices([item[0] for item in weighted],
+                       weights=[item[1] for item in weighted])[0]
+
+
+def _make_id(timestamp, rng):
+    return ((int(timestamp) - START_TIME) << 23) | rng.getrandbits(23)
+
+
+def _month_starts(months, today):
+    first = datetime.date(today.year, today.month, 1)
+    for offset in range(months - 1, -1, -1):
+        yield first - relativedelta(months=offset)
+
+
+def _midnight(date):
+    return datetime.datetime(date.year, date.month, date.day, tzinfo=datetime.timezone.utc)
+
+
+def customers(seed, count, months, until):
+    """ Generate customers.
+
+    Args:
+        seed: str, Seed of the data set.
+        count: int, Number of customers.
+        months: int, Number of months of history, customers are created before it.
+        until: datetime.date, Last day of history, exclusive.
+
+    Returns:
+        generator, Customer dicts.
+    """
+    rng = random.Random('{}:customers'.format(seed))
+    history_start = _midnight(until) - datetime.timedelta(days=31 * months)
+    seen = set()
+
+    for index in range(count):
+        created = history_start - datetime.timedelta(days=rng.randint(1, 3650))
+
+        identifier = _make_id(created.timestamp(), rng)
+        while identifier in seen:
+            identifier = _make_id(created.timestamp(), rng)
+        seen.add(identifier)
+
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        birth_year = min(max(int(rng.gauss(1978, 14)), created.year - 90), created.year - 18)
+
+        yield {
+            'identifier': str(identifier),
+            'username': 'fixture{}'.format(index),
+            'email': 'fixture{}@example.com'.format(index),
+            'first_name': first_name,
+            'last_name': last_name,
+            'birth_year': birth_year,
+            'occupation_type': _choice(rng, OCCUPATIONS),
+            'creation_date': created.date(),
+            'salary': Decimal(rng.lognormvariate(8.0, 0.5)).quantize(CENT),
+        }
+
+
+def transactions(seed, customer, months, per_month, until):
+    """ Generate the transactions of one customer, oldest first. Income is
+    paid on the first and fifteenth of every month, spending is spread
+    over the month and never overdraws the account.
+
+    Args:
+        seed: str, Seed of the data set.
+        customer: dict, Customer generated by customers.
+        months: int, Number of months of history, the current month included.
+        per_month: int, Average number of spending transactions per month.
+        until: datetime.date, Last day of history, exclusive.
+
+    Returns:
+        generator, Transaction dicts.
+    """
+    rng = random.Random('{}:transactions:{}'.format(seed, customer['identifier']))
+    now = _midnight(until)
+    balance = Decimal('0')
+
+    for month_start in _month_starts(months, until):
+        days = calendar.monthrange(month_start.year, month_start.month)[1]
+        start = _midnight(month_start)
+        end = min(start + datetime.timedelta(days=days), now)
+
+        events = [(start + datetime.timedelta(days=payday, hours=9, seconds=rng.randint(0, 28800)), None)
+                  for payday in (0, 14) if start + datetime.timedelta(days=payday) < end]
+        spending_count = max(0, int(rng.gauss(per_month, per_month / 4.0)))
+        events += [(start + (end - start) * rng.random(), _choice(rng, SPENDING_CATEGORIES))
+                   for _ in range(spending_count)]
+        events.sort(key=lambda event: event[0])
+
+        for transfer_time, category in events:
+            if category is None:
+                amount = (customer['salary'] / 2).quantize(CENT)
+                category = 'INCOME'
+                method = 'WIRE'
+            else:
+                median, spread = next((item[2], item[3]) for item in SPENDING_CATEGORIES
+                                      if item[0] == category)
+                amount = -Decimal(rng.lognormvariate(0, spread) * median).quantize(CENT)
+                method = _choice(rng, TRANSFER_METHODS)
+                if balance + amount < 0:
+                    continue
+
+            balance += amount
+            yield {
+                'identifier': _make_id(transfer_time.timestamp(), rng),
+                'customer_id': customer['identifier'],
+                'amount': amount,
+                'balance_after': balance,
+                'category': category,
+                'transfer_method': method,
+                'transfer_time': transfer_time,
+            }
+
+
+def copy_rows(connection, table, columns, rows, batch_size, skip_conflicts=False):
+    """ Load rows into a Postgres table with COPY.
+
+    Args:
+        connection: Django database connection.
+        table: str, Table name.
+        columns: list, Column names.
+        rows: iterable, Row tuples in column order.
+        batch_size: int, Rows sent per COPY statement.
+        skip_conflicts: bool, Copy through a staging table and drop rows whose
+            primary key already exists. Identifiers only have 23 random bits
+            per second, so large data sets may draw the same one twice.
+
+    Returns:
+        int, Number of rows loaded.
+    """
+    quoted_table = connection.ops.quote_name(table)
+    quoted_columns = ', '.join(connection.ops.quote_name(column) for column in columns)
+    loaded = 0
+
+    def flush(cursor, buffer):
+        buffer.seek(0)
+        if not skip_conflicts:
+            cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'
+                               .format(quoted_table, quoted_columns), buffer)
+            return cursor.rowcount
+
+        with atomic(using=connection.alias):
+            cursor.execute('CREATE TEMPORARY TABLE fixture_staging '
+                           '(LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP'.format(quoted_table))
+            cursor.copy_expert('COPY fixture_staging ({}) FROM STDIN WITH (FORMAT csv)'
+                               .format(quoted_columns), buffer)
+            cursor.execute('INSERT INTO {0} ({1}) SELECT {1} FROM fixture_staging '
+                           'ON CONFLICT DO NOTHING'.format(quoted_table, quoted_columns))
+            return cursor.rowcount
+
+    with connection.cursor() as cursor:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        pending = 0
+
+        for row in rows:
+            writer.writerow(row)
+            pending += 1
+
+            if pending == batch_size:
+                loaded += flush(cursor, buffer)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                pending = 0
+
+        if pending:
+            loaded += flush(cursor, buffer)
+
+    return loaded
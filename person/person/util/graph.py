@@ -0,0 +1,22 @@
+from graphene_django.views import GraphQLView
+
+
+class Loaders:
+    """ Per-request registry of DataLoaders, one loader per class and arguments
+    so every field resolved with the same arguments shares one batch."""
+    def __init__(self):
+        self._loaders = {}
+
+    def get(self, loader_class, *args):
+        key = (loader_class,) + args
+        if key not in self._loaders:
+            self._loaders[key] = loader_class(*args)
+        return self._loaders[key]
+
+
+class LoaderGraphQLView(GraphQLView):
+    """ GraphQL view that attaches fresh DataLoaders to the request context."""
+    def get_context(self, request):
+        context = super().get_context(request)
+        context.loaders = Loaders()
+        return context
@@ -0,0 +1,60 @@
+import decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+
+def encode_default(obj):
+    """ Fallback encoder for types the fast encoders do not handle natively,
+    follows the coercion of DRF's JSONEncoder."""
+    return JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ JSON renderer backed by orjson when installed, falls back to
+    DRF's JSONRenderer otherwise or when indented output is requested."""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(data, default=encode_default)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """ Compact binary renderer for service to service traffic.
+    Decimals are packed as strings to keep their precision."""
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        return encode_default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise ImproperlyConfigured('msgpack is required for MessagePackRenderer.')
+
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=self._default, use_bin_type=True)